@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the application modules import each other by module name (e.g. "import config"),
+# tests import them the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "upnp_scrobbler"))
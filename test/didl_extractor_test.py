@@ -0,0 +1,147 @@
+import timeit
+import xmltodict
+
+from xml.sax.saxutils import escape
+
+from didl_extractor import extract_didl_item, extract_transport_state
+
+DIDL_HEADER: str = ('<DIDL-Lite xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" '
+                    'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                    'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/">')
+
+didl_simple: str = (DIDL_HEADER +
+                    '<item id="1" parentID="0" restricted="1">'
+                    '<dc:title>Time</dc:title>'
+                    '<upnp:artist>Pink Floyd</upnp:artist>'
+                    '<upnp:album>The Dark Side of the Moon</upnp:album>'
+                    '<res duration="0:06:53.000" protocolInfo="http-get:*:audio/flac:*">http://x/1.flac</res>'
+                    '<upnp:class>object.item.audioItem.musicTrack</upnp:class>'
+                    '</item></DIDL-Lite>')
+
+didl_streaming: str = (DIDL_HEADER +
+                       '<item id="2" parentID="0" restricted="1">'
+                       '<dc:title>\n  Money &amp; More  \n</dc:title>'
+                       '<dc:subtitle>Remastered</dc:subtitle>'
+                       '<upnp:albumArtURI>' + ("http://art.example.com/cover?" + "x" * 4000) + '</upnp:albumArtURI>'
+                       '<upnp:artist>Pink Floyd</upnp:artist>'
+                       '<upnp:album>The Dark Side of the Moon</upnp:album>'
+                       '<res duration="0:06:22" protocolInfo="http-get:*:audio/flac:*">http://x/2.flac</res>'
+                       '<upnp:class>object.item.audioItem.musicTrack</upnp:class>'
+                       '</item></DIDL-Lite>')
+
+didl_no_duration: str = (DIDL_HEADER +
+                         '<item id="3" parentID="0" restricted="1">'
+                         '<dc:title>Radio</dc:title><dc:subtitle/>'
+                         '<res protocolInfo="http-get:*:audio/mpeg:*">http://x/stream.mp3</res>'
+                         '</item></DIDL-Lite>')
+
+didl_no_item: str = DIDL_HEADER + '</DIDL-Lite>'
+
+didl_many_res: str = (DIDL_HEADER +
+                      '<item id="4" parentID="0" restricted="1">'
+                      '<dc:title>Us and Them</dc:title>' +
+                      "".join(f'<res duration="0:07:49" protocolInfo="http-get:*:audio/x-{i}:*">http://x/{i}</res>'
+                              for i in range(20)) +
+                      '</item></DIDL-Lite>')
+
+didl_many_artists: str = (DIDL_HEADER +
+                          '<item id="5" parentID="0" restricted="1">'
+                          '<dc:title>Under Pressure</dc:title>'
+                          '<upnp:artist role="Performer">Queen</upnp:artist>'
+                          '<upnp:artist role="Performer">David Bowie</upnp:artist>'
+                          '<upnp:artist role="AlbumArtist">Queen</upnp:artist>'
+                          '<upnp:album/>'
+                          '<res duration="0:04:08">http://x/5.flac</res>'
+                          '</item></DIDL-Lite>')
+
+didl_many_items: str = (DIDL_HEADER +
+                        '<item id="6" parentID="0" restricted="1"><dc:title>One</dc:title></item>'
+                        '<item id="7" parentID="0" restricted="1"><dc:title>Two</dc:title></item>'
+                        '</DIDL-Lite>')
+
+didl_nested: str = (DIDL_HEADER +
+                    '<item id="8" parentID="0" restricted="1">'
+                    '<dc:title>Eclipse<b>live</b></dc:title>'
+                    '</item></DIDL-Lite>')
+
+last_change_playing: str = ('<Event xmlns="urn:schemas-upnp-org:metadata-1-0/AVT/"><InstanceID val="0">'
+                            '<TransportState val="PLAYING"/><CurrentTrackURI val="http://x/1.flac"/>'
+                            '<CurrentTrackMetaData val="' + escape(didl_streaming, {'"': "&quot;"}) + '"/>'
+                            '</InstanceID></Event>')
+
+last_change_no_state: str = ('<Event xmlns="urn:schemas-upnp-org:metadata-1-0/AVT/"><InstanceID val="0">'
+                             '<CurrentTrackDuration val="0:03:00"/></InstanceID></Event>')
+
+FIELD_KEYS: list[str] = ["dc:title", "dc:subtitle", "upnp:artist", "upnp:album", "res"]
+
+
+def select_fields(items: any) -> any:
+    """The fields read by metadata_to_new_current_song, items is a list when there are many items."""
+    if not isinstance(items, dict):
+        return items
+    return {k: items[k] for k in FIELD_KEYS if k in items}
+
+
+def fields_from_xmltodict(didl: str) -> any:
+    return select_fields(xmltodict.parse(didl)["DIDL-Lite"]["item"])
+
+
+def fields_from_extractor(didl: str) -> any:
+    return select_fields(extract_didl_item(didl))
+
+
+def transport_state_from_xmltodict(last_change: str) -> str:
+    lcd_dict: dict = xmltodict.parse(last_change)
+    try:
+        return lcd_dict["Event"]["InstanceID"]["TransportState"]["@val"]
+    except KeyError:
+        return None
+
+
+def test_same_fields():
+    didl: str
+    for didl in [didl_simple, didl_streaming, didl_no_duration, didl_many_res, didl_many_artists,
+                 didl_many_items, didl_nested]:
+        expected: dict[str, any] = fields_from_xmltodict(didl)
+        actual: dict[str, any] = fields_from_extractor(didl)
+        assert expected == actual, f"expected [{expected}] got [{actual}]"
+
+
+def test_repeated_elements():
+    assert len(fields_from_extractor(didl_many_res)["res"]) == 20
+    assert fields_from_extractor(didl_many_artists)["upnp:artist"][1] == {"@role": "Performer", "#text": "David Bowie"}
+    assert fields_from_extractor(didl_many_artists)["upnp:album"] is None
+
+
+def test_no_item():
+    assert extract_didl_item(didl_no_item) is None
+
+
+def test_transport_state():
+    assert extract_transport_state(last_change_playing) == "PLAYING"
+    assert extract_transport_state(last_change_playing) == transport_state_from_xmltodict(last_change_playing)
+    assert extract_transport_state(last_change_no_state) is None
+
+
+def benchmark(number: int = 20000):
+    didl: str
+    for name, didl in [("simple", didl_simple), ("streaming", didl_streaming), ("many_res", didl_many_res)]:
+        t_xmltodict: float = timeit.timeit(lambda: xmltodict.parse(didl), number=number)
+        t_extractor: float = timeit.timeit(lambda: extract_didl_item(didl), number=number)
+        print(f"didl [{name}] xmltodict [{t_xmltodict * 1e6 / number:.1f}] us "
+              f"extractor [{t_extractor * 1e6 / number:.1f}] us "
+              f"speedup [{t_xmltodict / t_extractor:.1f}x]")
+    t_xmltodict = timeit.timeit(lambda: transport_state_from_xmltodict(last_change_playing), number=number)
+    t_extractor = timeit.timeit(lambda: extract_transport_state(last_change_playing), number=number)
+    print(f"last_change xmltodict [{t_xmltodict * 1e6 / number:.1f}] us "
+          f"extractor [{t_extractor * 1e6 / number:.1f}] us "
+          f"speedup [{t_xmltodict / t_extractor:.1f}x]")
+
+
+if __name__ == "__main__":
+    test_same_fields()
+    test_repeated_elements()
+    test_no_item()
+    test_transport_state()
+    benchmark()
+    print("Everything passed")
@@ -0,0 +1,68 @@
+from event_filter import EventFilter, create_event_filter
+from event_name import EventName
+
+
+class Variable:
+
+    def __init__(self, name: str, value: any = None):
+        self.name: str = name
+        self.value: any = value
+
+
+def event(*names: str) -> list[Variable]:
+    return list(map(Variable, names))
+
+
+NEXT_URI: str = EventName.NEXT_AV_TRANSPORT_URI.value
+NEXT_URI_META: str = EventName.NEXT_AV_TRANSPORT_URI_META_DATA.value
+LAST_CHANGE: str = EventName.LAST_CHANGE.value
+TRACK_DURATION: str = EventName.CURRENT_TRACK_DURATION.value
+TRANSPORT_STATE: str = EventName.TRANSPORT_STATE.value
+RELATIVE_TIME: str = EventName.RELATIVE_TIME_POSITION.value
+
+
+def test_default_profile_matches_baseline():
+    event_filter: EventFilter = create_event_filter(manufacturer="Acme", model_name="Renderer")
+    assert event_filter.profile == "default"
+    # the three events the handler always dropped
+    assert event_filter.ignores(event(NEXT_URI, NEXT_URI_META))
+    assert event_filter.ignores(event(LAST_CHANGE))
+    assert event_filter.ignores(event(TRACK_DURATION))
+    # anything else goes through, including other combinations of the same variables
+    assert not event_filter.ignores(event(NEXT_URI))
+    assert not event_filter.ignores(event(NEXT_URI_META))
+    assert not event_filter.ignores(event(LAST_CHANGE, TRACK_DURATION))
+    assert not event_filter.ignores(event(NEXT_URI, NEXT_URI_META, TRACK_DURATION))
+    assert not event_filter.ignores(event(TRANSPORT_STATE))
+    assert not event_filter.ignores(event(RELATIVE_TIME))
+    assert not event_filter.ignores(event())
+    assert event_filter.dropped == 3
+
+
+def test_position_profiles():
+    manufacturer: str
+    for manufacturer in ["WiiM", "upmpdcli"]:
+        event_filter: EventFilter = create_event_filter(manufacturer=manufacturer)
+        assert event_filter.profile == manufacturer.lower()
+        assert event_filter.ignores(event(RELATIVE_TIME))
+        assert event_filter.ignores(event(LAST_CHANGE, TRACK_DURATION))
+        assert event_filter.ignores(event(NEXT_URI))
+        assert not event_filter.ignores(event(RELATIVE_TIME, TRANSPORT_STATE))
+
+
+def test_accepted_overrides_ignored_sets():
+    event_filter: EventFilter = EventFilter(
+        profile="test",
+        ignored=frozenset([RELATIVE_TIME]),
+        accepted=frozenset([TRACK_DURATION, RELATIVE_TIME]),
+        ignored_sets=frozenset([frozenset([TRACK_DURATION]), frozenset([LAST_CHANGE])]))
+    assert not event_filter.ignores(event(TRACK_DURATION))
+    assert not event_filter.ignores(event(RELATIVE_TIME))
+    assert event_filter.ignores(event(LAST_CHANGE))
+
+
+if __name__ == "__main__":
+    test_default_profile_matches_baseline()
+    test_position_profiles()
+    test_accepted_overrides_ignored_sets()
+    print("Everything passed")
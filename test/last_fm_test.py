@@ -0,0 +1,52 @@
+import xml.dom.minidom
+
+from last_fm import get_ignored_codes
+from scrobble_providers import LAST_FM_IGNORED_OK, LAST_FM_IGNORED_DAILY_LIMIT
+
+# track.scrobble response for three tracks: accepted, artist ignored, daily limit
+SCROBBLE_RESPONSE: str = """<?xml version="1.0" encoding="utf-8"?>
+<lfm status="ok">
+  <scrobbles ignored="2" accepted="1">
+    <scrobble>
+      <track corrected="0">Time</track>
+      <artist corrected="0">Pink Floyd</artist>
+      <album corrected="0">The Dark Side of the Moon</album>
+      <albumArtist corrected="0"></albumArtist>
+      <timestamp>1760000000</timestamp>
+      <ignoredMessage code="0"></ignoredMessage>
+    </scrobble>
+    <scrobble>
+      <track corrected="0">Intro</track>
+      <artist corrected="0">Unknown</artist>
+      <album corrected="0"></album>
+      <albumArtist corrected="0"></albumArtist>
+      <timestamp>1760000300</timestamp>
+      <ignoredMessage code="1">Artist was ignored</ignoredMessage>
+    </scrobble>
+    <scrobble>
+      <track corrected="0">Money</track>
+      <artist corrected="0">Pink Floyd</artist>
+      <album corrected="0">The Dark Side of the Moon</album>
+      <albumArtist corrected="0"></albumArtist>
+      <timestamp>1760000600</timestamp>
+      <ignoredMessage code="5">Daily scrobble limit exceeded</ignoredMessage>
+    </scrobble>
+  </scrobbles>
+</lfm>"""
+
+
+def test_ignored_codes():
+    codes: list[int] = get_ignored_codes(xml.dom.minidom.parseString(SCROBBLE_RESPONSE))
+    assert codes == [LAST_FM_IGNORED_OK, 1, LAST_FM_IGNORED_DAILY_LIMIT], f"got [{codes}]"
+
+
+def test_ignored_codes_without_message():
+    doc: xml.dom.minidom.Document = xml.dom.minidom.parseString(
+        "<lfm status=\"ok\"><scrobbles><scrobble><track>Time</track></scrobble></scrobbles></lfm>")
+    assert get_ignored_codes(doc) == [LAST_FM_IGNORED_OK]
+
+
+if __name__ == "__main__":
+    test_ignored_codes()
+    test_ignored_codes_without_message()
+    print("Everything passed")
@@ -0,0 +1,215 @@
+import asyncio
+
+import metrics
+import scrobbler
+
+from device_state import DeviceState
+from position_tracker import PositionTracker, MIN_POLL_DELAY_SEC
+from replay import RecordingDispatcher, VirtualClock
+from scrobble_queue import ScrobbleQueue
+from song import Song
+
+POLL_PLAYING_SEC: float = 15.0
+POLL_IDLE_SEC: float = 120.0
+
+
+class FakeClock:
+    """Both clocks of the tracker, moved by the test."""
+
+    def __init__(self):
+        self.now: float = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class FakeAction:
+
+    def __init__(self, result: callable):
+        self.__result: callable = result
+
+    async def async_call(self, **kwargs) -> dict[str, any]:
+        return self.__result()
+
+
+class FakeService:
+    """Answers GetTransportInfo and GetPositionInfo from transport_state and position (seconds)."""
+
+    def __init__(self):
+        self.transport_state: str = "PLAYING"
+        self.position: int = 0
+
+    def action(self, name: str) -> FakeAction:
+        if name == "GetTransportInfo":
+            return FakeAction(lambda: {"CurrentTransportState": self.transport_state})
+        return FakeAction(lambda: {"RelTime": (f"{self.position // 3600}:{self.position // 60 % 60:02d}:"
+                                               f"{self.position % 60:02d}")})
+
+
+class Fixture:
+
+    def __init__(self, duration: float = 300.0):
+        self.clock: FakeClock = FakeClock()
+        self.service: FakeService = FakeService()
+        self.song: Song = create_song("Time", duration, self.clock.now)
+        self.scrobbled: list[Song] = []
+        self.tracker: PositionTracker = PositionTracker(
+            name="test",
+            service=self.service,
+            get_current_song=lambda: self.song,
+            on_scrobble_point=self.scrobbled.append,
+            poll_playing_sec=POLL_PLAYING_SEC,
+            poll_idle_sec=POLL_IDLE_SEC,
+            monotonic=self.clock.time,
+            clock=self.clock.time)
+
+    def poll(self, after_sec: float, position: int = None, transport_state: str = None) -> float:
+        """Move the clock, then the renderer, then poll."""
+        self.clock.now += after_sec
+        if position is not None:
+            self.service.position = position
+        if transport_state is not None:
+            self.service.transport_state = transport_state
+        return asyncio.run(self.tracker.poll())
+
+    @property
+    def played(self) -> float:
+        return self.tracker.played_sec(self.song)
+
+
+def create_song(title: str, duration: float, playback_start: float) -> Song:
+    song: Song = Song()
+    song.title = title
+    song.artist = "Pink Floyd"
+    song.duration = duration
+    song.playback_start = playback_start
+    return song
+
+
+def test_playing():
+    f: Fixture = Fixture()
+    assert f.tracker.played_sec(f.song) is None, "not polled yet"
+    assert f.poll(0, position=0) == POLL_PLAYING_SEC
+    assert f.played == 0
+    f.poll(15, position=15)
+    assert f.played == 15
+    # between polls the played time goes on with the clock
+    f.clock.now += 5
+    assert f.played == 20
+
+
+def test_seek_forward():
+    f: Fixture = Fixture()
+    f.poll(0, position=0)
+    f.poll(15, position=15)
+    # seek to 3:20, only the elapsed time (plus the tolerance) counts
+    f.poll(15, position=200)
+    assert f.played == 15 + 15 + 2
+    f.poll(15, position=215)
+    assert f.played == 32 + 15
+
+
+def test_seek_back():
+    f: Fixture = Fixture()
+    f.poll(0, position=0)
+    f.poll(15, position=40)
+    assert f.played == 15 + 2, "forward progress is capped to the elapsed time plus the tolerance"
+    # seek back to 0:05, 10 seconds after the last poll: played 5 seconds since the seek
+    f.poll(10, position=5)
+    assert f.played == 17 + 5
+    # a restart of the same track counts the new position
+    f.poll(15, position=20)
+    assert f.played == 22 + 15
+
+
+def test_pause():
+    f: Fixture = Fixture()
+    f.poll(0, position=0)
+    f.poll(15, position=15)
+    # paused at 0:25, the first poll after the pause counts the time up to the pause
+    assert f.poll(15, position=25, transport_state="PAUSED_PLAYBACK") == POLL_IDLE_SEC
+    assert f.played == 25
+    f.clock.now += 60
+    assert f.played == 25, "time does not count while paused"
+    f.poll(60)
+    assert f.played == 25
+    # resumed
+    f.poll(1, transport_state="PLAYING")
+    f.poll(15, position=40)
+    assert f.played == 40
+
+
+def test_stop_resets_position():
+    f: Fixture = Fixture()
+    f.poll(0, position=0)
+    f.poll(15, position=15)
+    # stopped 10 seconds later, the renderer reports the start of the track
+    f.poll(10, position=0, transport_state="STOPPED")
+    assert f.played == 25
+
+
+def test_stale_position_after_track_change():
+    f: Fixture = Fixture()
+    f.poll(0, position=0)
+    f.poll(15, position=250)
+    # next track, seen 1 second ago, the renderer still reports the position of the previous one
+    f.clock.now += 1
+    f.song = create_song("The Great Gig in the Sky", 280.0, f.clock.now)
+    f.poll(1, position=250)
+    assert f.played == 1
+    assert f.scrobbled == []
+
+
+def test_scrobble_point():
+    # scrobble point at half the duration
+    f: Fixture = Fixture(duration=100.0)
+    assert f.poll(0, position=0) == POLL_PLAYING_SEC
+    assert f.poll(15, position=15) == POLL_PLAYING_SEC
+    assert f.poll(15, position=30) == POLL_PLAYING_SEC
+    # 20 seconds to go, polled right when due
+    assert f.poll(15, position=45) == 5
+    assert f.scrobbled == []
+    f.poll(5, position=50)
+    assert list(map(lambda x: x.title, f.scrobbled)) == ["Time"]
+    # once per song
+    assert f.poll(15, position=65) == POLL_PLAYING_SEC
+    assert len(f.scrobbled) == 1
+
+
+def test_minimum_poll_delay():
+    f: Fixture = Fixture(duration=100.0)
+    f.poll(0, position=0)
+    # a new track first seen 49.5 seconds ago, half a second before the scrobble point
+    f.song = create_song("Money", 100.0, f.clock.now - 49.5)
+    assert f.poll(0, position=60) == MIN_POLL_DELAY_SEC
+    assert f.scrobbled == []
+    f.poll(1, position=61)
+    assert list(map(lambda x: x.title, f.scrobbled)) == ["Money"]
+
+
+def test_fallback_when_not_polled():
+    f: Fixture = Fixture(duration=100.0)
+    virtual_clock: VirtualClock = VirtualClock(f.clock.now + 60)
+    state: DeviceState = DeviceState(name="position_fallback")
+    state.position_tracker = f.tracker
+    state.clock = virtual_clock.time
+    state.dispatcher = RecordingDispatcher(virtual_clock, f.clock.now)
+    state.scrobble_queue = ScrobbleQueue(":memory:")
+    # the track changed before the first poll: scrobbled on the time since it was first seen
+    assert scrobbler.maybe_scrobble(state, f.song)
+    assert metrics.g_position_fallbacks.get("position_fallback") == 1
+    assert list(map(lambda x: x.kind, state.dispatcher.decisions)) == ["scrobble"]
+    state.scrobble_queue.close()
+
+
+if __name__ == "__main__":
+    test_playing()
+    test_seek_forward()
+    test_seek_back()
+    test_pause()
+    test_stop_resets_position()
+    test_stale_position_after_track_change()
+    test_scrobble_point()
+    test_minimum_poll_delay()
+    test_fallback_when_not_polled()
+    print("Everything passed")
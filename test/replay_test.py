@@ -0,0 +1,112 @@
+import logging
+import os
+import xml.sax.saxutils
+
+from util import get_logger
+from replay import load_corpus, replay, ReplayEvent, ReplayResult
+from replay import DECISION_SCROBBLE, DECISION_NOW_PLAYING
+
+CORPUS_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "replay")
+
+# corpus -> (manufacturer, scrobbled titles with the corpus time, now playing count, rejected by reason)
+EXPECTED: dict[str, tuple[str, list[tuple[float, str]], int, dict[str, int]]] = {
+    "wiim": (
+        "WiiM",
+        [(250.2, "Time")],
+        5,
+        {"threshold": 3, "minimum_delta": 2}),
+    "upmpdcli": (
+        "upmpdcli",
+        [(562.1, "So What"), (1037.4, "Blue in Green")],
+        3,
+        {"threshold": 2, "minimum_delta": 0}),
+    "gmrender_resurrect": (
+        "gmrender-resurrect",
+        [(372.0, "Heroes"), (500.0, "Sons of the Silent Age")],
+        3,
+        {"threshold": 5, "minimum_delta": 2}),
+    "tidal_connect": (
+        "Tidal",
+        [(200.0, "Blinding Lights"), (437.0, "In Your Eyes")],
+        4,
+        {"threshold": 3, "minimum_delta": 0})}
+
+
+def replay_corpus(name: str) -> ReplayResult:
+    manufacturer: str = EXPECTED[name][0]
+    return replay(load_corpus(os.path.join(CORPUS_DIR, f"{name}.ndjson")), manufacturer=manufacturer)
+
+
+def test_decisions():
+    name: str
+    for name in EXPECTED.keys():
+        _, scrobbles, now_playing, rejected = EXPECTED[name]
+        result: ReplayResult = replay_corpus(name)
+        actual_scrobbles: list[tuple[float, str]] = list(map(
+            lambda x: (round(x.t, 1), x.song.title),
+            filter(lambda x: x.kind == DECISION_SCROBBLE, result.decisions)))
+        assert actual_scrobbles == scrobbles, f"[{name}] expected [{scrobbles}] got [{actual_scrobbles}]"
+        actual_now_playing: int = len(list(filter(lambda x: x.kind == DECISION_NOW_PLAYING, result.decisions)))
+        assert actual_now_playing == now_playing, f"[{name}] expected [{now_playing}] got [{actual_now_playing}]"
+        assert result.rejected == rejected, f"[{name}] expected [{rejected}] got [{result.rejected}]"
+
+
+def test_position_events_filtered():
+    result: ReplayResult = replay_corpus("wiim")
+    assert result.filtered > 0.9 * result.events, f"filtered [{result.filtered}] of [{result.events}]"
+
+
+def last_change(title: str, artist: str, duration: str) -> str:
+    """LastChange of a renderer which sends AVTransport events this way only, e.g. most DLNA renderers."""
+    metadata: str = (
+        "<DIDL-Lite xmlns=\"urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/\" "
+        "xmlns:dc=\"http://purl.org/dc/elements/1.1/\" xmlns:upnp=\"urn:schemas-upnp-org:metadata-1-0/upnp/\">"
+        f"<item id=\"1\" parentID=\"0\" restricted=\"1\"><dc:title>{title}</dc:title>"
+        f"<upnp:artist>{artist}</upnp:artist><res duration=\"{duration}\">http://x/{title}.flac</res>"
+        "<upnp:class>object.item.audioItem.musicTrack</upnp:class></item></DIDL-Lite>")
+    return ("<Event xmlns=\"urn:schemas-upnp-org:metadata-1-0/AVT/\"><InstanceID val=\"0\">"
+            "<TransportState val=\"PLAYING\"/>"
+            f"<CurrentTrackURI val=\"http://x/{title}.flac\"/>"
+            f"<CurrentTrackMetaData val={xml.sax.saxutils.quoteattr(metadata)}/>"
+            "</InstanceID></Event>")
+
+
+def test_last_change_expanded():
+    events: list[ReplayEvent] = [
+        ReplayEvent(t=0.0, variables={"LastChange": last_change("Money", "Pink Floyd", "0:06:22")}),
+        ReplayEvent(t=300.0, variables={"LastChange": last_change("Us and Them", "Pink Floyd", "0:07:49")})]
+    result: ReplayResult = replay(events)
+    actual: list[tuple[float, str, str]] = list(map(lambda x: (x.t, x.kind, x.song.title), result.decisions))
+    expected: list[tuple[float, str, str]] = [
+        (0.0, DECISION_NOW_PLAYING, "Money"),
+        (300.0, DECISION_NOW_PLAYING, "Us and Them"),
+        (300.0, DECISION_SCROBBLE, "Money")]
+    assert actual == expected, f"expected [{expected}] got [{actual}]"
+    # the LastChange events themselves are dropped, their expansion is handled
+    assert result.events == 2 and result.filtered == 2, f"events [{result.events}] filtered [{result.filtered}]"
+
+
+def benchmark(repeat: int = 50):
+    name: str
+    for name in EXPECTED.keys():
+        events: int = 0
+        elapsed: float = 0.0
+        latencies: list[float] = []
+        for _ in range(repeat):
+            result: ReplayResult = replay_corpus(name)
+            events += result.events
+            elapsed += result.elapsed_sec
+            latencies.extend(result.latencies)
+        latencies.sort()
+        print(f"corpus [{name}] events/sec [{events / elapsed:.0f}] "
+              f"latency us p50 [{latencies[len(latencies) // 2] * 1e6:.1f}] "
+              f"p99 [{latencies[int(len(latencies) * 0.99)] * 1e6:.1f}]")
+
+
+if __name__ == "__main__":
+    get_logger().setLevel(logging.WARNING)
+    test_decisions()
+    test_position_events_filtered()
+    test_last_change_expanded()
+    benchmark()
+    print("Everything passed")
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import time
+
+from scrobble_queue import ScrobbleQueue, QueueEntry
+from scrobble_providers import apply_last_fm_batch_codes
+from scrobble_providers import LAST_FM_IGNORED_OK, LAST_FM_IGNORED_DAILY_LIMIT
+
+PAYLOAD: dict[str, any] = {"title": "Time", "artist": "Pink Floyd", "album": "The Dark Side of the Moon"}
+LEASE_SEC: float = 300.0
+
+
+def create_queue(directory: str) -> ScrobbleQueue:
+    return ScrobbleQueue(os.path.join(directory, "scrobble_queue.db"))
+
+
+def test_add_and_claim_due():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        entry: QueueEntry = queue.add(provider="last.fm", payload=PAYLOAD, timestamp=1000, lease_sec=LEASE_SEC)
+        assert entry.attempts == 0 and entry.payload == PAYLOAD
+        assert queue.count() == 1
+        # leased to the caller of add
+        assert queue.claim_due(limit=10, lease_sec=LEASE_SEC) == []
+        claimed: list[QueueEntry] = queue.claim_due(limit=10, lease_sec=LEASE_SEC, due_before=time.time() + LEASE_SEC)
+        assert list(map(lambda x: x.entry_id, claimed)) == [entry.entry_id]
+        assert claimed[0].payload == PAYLOAD and claimed[0].timestamp == 1000
+        queue.remove(entry.entry_id)
+        assert queue.count() == 0
+        queue.close()
+
+
+def test_add_many():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        entry_list: list[QueueEntry] = queue.add_many(
+            provider_lease_list=[("last.fm", 0.0), ("subsonic:main", LEASE_SEC)],
+            payload=PAYLOAD,
+            timestamp=1000)
+        assert list(map(lambda x: x.provider, entry_list)) == ["last.fm", "subsonic:main"]
+        assert entry_list[0].entry_id != entry_list[1].entry_id
+        assert queue.count() == 2
+        # each entry has its own lease
+        assert list(map(lambda x: x.provider, queue.claim_due(limit=10, lease_sec=LEASE_SEC))) == ["last.fm"]
+        queue.close()
+
+
+def test_claim_due_order_and_limit():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        timestamp: int
+        for timestamp in [3000, 1000, 2000]:
+            queue.add(provider="last.fm", payload=PAYLOAD, timestamp=timestamp, lease_sec=0)
+        claimed: list[QueueEntry] = queue.claim_due(limit=2, lease_sec=LEASE_SEC)
+        assert list(map(lambda x: x.timestamp, claimed)) == [1000, 2000]
+        assert list(map(lambda x: x.timestamp, queue.claim_due(limit=2, lease_sec=LEASE_SEC))) == [3000]
+        queue.close()
+
+
+def test_lease_expiry():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        queue.add(provider="subsonic:main", payload=PAYLOAD, timestamp=1000, lease_sec=0)
+        assert len(queue.claim_due(limit=10, lease_sec=0.2)) == 1
+        # claimed entries are leased, nobody picks them twice
+        assert queue.claim_due(limit=10, lease_sec=0.2) == []
+        time.sleep(0.3)
+        # the lease expired, e.g. the worker attempting it died
+        assert len(queue.claim_due(limit=10, lease_sec=0.2)) == 1
+        queue.close()
+
+
+def test_release():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        entry: QueueEntry = queue.add(provider="subsonic:main", payload=PAYLOAD, timestamp=1000, lease_sec=LEASE_SEC)
+        queue.release([entry.entry_id])
+        assert list(map(lambda x: x.entry_id, queue.claim_due(limit=10, lease_sec=LEASE_SEC))) == [entry.entry_id]
+        queue.close()
+
+
+def test_reschedule():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        entry: QueueEntry = queue.add(provider="last.fm", payload=PAYLOAD, timestamp=1000, lease_sec=0)
+        queue.reschedule(entry_id=entry.entry_id, next_attempt=time.time() + 60, last_error="timeout")
+        assert queue.claim_due(limit=10, lease_sec=LEASE_SEC) == []
+        claimed: list[QueueEntry] = queue.claim_due(limit=10, lease_sec=LEASE_SEC, due_before=time.time() + 61)
+        assert len(claimed) == 1 and claimed[0].attempts == 1
+        queue.close()
+
+
+def test_restart_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        queue.add(provider="last.fm", payload=PAYLOAD, timestamp=1000, lease_sec=0)
+        queue.add(provider="subsonic:main", payload=PAYLOAD, timestamp=1000, lease_sec=LEASE_SEC)
+        # crash before any attempt
+        queue.close()
+        queue = create_queue(directory)
+        assert queue.count() == 2
+        assert list(map(lambda x: x.provider, queue.claim_due(limit=10, lease_sec=2 * LEASE_SEC))) == ["last.fm"]
+        # the one leased before the crash is picked up once its lease expires
+        claimed: list[QueueEntry] = queue.claim_due(limit=10, lease_sec=LEASE_SEC, due_before=time.time() + LEASE_SEC)
+        assert list(map(lambda x: x.provider, claimed)) == ["subsonic:main"]
+        assert claimed[0].payload == PAYLOAD
+        queue.close()
+
+
+def test_remove_older_than():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        queue.add(provider="last.fm", payload=PAYLOAD, timestamp=1000, lease_sec=0)
+        queue.add(provider="last.fm", payload=PAYLOAD, timestamp=2000, lease_sec=0)
+        assert queue.remove_older_than(1500) == 1
+        assert queue.count() == 1
+        queue.close()
+
+
+def test_last_fm_batch_codes():
+    with tempfile.TemporaryDirectory() as directory:
+        queue: ScrobbleQueue = create_queue(directory)
+        entry_list: list[QueueEntry] = list(map(
+            lambda x: queue.add(provider="last.fm", payload=PAYLOAD, timestamp=x, lease_sec=0),
+            [1000, 2000, 3000]))
+        accepted: int = apply_last_fm_batch_codes(
+            queue,
+            entry_list,
+            [LAST_FM_IGNORED_OK, LAST_FM_IGNORED_DAILY_LIMIT, 1])
+        assert accepted == 1
+        # accepted and ignored for good are removed, the daily limit is retried later
+        assert queue.count() == 1
+        assert queue.claim_due(limit=10, lease_sec=LEASE_SEC) == []
+        claimed: list[QueueEntry] = queue.claim_due(limit=10, lease_sec=LEASE_SEC, due_before=time.time() + 86400)
+        assert list(map(lambda x: (x.timestamp, x.attempts), claimed)) == [(2000, 1)]
+        queue.close()
+
+
+if __name__ == "__main__":
+    test_add_and_claim_due()
+    test_add_many()
+    test_claim_due_order_and_limit()
+    test_lease_expiry()
+    test_release()
+    test_reschedule()
+    test_restart_replay()
+    test_remove_older_than()
+    test_last_fm_batch_codes()
+    print("Everything passed")
@@ -0,0 +1,149 @@
+import http.server
+import json
+import threading
+import time
+import urllib.error
+
+from subsonic_connector.connector import Connector as SubsonicConnector
+
+from subsonic_configuration import ScrobblerSubsonicConfiguration, SubsonicConnectorConfiguration
+from subsonic_connector_pool import SubsonicConnectorPool, PooledSubsonicConnector, PooledLibsonicConnection
+
+SONG_RESPONSE: dict[str, any] = {"subsonic-response": {
+    "status": "ok",
+    "version": "1.16.1",
+    "song": {"id": "tr-1", "title": "Time", "artist": "Pink Floyd", "album": "The Dark Side of the Moon"}}}
+
+
+class FakeSubsonicServer:
+    """Answers getSong, records the request paths, delays answers by delay_sec."""
+
+    def __init__(self):
+        self.paths: list[str] = []
+        self.delay_sec: float = 0.0
+        self.status: int = 200
+        server: FakeSubsonicServer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.__answer()
+
+            def do_GET(self):
+                self.__answer()
+
+            def __answer(self):
+                server.paths.append(self.path)
+                time.sleep(server.delay_sec)
+                body: bytes = json.dumps(SONG_RESPONSE).encode("utf-8")
+                self.send_response(server.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.__httpd: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.__httpd.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.__httpd.server_address[1]
+
+    def stop(self):
+        self.__httpd.shutdown()
+
+
+def create_config(port: int, server_path: str = None) -> ScrobblerSubsonicConfiguration:
+    return ScrobblerSubsonicConfiguration(
+        subsonic_key="test",
+        base_url="http://127.0.0.1",
+        port=port,
+        username="user",
+        password="password",
+        server_path=server_path,
+        legacy_auth=False,
+        enable_now_playing=True,
+        allow_match=True)
+
+
+def test_pooled_connection_is_used():
+    server: FakeSubsonicServer = FakeSubsonicServer()
+    try:
+        pool: SubsonicConnectorPool = SubsonicConnectorPool(pool_size=2, idle_timeout_sec=60, request_timeout_sec=5)
+        connector: SubsonicConnector = pool.get(create_config(server.port, "music"))
+        assert isinstance(connector, PooledSubsonicConnector)
+        # the library asks this method for the connection of each call
+        assert connector._Connector__connect() is connector.connection
+        assert isinstance(connector.connection, PooledLibsonicConnection)
+        before: float = connector.connection.last_used
+        assert connector.getSong("tr-1").getObj().getTitle() == "Time"
+        assert connector.connection.last_used > before, "request did not go through the pooled session"
+        assert server.paths[0].startswith("/music/rest/getSong"), f"unexpected path [{server.paths[0]}]"
+        assert pool.get(create_config(server.port, "music")) is not connector, "new configuration instance"
+    finally:
+        server.stop()
+
+
+def test_same_connection_settings_as_library():
+    server_path: str
+    for server_path in [None, "", "music", "/music"]:
+        cfg: ScrobblerSubsonicConfiguration = create_config(4533, server_path)
+        pool: SubsonicConnectorPool = SubsonicConnectorPool(pool_size=1, idle_timeout_sec=60, request_timeout_sec=5)
+        pooled: PooledLibsonicConnection = pool.get(cfg).connection
+        library = SubsonicConnector(SubsonicConnectorConfiguration(cfg))._Connector__connect()
+        attribute: str
+        for attribute in ["_baseUrl", "_port", "_serverPath", "_username", "_legacyAuth", "_apiVersion", "_appName"]:
+            assert getattr(pooled, attribute) == getattr(library, attribute), \
+                f"[{attribute}] differs for server_path [{server_path}]"
+
+
+def test_urllib_errors():
+    server: FakeSubsonicServer = FakeSubsonicServer()
+    try:
+        server.status = 500
+        pool: SubsonicConnectorPool = SubsonicConnectorPool(pool_size=1, idle_timeout_sec=60, request_timeout_sec=5)
+        try:
+            pool.get(create_config(server.port)).getSong("tr-1")
+            assert False, "HTTPError expected"
+        except urllib.error.HTTPError as ex:
+            assert ex.code == 500
+    finally:
+        server.stop()
+    try:
+        pool.get(create_config(server.port)).getSong("tr-1")
+        assert False, "URLError expected"
+    except urllib.error.URLError as ex:
+        assert not isinstance(ex, urllib.error.HTTPError)
+
+
+def test_close_idle_keeps_connections_in_use():
+    server: FakeSubsonicServer = FakeSubsonicServer()
+    try:
+        server.delay_sec = 1.0
+        pool: SubsonicConnectorPool = SubsonicConnectorPool(pool_size=1, idle_timeout_sec=0.1, request_timeout_sec=5)
+        cfg: ScrobblerSubsonicConfiguration = create_config(server.port)
+        connector: SubsonicConnector = pool.get(cfg)
+        call: threading.Thread = threading.Thread(target=connector.getSong, args=("tr-1",))
+        call.start()
+        time.sleep(0.5)
+        pool.close_idle()
+        assert pool.get(cfg) is connector, "connection in use was closed"
+        call.join()
+        time.sleep(0.2)
+        pool.close_idle()
+        assert pool.get(cfg) is not connector, "idle connection was kept"
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_pooled_connection_is_used()
+    test_same_connection_settings_as_library()
+    test_urllib_errors()
+    test_close_idle_keeps_connections_in_use()
+    print("Everything passed")
@@ -0,0 +1,59 @@
+from subsonic_connector.song import Song as SubsonicSong
+
+from subsonic_library import SubsonicLibraryIndex
+from subsonic import find_song_in_index
+
+SONGS: list[dict[str, any]] = [
+    {"id": "1", "title": "Intro", "artist": "The xx", "album": "xx", "albumId": "a1"},
+    {"id": "2", "title": "Intro", "artist": "M83", "album": "Hurry Up, We're Dreaming", "albumId": "a2"},
+    {"id": "3", "title": "Under Pressure", "artist": "Queen", "album": "Hot Space", "albumId": "a3",
+     "artists": [{"name": "Queen"}, {"name": "David Bowie"}]},
+    {"id": "4", "title": "Intro", "artist": "Various Artists", "album": "Mix", "albumId": "a4",
+     "displayArtist": "Alt-J"}]
+
+
+class FakeSearchResult:
+
+    def __init__(self, songs: list[dict[str, any]]):
+        self.__songs: list[dict[str, any]] = songs
+
+    def getSongs(self) -> list[SubsonicSong]:
+        return list(map(lambda x: SubsonicSong(x), self.__songs))
+
+
+class FakeConnector:
+
+    def search(self, query: str, artistCount: int, albumCount: int, songCount: int, songOffset: int):
+        return FakeSearchResult(SONGS[songOffset:songOffset + songCount])
+
+
+def create_index() -> SubsonicLibraryIndex:
+    index: SubsonicLibraryIndex = SubsonicLibraryIndex(subsonic_key="test", file_name=None, page_size=2)
+    index.full_sync(FakeConnector())
+    return index
+
+
+def test_candidates_by_title_and_artist():
+    index: SubsonicLibraryIndex = create_index()
+    assert index.ready and index.song_count == len(SONGS)
+    assert list(map(lambda x: x.getId(), index.get_candidates("intro", "M83"))) == ["2"]
+    assert list(map(lambda x: x.getId(), index.get_candidates("Intro", "alt-j"))) == ["4"]
+    assert index.get_candidates("Intro", "Nobody") == []
+    assert index.get_candidates("Intro", None) == []
+
+
+def test_find_song_in_index():
+    index: SubsonicLibraryIndex = create_index()
+    assert find_song_in_index(index, "Intro", "The xx").getId() == "1"
+    assert find_song_in_index(index, "Under Pressure", "David Bowie").getId() == "3"
+    assert find_song_in_index(index, "Under Pressure", "Queen / David Bowie").getId() == "3"
+    assert find_song_in_index(index, "Under Pressure", "Queen, Freddie Mercury") is None
+    assert find_song_in_index(index, "Intro", "M83", "Hot Space") is None
+    # an album made of punctuation only is still compared
+    assert find_song_in_index(index, "Intro", "M83", "...") is None
+
+
+if __name__ == "__main__":
+    test_candidates_by_title_and_artist()
+    test_find_song_in_index()
+    print("Everything passed")
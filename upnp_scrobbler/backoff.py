@@ -0,0 +1,67 @@
+import asyncio
+import random
+import threading
+
+from typing import Awaitable, Callable
+
+# delays are spread by +/- this ratio, so that retries of many devices/providers do not line up
+DEFAULT_JITTER_RATIO: float = 0.2
+
+
+def get_delay_sec(
+        attempts: int,
+        initial_delay_sec: float,
+        max_delay_sec: float,
+        jitter_ratio: float = DEFAULT_JITTER_RATIO) -> float:
+    """Exponential delay for the given number of failed attempts, capped at max_delay_sec, with jitter."""
+    delay_sec: float = min(float(max_delay_sec), float(initial_delay_sec) * (2 ** min(attempts, 32)))
+    if jitter_ratio > 0:
+        delay_sec *= random.uniform(1.0 - jitter_ratio, 1.0 + jitter_ratio)
+    return max(0.0, min(float(max_delay_sec), delay_sec))
+
+
+class Backoff:
+    """Retry delays growing from initial_delay_sec up to max_delay_sec.
+
+    wait() never blocks the event loop and can be cut short by a wake up
+    function (e.g. a device advertising itself); cancelling the waiting task
+    cancels the wait. wait_sync() is for code running on worker threads.
+    """
+
+    def __init__(self, initial_delay_sec: float, max_delay_sec: float, jitter_ratio: float = DEFAULT_JITTER_RATIO):
+        self.__initial_delay_sec: float = initial_delay_sec
+        self.__max_delay_sec: float = max_delay_sec
+        self.__jitter_ratio: float = jitter_ratio
+        self.__attempts: int = 0
+
+    @property
+    def attempts(self) -> int:
+        return self.__attempts
+
+    def reset(self):
+        self.__attempts = 0
+
+    def next_delay_sec(self) -> float:
+        delay_sec: float = get_delay_sec(
+            attempts=self.__attempts,
+            initial_delay_sec=self.__initial_delay_sec,
+            max_delay_sec=self.__max_delay_sec,
+            jitter_ratio=self.__jitter_ratio)
+        self.__attempts += 1
+        return delay_sec
+
+    async def wait(self, wake_up: Callable[[float], Awaitable[bool]] = None) -> bool:
+        """Wait for the next delay, returns True if wake_up ended the wait early."""
+        delay_sec: float = self.next_delay_sec()
+        if wake_up:
+            return await wake_up(delay_sec)
+        await asyncio.sleep(delay_sec)
+        return False
+
+    def wait_sync(self, stop: threading.Event = None) -> bool:
+        """Blocking wait, for worker threads only, returns True if stop was set."""
+        delay_sec: float = self.next_delay_sec()
+        if stop:
+            return stop.wait(delay_sec)
+        threading.Event().wait(delay_sec)
+        return False
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable
+from util import print
+
+
+class LruTtlCache:
+    """Thread-safe LRU cache with expiration, optionally persisted to a json file.
+
+    A value of None is a negative result (e.g. "not found") and it is kept
+    for negative_ttl_sec instead of ttl_sec.
+    Keys must be tuples of strings when the cache is persisted,
+    values are converted using value_to_json and value_from_json.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_size: int,
+            ttl_sec: float,
+            negative_ttl_sec: float = None,
+            file_name: str = None,
+            value_to_json: Callable[[any], any] = lambda x: x,
+            value_from_json: Callable[[any], any] = lambda x: x):
+        self.__name: str = name
+        self.__max_size: int = max_size
+        self.__ttl_sec: float = ttl_sec
+        self.__negative_ttl_sec: float = negative_ttl_sec if negative_ttl_sec is not None else ttl_sec
+        self.__file_name: str = file_name
+        self.__value_to_json: Callable[[any], any] = value_to_json
+        self.__value_from_json: Callable[[any], any] = value_from_json
+        self.__lock: threading.Lock = threading.Lock()
+        # key -> (expires_at, value)
+        self.__entries: OrderedDict[tuple, tuple[float, any]] = OrderedDict()
+        self.__dirty: bool = False
+        self.__hits: int = 0
+        self.__misses: int = 0
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: tuple) -> tuple[bool, any]:
+        """Returns (found, value), value is None for a cached negative result."""
+        now: float = time.time()
+        with self.__lock:
+            entry: tuple[float, any] = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return False, None
+            if entry[0] < now:
+                del self.__entries[key]
+                self.__dirty = True
+                self.__misses += 1
+                return False, None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return True, entry[1]
+
+    def put(self, key: tuple, value: any):
+        if self.__max_size <= 0:
+            return
+        ttl_sec: float = self.__ttl_sec if value is not None else self.__negative_ttl_sec
+        with self.__lock:
+            self.__entries[key] = (time.time() + ttl_sec, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+            self.__dirty = True
+
+    def remove(self, key: tuple):
+        with self.__lock:
+            if self.__entries.pop(key, None) is not None:
+                self.__dirty = True
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__dirty = True
+
+    def load(self):
+        if not self.__file_name or not os.path.exists(self.__file_name):
+            return
+        try:
+            with open(self.__file_name, "r") as f:
+                data: list = json.load(f)
+        except Exception as ex:
+            print(f"Cache [{self.__name}] cannot load [{self.__file_name}] due to [{type(ex)}] [{ex}]")
+            return
+        now: float = time.time()
+        loaded: int = 0
+        with self.__lock:
+            for key, expires_at, value in data:
+                if expires_at < now:
+                    continue
+                self.__entries[tuple(key)] = (
+                    expires_at,
+                    self.__value_from_json(value) if value is not None else None)
+                loaded += 1
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+            self.__dirty = False
+        print(f"Cache [{self.__name}] loaded [{loaded}] entries from [{self.__file_name}]")
+
+    def save(self):
+        if not self.__file_name or not self.__dirty:
+            return
+        with self.__lock:
+            data: list = list(map(
+                lambda kv: [
+                    list(kv[0]),
+                    kv[1][0],
+                    self.__value_to_json(kv[1][1]) if kv[1][1] is not None else None],
+                self.__entries.items()))
+            self.__dirty = False
+        tmp_file_name: str = f"{self.__file_name}.tmp"
+        try:
+            with open(tmp_file_name, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_file_name, self.__file_name)
+        except Exception as ex:
+            print(f"Cache [{self.__name}] cannot save [{self.__file_name}] due to [{type(ex)}] [{ex}]")
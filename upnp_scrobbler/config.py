@@ -32,6 +32,70 @@ def get_bool_config(env_key: str, default_value: bool) -> bool:
     return is_true(cfg)
 
 
+def get_log_level() -> str:
+    return os.getenv("LOG_LEVEL", constants.DEFAULT_LOG_LEVEL)
+
+
+def get_log_format() -> str:
+    return os.getenv("LOG_FORMAT", constants.DEFAULT_LOG_FORMAT)
+
+
+def get_log_async() -> bool:
+    return get_bool_config(
+        env_key="LOG_ASYNC",
+        default_value=constants.DEFAULT_LOG_ASYNC)
+
+
+def get_metrics_host() -> str:
+    return os.getenv("METRICS_HOST", constants.DEFAULT_METRICS_HOST)
+
+
+def get_metrics_port() -> int:
+    return get_int_config(
+        env_key="METRICS_PORT",
+        default_value=constants.DEFAULT_METRICS_PORT)
+
+
+def get_position_tracking() -> bool:
+    return get_bool_config(
+        env_key="POSITION_TRACKING",
+        default_value=constants.DEFAULT_POSITION_TRACKING)
+
+
+def get_position_poll_playing_sec() -> int:
+    return get_int_config(
+        env_key="POSITION_POLL_PLAYING_SEC",
+        default_value=constants.DEFAULT_POSITION_POLL_PLAYING_SEC)
+
+
+def get_position_poll_idle_sec() -> int:
+    return get_int_config(
+        env_key="POSITION_POLL_IDLE_SEC",
+        default_value=constants.DEFAULT_POSITION_POLL_IDLE_SEC)
+
+
+def get_record_events_file() -> str:
+    return os.getenv("RECORD_EVENTS_FILE", constants.DEFAULT_RECORD_EVENTS_FILE)
+
+
+def get_record_events_max_bytes() -> int:
+    return get_int_config(
+        env_key="RECORD_EVENTS_MAX_BYTES",
+        default_value=constants.DEFAULT_RECORD_EVENTS_MAX_BYTES)
+
+
+def get_record_events_backup_count() -> int:
+    return get_int_config(
+        env_key="RECORD_EVENTS_BACKUP_COUNT",
+        default_value=constants.DEFAULT_RECORD_EVENTS_BACKUP_COUNT)
+
+
+def get_record_events_flush_interval_sec() -> int:
+    return get_int_config(
+        env_key="RECORD_EVENTS_FLUSH_INTERVAL_SEC",
+        default_value=constants.DEFAULT_RECORD_EVENTS_FLUSH_INTERVAL_SEC)
+
+
 def get_dump_upnp_data() -> bool:
     return get_bool_config(
         env_key="DUMP_UPNP_DATA",
@@ -50,6 +114,38 @@ def get_dump_event_key_values() -> bool:
         default_value=constants.DEFAULT_DUMP_EVENT_KEY_VALUES)
 
 
+def get_device_list() -> list[str]:
+    """Devices from DEVICE_LIST (comma separated), empty when not set or set to all."""
+    device_list: str = os.getenv("DEVICE_LIST")
+    if not device_list or get_monitor_all_devices(): return []
+    return list(filter(lambda x: len(x) > 0, map(lambda x: x.strip(), device_list.split(","))))
+
+
+def get_monitor_all_devices() -> bool:
+    device_list: str = os.getenv("DEVICE_LIST")
+    return device_list is not None and device_list.strip().lower() == constants.DEVICE_LIST_ALL
+
+
+def get_event_filter_profile() -> str:
+    return os.getenv("EVENT_FILTER_PROFILE", constants.DEFAULT_EVENT_FILTER_PROFILE)
+
+
+def get_event_filter_ignore() -> list[str]:
+    """Additional event variable names to ignore, from EVENT_FILTER_IGNORE (comma separated)."""
+    return get_name_list_config("EVENT_FILTER_IGNORE")
+
+
+def get_event_filter_accept() -> list[str]:
+    """Event variable names never ignored, from EVENT_FILTER_ACCEPT (comma separated)."""
+    return get_name_list_config("EVENT_FILTER_ACCEPT")
+
+
+def get_name_list_config(env_key: str) -> list[str]:
+    cfg: str = os.getenv(env_key)
+    if not cfg: return []
+    return list(filter(lambda x: len(x) > 0, map(lambda x: x.strip(), cfg.split(","))))
+
+
 def get_duration_threshold() -> int:
     duration_cfg: str = os.getenv("DURATION_THRESHOLD")
     if not duration_cfg: return constants.DEFAULT_DURATION_THRESHOLD
@@ -67,6 +163,228 @@ def get_enable_now_playing() -> bool:
         default_value=constants.DEFAULT_ENABLE_NOW_PLAYING)
 
 
+def get_int_config(env_key: str, default_value: int) -> int:
+    cfg: str = os.getenv(env_key)
+    if not cfg: return default_value
+    return int(cfg)
+
+
+def get_dispatch_queue_size() -> int:
+    return get_int_config(
+        env_key="DISPATCH_QUEUE_SIZE",
+        default_value=constants.DEFAULT_DISPATCH_QUEUE_SIZE)
+
+
+def get_dispatch_worker_count() -> int:
+    return get_int_config(
+        env_key="DISPATCH_WORKER_COUNT",
+        default_value=constants.DEFAULT_DISPATCH_WORKER_COUNT)
+
+
+def get_provider_worker_count() -> int:
+    return get_int_config(
+        env_key="PROVIDER_WORKER_COUNT",
+        default_value=constants.DEFAULT_PROVIDER_WORKER_COUNT)
+
+
+def get_provider_timeout_sec() -> int:
+    return get_int_config(
+        env_key="PROVIDER_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_PROVIDER_TIMEOUT_SEC)
+
+
+def get_scanner_max_concurrency() -> int:
+    return get_int_config(
+        env_key="SCANNER_MAX_CONCURRENCY",
+        default_value=constants.DEFAULT_SCANNER_MAX_CONCURRENCY)
+
+
+def get_scanner_device_timeout_sec() -> int:
+    return get_int_config(
+        env_key="SCANNER_DEVICE_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_SCANNER_DEVICE_TIMEOUT_SEC)
+
+
+def get_enable_discovery_cache() -> bool:
+    return get_bool_config(
+        env_key="ENABLE_DISCOVERY_CACHE",
+        default_value=constants.DEFAULT_ENABLE_DISCOVERY_CACHE)
+
+
+def get_enable_ssdp_listener() -> bool:
+    return get_bool_config(
+        env_key="ENABLE_SSDP_LISTENER",
+        default_value=constants.DEFAULT_ENABLE_SSDP_LISTENER)
+
+
+def get_ssdp_search_interval_sec() -> int:
+    return get_int_config(
+        env_key="SSDP_SEARCH_INTERVAL_SEC",
+        default_value=constants.DEFAULT_SSDP_SEARCH_INTERVAL_SEC)
+
+
+def get_subscription_timeout_sec() -> int:
+    return get_int_config(
+        env_key="SUBSCRIPTION_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_SUBSCRIPTION_TIMEOUT_SEC)
+
+
+def get_resubscribe_percent() -> int:
+    return get_int_config(
+        env_key="RESUBSCRIBE_PERCENT",
+        default_value=constants.DEFAULT_RESUBSCRIBE_PERCENT)
+
+
+def get_reconnect_initial_delay_sec() -> int:
+    return get_int_config(
+        env_key="RECONNECT_INITIAL_DELAY_SEC",
+        default_value=constants.DEFAULT_RECONNECT_INITIAL_DELAY_SEC)
+
+
+def get_reconnect_max_delay_sec() -> int:
+    return get_int_config(
+        env_key="RECONNECT_MAX_DELAY_SEC",
+        default_value=constants.DEFAULT_RECONNECT_MAX_DELAY_SEC)
+
+
+def get_subsonic_config_refresh_interval_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_CONFIG_REFRESH_INTERVAL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_CONFIG_REFRESH_INTERVAL_SEC)
+
+
+def get_subsonic_pool_size() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_POOL_SIZE",
+        default_value=constants.DEFAULT_SUBSONIC_POOL_SIZE)
+
+
+def get_subsonic_idle_timeout_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_IDLE_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_IDLE_TIMEOUT_SEC)
+
+
+def get_subsonic_request_timeout_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_REQUEST_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_REQUEST_TIMEOUT_SEC)
+
+
+def get_subsonic_song_cache_size() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_SONG_CACHE_SIZE",
+        default_value=constants.DEFAULT_SUBSONIC_SONG_CACHE_SIZE)
+
+
+def get_subsonic_song_cache_ttl_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_SONG_CACHE_TTL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_SONG_CACHE_TTL_SEC)
+
+
+def get_subsonic_song_cache_negative_ttl_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_SONG_CACHE_NEGATIVE_TTL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_SONG_CACHE_NEGATIVE_TTL_SEC)
+
+
+def get_subsonic_match_cache_size() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_MATCH_CACHE_SIZE",
+        default_value=constants.DEFAULT_SUBSONIC_MATCH_CACHE_SIZE)
+
+
+def get_subsonic_match_cache_ttl_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_MATCH_CACHE_TTL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_MATCH_CACHE_TTL_SEC)
+
+
+def get_subsonic_match_cache_negative_ttl_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_MATCH_CACHE_NEGATIVE_TTL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_MATCH_CACHE_NEGATIVE_TTL_SEC)
+
+
+def get_subsonic_library_refresh_interval_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_LIBRARY_REFRESH_INTERVAL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_LIBRARY_REFRESH_INTERVAL_SEC)
+
+
+def get_subsonic_library_full_sync_interval_sec() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_LIBRARY_FULL_SYNC_INTERVAL_SEC",
+        default_value=constants.DEFAULT_SUBSONIC_LIBRARY_FULL_SYNC_INTERVAL_SEC)
+
+
+def get_subsonic_library_page_size() -> int:
+    return get_int_config(
+        env_key="SUBSONIC_LIBRARY_PAGE_SIZE",
+        default_value=constants.DEFAULT_SUBSONIC_LIBRARY_PAGE_SIZE)
+
+
+def get_metadata_cache_size() -> int:
+    return get_int_config(
+        env_key="METADATA_CACHE_SIZE",
+        default_value=constants.DEFAULT_METADATA_CACHE_SIZE)
+
+
+def get_metadata_cache_ttl_sec() -> int:
+    return get_int_config(
+        env_key="METADATA_CACHE_TTL_SEC",
+        default_value=constants.DEFAULT_METADATA_CACHE_TTL_SEC)
+
+
+def get_persist_caches() -> bool:
+    return get_bool_config(
+        env_key="PERSIST_CACHES",
+        default_value=constants.DEFAULT_PERSIST_CACHES)
+
+
+def get_cache_save_interval_sec() -> int:
+    return get_int_config(
+        env_key="CACHE_SAVE_INTERVAL_SEC",
+        default_value=constants.DEFAULT_CACHE_SAVE_INTERVAL_SEC)
+
+
+def get_scrobble_queue_flush_interval_sec() -> int:
+    return get_int_config(
+        env_key="SCROBBLE_QUEUE_FLUSH_INTERVAL_SEC",
+        default_value=constants.DEFAULT_SCROBBLE_QUEUE_FLUSH_INTERVAL_SEC)
+
+
+def get_scrobble_retry_initial_delay_sec() -> int:
+    return get_int_config(
+        env_key="SCROBBLE_RETRY_INITIAL_DELAY_SEC",
+        default_value=constants.DEFAULT_SCROBBLE_RETRY_INITIAL_DELAY_SEC)
+
+
+def get_scrobble_retry_max_delay_sec() -> int:
+    return get_int_config(
+        env_key="SCROBBLE_RETRY_MAX_DELAY_SEC",
+        default_value=constants.DEFAULT_SCROBBLE_RETRY_MAX_DELAY_SEC)
+
+
+def get_scrobble_queue_max_age_sec() -> int:
+    return get_int_config(
+        env_key="SCROBBLE_QUEUE_MAX_AGE_SEC",
+        default_value=constants.DEFAULT_SCROBBLE_QUEUE_MAX_AGE_SEC)
+
+
+def get_last_fm_batch_window_sec() -> int:
+    return get_int_config(
+        env_key="LAST_FM_BATCH_WINDOW_SEC",
+        default_value=constants.DEFAULT_LAST_FM_BATCH_WINDOW_SEC)
+
+
+def get_last_fm_web_auth_timeout_sec() -> int:
+    return get_int_config(
+        env_key="LAST_FM_WEB_AUTH_TIMEOUT_SEC",
+        default_value=constants.DEFAULT_LAST_FM_WEB_AUTH_TIMEOUT_SEC)
+
+
 def get_config_section_dir(config_subdir: str) -> str:
     p = os.path.join(get_app_config_dir(), config_subdir)
     if not os.path.exists(p):
@@ -82,6 +400,15 @@ def get_subsonic_config_dir() -> str:
     return get_config_section_dir(constants.Constants.SUBSONIC_CONFIG_DIR_NAME.value)
 
 
+def get_cache_dir() -> str:
+    return get_config_section_dir(constants.Constants.CACHE_DIR_NAME.value)
+
+
+def get_cache_file_name(file_name: str) -> str | None:
+    # caches are kept in memory only, unless persistence is enabled
+    return os.path.join(get_cache_dir(), file_name) if get_persist_caches() else None
+
+
 def get_app_config_dir() -> str:
     p = os.path.join(get_config_dir(), constants.Constants.APP_NAME.value)
     if not os.path.exists(p):
@@ -11,6 +11,11 @@ class Constants(Enum):
     APP_NAME = "upnp-scrobbler"
     LAST_FM_CONFIG_DIR_NAME = "last.fm"
     SUBSONIC_CONFIG_DIR_NAME = "subsonic"
+    CACHE_DIR_NAME = "cache"
+    SUBSONIC_SONG_CACHE_FILE = "subsonic_song_cache.json"
+    SUBSONIC_MATCH_CACHE_FILE = "subsonic_match_cache.json"
+    SCROBBLE_QUEUE_FILE = "scrobble_queue.db"
+    DISCOVERY_CACHE_FILE = "discovery_cache.json"
     LAST_FM_SESSION_KEY = "last_fm_session_key"
     LAST_FM_CONFIG = "last_fm_config.env"
     SUBSONIC_SERVER = f"subsonic.{SubsonicConfigFileType.SERVER.value}.env"
@@ -41,6 +46,7 @@ class ConfigParam(Enum):
     SUBSONIC_SERVER_PATH = _ConfigParamData(key=["SUBSONIC_SERVER_PATH"], default_value="")
     SUBSONIC_ENABLE_NOW_PLAYING = _ConfigParamData(key=["SUBSONIC_ENABLE_NOW_PLAYING"], default_value=True)
     SUBSONIC_ENABLE_SONG_MATCH = _ConfigParamData(key=["SUBSONIC_ENABLE_SONG_MATCH"], default_value=True)
+    SUBSONIC_ENABLE_LIBRARY_INDEX = _ConfigParamData(key=["SUBSONIC_ENABLE_LIBRARY_INDEX"], default_value=False)
 
     @property
     def key(self) -> list[str]:
@@ -52,10 +58,63 @@ class ConfigParam(Enum):
 
 
 DEFAULT_DURATION_THRESHOLD: int = 240
+DEFAULT_LOG_LEVEL: str = "INFO"
+DEFAULT_LOG_FORMAT: str = "text"
+DEFAULT_LOG_ASYNC: bool = True
+DEFAULT_METRICS_HOST: str = "0.0.0.0"
+DEFAULT_METRICS_PORT: int = 0
+DEFAULT_POSITION_TRACKING: bool = False
+DEFAULT_POSITION_POLL_PLAYING_SEC: int = 15
+DEFAULT_POSITION_POLL_IDLE_SEC: int = 120
+DEFAULT_RECORD_EVENTS_FILE: str = ""
+DEFAULT_RECORD_EVENTS_MAX_BYTES: int = 10 * 1024 * 1024
+DEFAULT_RECORD_EVENTS_BACKUP_COUNT: int = 5
+DEFAULT_RECORD_EVENTS_FLUSH_INTERVAL_SEC: int = 5
 DEFAULT_DUMP_UPNP_DATA: bool = False
 DEFAULT_DUMP_EVENT_KEYS: bool = False
 DEFAULT_DUMP_EVENT_KEY_VALUES: bool = False
 DEFAULT_ENABLE_NOW_PLAYING: bool = True
+# DEVICE_LIST value for monitoring all the renderers on the network
+DEVICE_LIST_ALL: str = "all"
+# EVENT_FILTER_PROFILE value selecting the profile from the manufacturer/model of the renderer
+DEFAULT_EVENT_FILTER_PROFILE: str = "auto"
+DEFAULT_DISPATCH_QUEUE_SIZE: int = 64
+DEFAULT_DISPATCH_WORKER_COUNT: int = 4
+DEFAULT_PROVIDER_WORKER_COUNT: int = 8
+DEFAULT_PROVIDER_TIMEOUT_SEC: int = 30
+DEFAULT_SCANNER_MAX_CONCURRENCY: int = 8
+DEFAULT_SCANNER_DEVICE_TIMEOUT_SEC: int = 5
+DEFAULT_ENABLE_DISCOVERY_CACHE: bool = True
+DEFAULT_ENABLE_SSDP_LISTENER: bool = True
+DEFAULT_SSDP_SEARCH_INTERVAL_SEC: int = 300
+DEFAULT_SUBSCRIPTION_TIMEOUT_SEC: int = 1800
+DEFAULT_RECONNECT_INITIAL_DELAY_SEC: int = 5
+DEFAULT_RECONNECT_MAX_DELAY_SEC: int = 120
+DEFAULT_RESUBSCRIBE_PERCENT: int = 60
+DEFAULT_SUBSONIC_CONFIG_REFRESH_INTERVAL_SEC: int = 30
+DEFAULT_SUBSONIC_POOL_SIZE: int = 4
+DEFAULT_SUBSONIC_IDLE_TIMEOUT_SEC: int = 300
+DEFAULT_SUBSONIC_REQUEST_TIMEOUT_SEC: int = 30
+DEFAULT_SUBSONIC_SONG_CACHE_SIZE: int = 2000
+DEFAULT_SUBSONIC_SONG_CACHE_TTL_SEC: int = 86400
+DEFAULT_SUBSONIC_SONG_CACHE_NEGATIVE_TTL_SEC: int = 900
+DEFAULT_SUBSONIC_MATCH_CACHE_SIZE: int = 5000
+DEFAULT_SUBSONIC_MATCH_CACHE_TTL_SEC: int = 7 * 86400
+DEFAULT_SUBSONIC_MATCH_CACHE_NEGATIVE_TTL_SEC: int = 6 * 3600
+DEFAULT_SUBSONIC_LIBRARY_REFRESH_INTERVAL_SEC: int = 3600
+DEFAULT_SUBSONIC_LIBRARY_FULL_SYNC_INTERVAL_SEC: int = 7 * 86400
+DEFAULT_SUBSONIC_LIBRARY_PAGE_SIZE: int = 500
+DEFAULT_METADATA_CACHE_SIZE: int = 256
+DEFAULT_METADATA_CACHE_TTL_SEC: int = 3600
+DEFAULT_PERSIST_CACHES: bool = False
+DEFAULT_CACHE_SAVE_INTERVAL_SEC: int = 300
+DEFAULT_SCROBBLE_QUEUE_FLUSH_INTERVAL_SEC: int = 30
+DEFAULT_SCROBBLE_RETRY_INITIAL_DELAY_SEC: int = 30
+DEFAULT_SCROBBLE_RETRY_MAX_DELAY_SEC: int = 3600
+# last.fm does not accept scrobbles older than 14 days
+DEFAULT_SCROBBLE_QUEUE_MAX_AGE_SEC: int = 14 * 24 * 3600
+DEFAULT_LAST_FM_BATCH_WINDOW_SEC: int = 5
+DEFAULT_LAST_FM_WEB_AUTH_TIMEOUT_SEC: int = 300
 
 # we accept new scrobbles for the same song after (seconds) ...
 DEFAULT_MINIMUM_DELTA: float = 10.0
@@ -0,0 +1,145 @@
+import time
+
+from typing import Callable
+
+from dispatcher import Dispatcher
+from event_filter import EventFilter, create_event_filter
+from player_state import PlayerState
+from position_tracker import PositionTracker
+from scrobble_queue import ScrobbleQueue
+from song import Song
+
+
+class DeviceTarget:
+    """A device to be monitored, by url, udn or friendly name."""
+
+    def __init__(self, device_url: str = None, device_udn: str = None, device_name: str = None):
+        self.__device_url: str = device_url
+        self.__device_udn: str = device_udn
+        self.__device_name: str = device_name
+
+    @property
+    def device_url(self) -> str:
+        return self.__device_url
+
+    @property
+    def device_udn(self) -> str:
+        return self.__device_udn
+
+    @property
+    def device_name(self) -> str:
+        return self.__device_name
+
+    @property
+    def label(self) -> str:
+        return self.__device_name or self.__device_udn or self.__device_url
+
+
+def parse_device_target(entry: str) -> DeviceTarget:
+    """An entry of DEVICE_LIST: urls start with http(s)://, udns with uuid:, anything else is a friendly name."""
+    value: str = entry.strip()
+    if value.lower().startswith("http://") or value.lower().startswith("https://"):
+        return DeviceTarget(device_url=value)
+    if value.lower().startswith("uuid:"):
+        return DeviceTarget(device_udn=value)
+    return DeviceTarget(device_name=value)
+
+
+class DeviceState:
+    """Playback state of a monitored device."""
+
+    def __init__(self, name: str):
+        self._name: str = name
+        self._player_state: PlayerState = PlayerState.UNKNOWN
+        self._current_song: Song = None
+        self._previous_song: Song = None
+        self._last_scrobbled: Song = None
+        self._event_filter: EventFilter = create_event_filter()
+        self._position_tracker: PositionTracker = None
+        self._clock: Callable[[], float] = time.time
+        self._dispatcher: Dispatcher = None
+        self._scrobble_queue: ScrobbleQueue = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name: str = value
+
+    @property
+    def player_state(self) -> PlayerState:
+        return self._player_state
+
+    @player_state.setter
+    def player_state(self, value: PlayerState):
+        self._player_state: PlayerState = value
+
+    @property
+    def current_song(self) -> Song:
+        return self._current_song
+
+    @current_song.setter
+    def current_song(self, value: Song):
+        self._current_song: Song = value
+
+    @property
+    def previous_song(self) -> Song:
+        return self._previous_song
+
+    @previous_song.setter
+    def previous_song(self, value: Song):
+        self._previous_song: Song = value
+
+    @property
+    def last_scrobbled(self) -> Song:
+        return self._last_scrobbled
+
+    @last_scrobbled.setter
+    def last_scrobbled(self, value: Song):
+        self._last_scrobbled: Song = value
+
+    @property
+    def event_filter(self) -> EventFilter:
+        return self._event_filter
+
+    @event_filter.setter
+    def event_filter(self, value: EventFilter):
+        self._event_filter: EventFilter = value
+
+    @property
+    def position_tracker(self) -> PositionTracker:
+        """Played time of the current song, None unless POSITION_TRACKING is enabled."""
+        return self._position_tracker
+
+    @position_tracker.setter
+    def position_tracker(self, value: PositionTracker):
+        self._position_tracker: PositionTracker = value
+
+    @property
+    def clock(self) -> Callable[[], float]:
+        """Current time for the event handlers, the replay tool sets the time of the recorded events."""
+        return self._clock
+
+    @clock.setter
+    def clock(self, value: Callable[[], float]):
+        self._clock: Callable[[], float] = value
+
+    @property
+    def dispatcher(self) -> Dispatcher:
+        """Runs the provider jobs of this device, None for the shared dispatcher."""
+        return self._dispatcher
+
+    @dispatcher.setter
+    def dispatcher(self, value: Dispatcher):
+        self._dispatcher: Dispatcher = value
+
+    @property
+    def scrobble_queue(self) -> ScrobbleQueue:
+        """Durable queue of the scrobbles of this device, None for the shared queue."""
+        return self._scrobble_queue
+
+    @scrobble_queue.setter
+    def scrobble_queue(self, value: ScrobbleQueue):
+        self._scrobble_queue: ScrobbleQueue = value
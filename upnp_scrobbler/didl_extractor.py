@@ -0,0 +1,146 @@
+import xmltodict
+
+from xml.parsers import expat
+
+KEY_DIDL_LITE: str = "DIDL-Lite"
+KEY_ITEM: str = "item"
+KEY_RES: str = "res"
+KEY_DURATION: str = "@duration"
+KEY_TEXT: str = "#text"
+KEY_EVENT: str = "Event"
+KEY_INSTANCE_ID: str = "InstanceID"
+KEY_TRANSPORT_STATE: str = "TransportState"
+KEY_VAL: str = "val"
+
+# elements of the item we read, by qualified name as written in the document
+ITEM_KEYS: frozenset[str] = frozenset(["dc:title", "dc:subtitle", "upnp:artist", "upnp:album", KEY_RES])
+
+
+class _Done(Exception):
+    """Raised from the expat handlers to stop parsing once the wanted fields are read."""
+
+
+class _Fallback(Exception):
+    """Raised from the expat handlers when the document needs the full xmltodict parsing."""
+
+
+class _ItemExtractor:
+    """Builds the wanted elements of the item the way xmltodict does.
+
+    Attributes become "@name" keys (with the text as "#text"), repeated elements become lists.
+    Documents with more than one item, or with elements nested in a wanted element, are left
+    to xmltodict.
+    """
+
+    def __init__(self):
+        self.items: dict[str, any] = None
+        self.__depth: int = 0
+        self.__current_key: str = None
+        self.__attributes: dict[str, str] = None
+        self.__text: list[str] = []
+        self.__list_keys: set[str] = set()
+
+    def start(self, name: str, attributes: dict[str, str]):
+        self.__depth += 1
+        if self.__depth == 1:
+            if name != KEY_DIDL_LITE:
+                raise _Done()
+        elif self.__depth == 2:
+            if name == KEY_ITEM:
+                if self.items is not None:
+                    # xmltodict makes a list of items
+                    raise _Fallback()
+                self.items = {}
+        elif self.__current_key:
+            # depth 4, in a wanted element
+            raise _Fallback()
+        elif self.__depth == 3 and self.items is not None and name in ITEM_KEYS:
+            self.__current_key = name
+            self.__attributes = attributes
+            self.__text = []
+
+    def end(self, name: str):
+        if self.__depth == 3 and self.__current_key:
+            self.__add(self.__current_key, self.__get_value())
+            self.__current_key = None
+        self.__depth -= 1
+
+    def data(self, text: str):
+        if self.__current_key:
+            self.__text.append(text)
+
+    def __get_value(self) -> any:
+        text: str = "".join(self.__text).strip() or None
+        if not self.__attributes:
+            return text
+        value: dict[str, str] = {f"@{k}": v for k, v in self.__attributes.items()}
+        if text is not None:
+            value[KEY_TEXT] = text
+        return value
+
+    def __add(self, key: str, value: any):
+        if key not in self.items:
+            self.items[key] = value
+        elif key in self.__list_keys:
+            self.items[key].append(value)
+        else:
+            self.items[key] = [self.items[key], value]
+            self.__list_keys.add(key)
+
+
+class _TransportStateExtractor:
+
+    def __init__(self):
+        self.transport_state: str = None
+        self.__path: list[str] = []
+
+    def start(self, name: str, attributes: dict[str, str]):
+        self.__path.append(name)
+        if (len(self.__path) == 3 and
+                name == KEY_TRANSPORT_STATE and
+                self.__path[0] == KEY_EVENT and
+                self.__path[1] == KEY_INSTANCE_ID):
+            self.transport_state = attributes.get(KEY_VAL)
+            raise _Done()
+
+    def end(self, name: str):
+        self.__path.pop()
+
+
+def extract_didl_item(didl: str) -> dict[str, any]:
+    """Title, subtitle, artist, album and res of the item of a DIDL-Lite document.
+
+    The result is the xmltodict item, restricted to those elements
+    ("dc:title" -> text, "res" -> {"@duration": ..., "#text": ...}, lists for repeated elements).
+    Returns None when there is no item, raises expat.ExpatError on malformed documents.
+    """
+    extractor: _ItemExtractor = _ItemExtractor()
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = extractor.start
+    parser.EndElementHandler = extractor.end
+    parser.CharacterDataHandler = extractor.data
+    try:
+        parser.Parse(didl, True)
+    except _Done:
+        pass
+    except _Fallback:
+        didl_lite: any = xmltodict.parse(didl).get(KEY_DIDL_LITE)
+        return didl_lite.get(KEY_ITEM) if isinstance(didl_lite, dict) else None
+    return extractor.items
+
+
+def extract_transport_state(last_change: str) -> str:
+    """Value of Event/InstanceID/TransportState@val in a LastChange document, None if missing.
+
+    Parsing stops at the TransportState element, raises expat.ExpatError on malformed documents.
+    """
+    extractor: _TransportStateExtractor = _TransportStateExtractor()
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = extractor.start
+    parser.EndElementHandler = extractor.end
+    try:
+        parser.Parse(last_change, True)
+    except _Done:
+        pass
+    return extractor.transport_state
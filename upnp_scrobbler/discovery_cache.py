@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import config
+import constants
+
+from util import print
+
+
+class DiscoveredDevice:
+
+    def __init__(self, udn: str, name: str, location: str, last_seen: float):
+        self.__udn: str = udn
+        self.__name: str = name
+        self.__location: str = location
+        self.__last_seen: float = last_seen
+
+    @property
+    def udn(self) -> str:
+        return self.__udn
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def location(self) -> str:
+        return self.__location
+
+    @property
+    def last_seen(self) -> float:
+        return self.__last_seen
+
+
+class DiscoveryCache:
+    """Known devices (udn -> friendly name and location), stored on disk.
+
+    Devices are added when their description is fetched, SSDP advertisements
+    update their location (alive) or remove them (byebye).
+    Used from the event loop only, save_soon writes the file on a worker thread.
+    """
+
+    def __init__(self, file_name: str):
+        self.__file_name: str = file_name
+        self.__devices: dict[str, DiscoveredDevice] = {}
+        self.__dirty: bool = False
+        # one write at a time, a write never replaces a newer snapshot
+        self.__write_lock: threading.Lock = threading.Lock()
+        self.__snapshot_version: int = 0
+        self.__written_version: int = 0
+
+    def get(self, udn: str) -> DiscoveredDevice:
+        return self.__devices.get(udn.lower())
+
+    def get_locations_by_udn(self, udn: str) -> list[str]:
+        device: DiscoveredDevice = self.__devices.get(udn.lower())
+        return [device.location] if device else []
+
+    def get_locations_by_name(self, name: str) -> list[str]:
+        return list(map(
+            lambda x: x.location,
+            filter(lambda x: x.name == name, self.__devices.values())))
+
+    def put(self, udn: str, name: str, location: str):
+        current: DiscoveredDevice = self.__devices.get(udn.lower())
+        self.__devices[udn.lower()] = DiscoveredDevice(udn=udn, name=name, location=location, last_seen=time.time())
+        # a refresh of last_seen alone is not worth a save
+        if not current or current.name != name or current.location != location:
+            self.__dirty = True
+
+    def update_location(self, udn: str, location: str) -> bool:
+        """Update the location of a known device, returns True if it changed."""
+        current: DiscoveredDevice = self.__devices.get(udn.lower())
+        if not current:
+            return False
+        changed: bool = current.location != location
+        self.__devices[udn.lower()] = DiscoveredDevice(
+            udn=current.udn,
+            name=current.name,
+            location=location,
+            last_seen=time.time())
+        if changed:
+            print(f"DiscoveryCache device [{current.name}] udn [{udn}] moved to [{location}]")
+            self.__dirty = True
+        return changed
+
+    def remove_udn(self, udn: str):
+        if self.__devices.pop(udn.lower(), None):
+            self.__dirty = True
+
+    def remove_location(self, location: str):
+        udn_list: list[str] = list(map(
+            lambda x: x.udn.lower(),
+            filter(lambda x: x.location == location, self.__devices.values())))
+        udn: str
+        for udn in udn_list:
+            del self.__devices[udn]
+            self.__dirty = True
+
+    def load(self):
+        if not os.path.exists(self.__file_name):
+            return
+        try:
+            with open(self.__file_name, "r") as f:
+                data: list[dict[str, any]] = json.load(f)
+        except Exception as ex:
+            print(f"DiscoveryCache cannot load [{self.__file_name}] due to [{type(ex)}] [{ex}]")
+            return
+        self.__devices = dict(map(
+            lambda x: (x["udn"].lower(), DiscoveredDevice(
+                udn=x["udn"],
+                name=x["name"],
+                location=x["location"],
+                last_seen=x["last_seen"])),
+            data))
+        self.__dirty = False
+        print(f"DiscoveryCache loaded [{len(self.__devices)}] devices")
+
+    def save(self):
+        if not self.__dirty:
+            return
+        self.__write(*self.__snapshot())
+
+    def save_soon(self):
+        """Same as save, but the file is written off the event loop, must be called on the event loop."""
+        if not self.__dirty:
+            return
+        asyncio.get_running_loop().run_in_executor(None, self.__write, *self.__snapshot())
+
+    def __snapshot(self) -> tuple[int, list[dict[str, any]]]:
+        self.__snapshot_version += 1
+        self.__dirty = False
+        return self.__snapshot_version, list(map(
+            lambda x: {
+                "udn": x.udn,
+                "name": x.name,
+                "location": x.location,
+                "last_seen": x.last_seen},
+            self.__devices.values()))
+
+    def __write(self, version: int, data: list[dict[str, any]]):
+        tmp_file_name: str = f"{self.__file_name}.tmp"
+        with self.__write_lock:
+            if version < self.__written_version:
+                return
+            try:
+                with open(tmp_file_name, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_file_name, self.__file_name)
+                self.__written_version = version
+            except Exception as ex:
+                print(f"DiscoveryCache cannot save [{self.__file_name}] due to [{type(ex)}] [{ex}]")
+                self.__dirty = True
+
+
+g_discovery_cache: DiscoveryCache = None
+
+
+def get_discovery_cache() -> DiscoveryCache:
+    """The discovery cache, None if it is disabled."""
+    global g_discovery_cache
+    if not config.get_enable_discovery_cache():
+        return None
+    if g_discovery_cache is None:
+        g_discovery_cache = DiscoveryCache(os.path.join(
+            config.get_cache_dir(),
+            constants.Constants.DISCOVERY_CACHE_FILE.value))
+        g_discovery_cache.load()
+    return g_discovery_cache
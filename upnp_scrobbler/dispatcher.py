@@ -0,0 +1,121 @@
+import asyncio
+import concurrent.futures
+
+from typing import Callable
+from util import print
+
+
+class DispatchJob:
+
+    def __init__(self, name: str, fn: Callable[..., any], args: tuple):
+        self.__name: str = name
+        self.__fn: Callable[..., any] = fn
+        self.__args: tuple = args
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def fn(self) -> Callable[..., any]:
+        return self.__fn
+
+    @property
+    def args(self) -> tuple:
+        return self.__args
+
+
+class Dispatcher:
+    """Runs provider jobs (LAST.fm, subsonic) away from the UPnP event loop.
+
+    Jobs are queued on a bounded asyncio queue and consumed by worker tasks,
+    which run the (blocking) provider calls on a thread pool.
+    """
+
+    def __init__(self, queue_size: int, worker_count: int):
+        self.__queue_size: int = queue_size
+        self.__worker_count: int = worker_count
+        self.__queue: asyncio.Queue[DispatchJob] = None
+        self.__executor: concurrent.futures.ThreadPoolExecutor = None
+        self.__workers: list[asyncio.Task] = []
+
+    @property
+    def started(self) -> bool:
+        return self.__queue is not None
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        return self.__executor
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        self.__queue = asyncio.Queue(maxsize=self.__queue_size)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.__worker_count,
+            thread_name_prefix="dispatcher")
+        worker_id: int
+        for worker_id in range(self.__worker_count):
+            self.__workers.append(asyncio.create_task(self.__worker(worker_id)))
+        print(f"Dispatcher started with [{self.__worker_count}] worker(s), queue size [{self.__queue_size}]")
+
+    async def stop(self) -> None:
+        if not self.started:
+            return
+        worker: asyncio.Task
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+        self.__workers = []
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        self.__executor = None
+        self.__queue = None
+
+    def submit(self, name: str, fn: Callable[..., any], *args) -> bool:
+        """Enqueue a job, must be called from the event loop thread.
+
+        When the dispatcher is not started, the job is executed inline.
+        Returns False if the job was dropped because the queue is full.
+        """
+        job: DispatchJob = DispatchJob(name=name, fn=fn, args=args)
+        if not self.started:
+            self.__execute(job)
+            return True
+        try:
+            self.__queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            print(f"Dispatcher queue is full (size [{self.__queue_size}]), dropping job [{name}]")
+            return False
+
+    def submit_unbounded(self, name: str, fn: Callable[..., any], *args) -> None:
+        """Run a job on the thread pool right away, bypassing the job queue.
+
+        Meant for short jobs which must not be dropped, e.g. writing a scrobble
+        to the durable queue when the job queue is full.
+        When the dispatcher is not started, the job is executed inline.
+        """
+        job: DispatchJob = DispatchJob(name=name, fn=fn, args=args)
+        if not self.started:
+            self.__execute(job)
+            return
+        self.__executor.submit(self.__execute, job)
+
+    async def run_blocking(self, fn: Callable[..., any], *args) -> any:
+        """Run a blocking call on the dispatcher thread pool and await its result."""
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, fn, *args)
+
+    async def __worker(self, worker_id: int) -> None:
+        while True:
+            job: DispatchJob = await self.__queue.get()
+            try:
+                await self.run_blocking(self.__execute, job)
+            finally:
+                self.__queue.task_done()
+
+    def __execute(self, job: DispatchJob) -> None:
+        try:
+            job.fn(*job.args)
+        except Exception as ex:
+            print(f"Dispatcher job [{job.name}] failed due to [{type(ex)}] [{ex}]")
@@ -0,0 +1,125 @@
+from typing import Sequence
+
+from async_upnp_client.client import UpnpStateVariable
+from event_name import EventName
+from util import print
+
+import config
+
+EVENT_FILTER_PROFILE_AUTO: str = "auto"
+EVENT_FILTER_PROFILE_DEFAULT: str = "default"
+EVENT_FILTER_PROFILE_NONE: str = "none"
+
+# events made of exactly one of these sets of variables carry nothing we scrobble
+DEFAULT_IGNORED_SETS: frozenset[frozenset[str]] = frozenset([
+    frozenset([EventName.NEXT_AV_TRANSPORT_URI.value, EventName.NEXT_AV_TRANSPORT_URI_META_DATA.value]),
+    frozenset([EventName.LAST_CHANGE.value]),
+    frozenset([EventName.CURRENT_TRACK_DURATION.value])])
+
+# renderers sending several position/progress events per second during playback:
+# events made only of these variables, in any combination, are dropped
+POSITION_IGNORED: frozenset[str] = frozenset().union(*DEFAULT_IGNORED_SETS) | frozenset([
+    EventName.CURRENT_MEDIA_DURATION.value,
+    EventName.CURRENT_TRANSPORT_ACTIONS.value,
+    EventName.RELATIVE_TIME_POSITION.value,
+    EventName.ABSOLUTE_TIME_POSITION.value,
+    EventName.RELATIVE_COUNTER_POSITION.value,
+    EventName.ABSOLUTE_COUNTER_POSITION.value])
+
+PROFILE_IGNORED: dict[str, frozenset[str]] = {
+    EVENT_FILTER_PROFILE_DEFAULT: frozenset(),
+    EVENT_FILTER_PROFILE_NONE: frozenset(),
+    "wiim": POSITION_IGNORED,
+    "upmpdcli": POSITION_IGNORED}
+
+PROFILE_IGNORED_SETS: dict[str, frozenset[frozenset[str]]] = {
+    EVENT_FILTER_PROFILE_DEFAULT: DEFAULT_IGNORED_SETS,
+    EVENT_FILTER_PROFILE_NONE: frozenset(),
+    "wiim": DEFAULT_IGNORED_SETS,
+    "upmpdcli": DEFAULT_IGNORED_SETS}
+
+# lowercase fragments of manufacturer or model name -> profile, for auto selection
+PROFILE_MATCHERS: list[tuple[str, str]] = [
+    ("wiim", "wiim"),
+    ("linkplay", "wiim"),
+    ("upmpdcli", "upmpdcli")]
+
+
+class EventFilter:
+    """Drops uninteresting events before any parsing or logging.
+
+    An event is dropped when its variable names are exactly one of the ignored sets,
+    or when all of them are ignored names. Accepted names override both.
+    """
+
+    def __init__(
+            self,
+            profile: str,
+            ignored: frozenset[str],
+            accepted: frozenset[str] = frozenset(),
+            ignored_sets: frozenset[frozenset[str]] = frozenset()):
+        self.__profile: str = profile
+        self.__ignored: frozenset[str] = ignored - accepted
+        self.__ignored_sets: frozenset[frozenset[str]] = frozenset(filter(
+            lambda x: x.isdisjoint(accepted),
+            ignored_sets))
+        # larger events cannot match an ignored set, no need to build their name set
+        self.__max_set_size: int = max(map(len, self.__ignored_sets), default=0)
+        self.__dropped: int = 0
+
+    @property
+    def profile(self) -> str:
+        return self.__profile
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    def ignores(self, service_variables: Sequence[UpnpStateVariable]) -> bool:
+        if self.__ignores_names(service_variables) or self.__ignores_set(service_variables):
+            self.__dropped += 1
+            return True
+        return False
+
+    def __ignores_names(self, service_variables: Sequence[UpnpStateVariable]) -> bool:
+        ignored: frozenset[str] = self.__ignored
+        if not ignored or len(service_variables) == 0:
+            return False
+        for service_variable in service_variables:
+            if service_variable.name not in ignored:
+                return False
+        return True
+
+    def __ignores_set(self, service_variables: Sequence[UpnpStateVariable]) -> bool:
+        if len(service_variables) > self.__max_set_size:
+            # renderers do not repeat a variable within an event
+            return False
+        return frozenset(map(lambda x: x.name, service_variables)) in self.__ignored_sets
+
+
+def get_profile_name(manufacturer: str, model_name: str) -> str:
+    profile: str = config.get_event_filter_profile().lower()
+    if profile != EVENT_FILTER_PROFILE_AUTO:
+        if profile in PROFILE_IGNORED:
+            return profile
+        print(f"get_profile_name unknown event filter profile [{profile}], using [{EVENT_FILTER_PROFILE_DEFAULT}]")
+        return EVENT_FILTER_PROFILE_DEFAULT
+    device: str = f"{manufacturer or ''} {model_name or ''}".lower()
+    fragment: str
+    matched: str
+    for fragment, matched in PROFILE_MATCHERS:
+        if fragment in device:
+            return matched
+    return EVENT_FILTER_PROFILE_DEFAULT
+
+
+def create_event_filter(manufacturer: str = None, model_name: str = None) -> EventFilter:
+    """Filter for a renderer, from EVENT_FILTER_PROFILE (or its manufacturer/model) and the extra rules."""
+    profile: str = get_profile_name(manufacturer=manufacturer, model_name=model_name)
+    ignored: frozenset[str] = PROFILE_IGNORED[profile] | frozenset(config.get_event_filter_ignore())
+    accepted: frozenset[str] = frozenset(config.get_event_filter_accept())
+    return EventFilter(
+        profile=profile,
+        ignored=ignored,
+        accepted=accepted,
+        ignored_sets=PROFILE_IGNORED_SETS[profile])
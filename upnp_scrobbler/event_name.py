@@ -12,3 +12,9 @@ class EventName(Enum):
     NEXT_AV_TRANSPORT_URI = "NextAVTransportURI"
     NEXT_AV_TRANSPORT_URI_META_DATA = "NextAVTransportURIMetaData"
     CURRENT_TRACK_DURATION = "CurrentTrackDuration"
+    CURRENT_MEDIA_DURATION = "CurrentMediaDuration"
+    CURRENT_TRANSPORT_ACTIONS = "CurrentTransportActions"
+    RELATIVE_TIME_POSITION = "RelativeTimePosition"
+    ABSOLUTE_TIME_POSITION = "AbsoluteTimePosition"
+    RELATIVE_COUNTER_POSITION = "RelativeCounterPosition"
+    ABSOLUTE_COUNTER_POSITION = "AbsoluteCounterPosition"
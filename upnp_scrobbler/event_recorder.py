@@ -0,0 +1,114 @@
+import collections
+import gzip
+import json
+import os
+import threading
+import time
+
+from typing import Sequence
+
+from async_upnp_client.client import UpnpStateVariable
+from util import print
+
+GZIP_SUFFIX: str = ".gz"
+
+# records waiting for the next flush, newer records are dropped beyond this
+MAX_PENDING_RECORDS: int = 10000
+
+
+def get_backup_name(file_name: str, index: int) -> str:
+    """events.ndjson.gz -> events.<index>.ndjson.gz, so that backups keep the suffixes."""
+    base: str = file_name[:-len(GZIP_SUFFIX)] if file_name.endswith(GZIP_SUFFIX) else file_name
+    gzip_suffix: str = GZIP_SUFFIX if file_name.endswith(GZIP_SUFFIX) else ""
+    root: str
+    ext: str
+    root, ext = os.path.splitext(base)
+    return f"{root}.{index}{ext}{gzip_suffix}"
+
+
+class EventRecorder:
+    """Records every received service variable set as newline-delimited json, for the replay tool.
+
+    Each line is {"t": monotonic seconds, "device": udn, "service": service type, "variables": {...}}.
+    record only appends to a buffer, flush (run off the event loop) serializes and writes it.
+    A file name ending with .gz is written as gzip, one member per flush.
+    The file is rotated when it would exceed max_bytes, keeping backup_count older files.
+    """
+
+    def __init__(self, file_name: str, max_bytes: int, backup_count: int):
+        self.__file_name: str = file_name
+        self.__max_bytes: int = max_bytes
+        self.__backup_count: int = backup_count
+        self.__compress: bool = file_name.endswith(GZIP_SUFFIX)
+        self.__pending: collections.deque[tuple[float, str, str, list[tuple[str, any]]]] = collections.deque()
+        # one flush at a time
+        self.__lock: threading.Lock = threading.Lock()
+        self.__recorded: int = 0
+        self.__dropped: int = 0
+        self.__dropped_reported: int = 0
+
+    @property
+    def file_name(self) -> str:
+        return self.__file_name
+
+    @property
+    def recorded(self) -> int:
+        return self.__recorded
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    def record(self, device: str, service_type: str, service_variables: Sequence[UpnpStateVariable]):
+        if len(self.__pending) >= MAX_PENDING_RECORDS:
+            self.__dropped += 1
+            return
+        self.__pending.append((
+            time.monotonic(),
+            device,
+            service_type,
+            list(map(lambda x: (x.name, x.value), service_variables))))
+
+    def flush(self) -> int:
+        """Write the pending records, returns how many were written."""
+        with self.__lock:
+            if self.__dropped > self.__dropped_reported:
+                print(f"EventRecorder dropped [{self.__dropped - self.__dropped_reported}] records, "
+                      f"more than [{MAX_PENDING_RECORDS}] were pending")
+                self.__dropped_reported = self.__dropped
+            lines: list[str] = []
+            while len(self.__pending) > 0:
+                t, device, service_type, variables = self.__pending.popleft()
+                lines.append(json.dumps(
+                    {"t": round(t, 3), "device": device, "service": service_type, "variables": dict(variables)},
+                    default=str))
+            if len(lines) == 0:
+                return 0
+            data: bytes = ("\n".join(lines) + "\n").encode("utf-8")
+            if self.__compress:
+                data = gzip.compress(data)
+            try:
+                self.__maybe_rotate(len(data))
+                with open(self.__file_name, "ab") as f:
+                    f.write(data)
+            except Exception as ex:
+                print(f"EventRecorder cannot write [{len(lines)}] records to [{self.__file_name}] "
+                      f"due to [{type(ex)}] [{ex}]")
+                return 0
+            self.__recorded += len(lines)
+            return len(lines)
+
+    def __maybe_rotate(self, incoming_bytes: int):
+        current_bytes: int = os.path.getsize(self.__file_name) if os.path.exists(self.__file_name) else 0
+        if current_bytes == 0 or current_bytes + incoming_bytes <= self.__max_bytes:
+            return
+        if self.__backup_count <= 0:
+            os.remove(self.__file_name)
+            return
+        index: int
+        for index in range(self.__backup_count - 1, 0, -1):
+            source: str = get_backup_name(self.__file_name, index)
+            if os.path.exists(source):
+                os.replace(source, get_backup_name(self.__file_name, index + 1))
+        os.replace(self.__file_name, get_backup_name(self.__file_name, 1))
+        print(f"EventRecorder rotated [{self.__file_name}] at [{current_bytes}] bytes")
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+import webbrowser
+import xml.dom.minidom
+import pylast
+import config
+import constants
+from backoff import Backoff
+from util import print
+
+
+# the network is built once and shared by all provider jobs
+g_network: pylast.LastFMNetwork = None
+g_network_credentials: tuple[str, ...] = None
+g_network_lock: threading.Lock = threading.Lock()
+
+# errors which mean that the session key or credentials are not valid anymore
+AUTH_ERROR_ID_LIST: list[int] = [
+    pylast.STATUS_AUTH_FAILED,
+    pylast.STATUS_INVALID_SK,
+    pylast.STATUS_INVALID_API_KEY]
+
+# maximum number of tracks accepted by a single track.scrobble call
+MAX_SCROBBLE_BATCH_SIZE: int = 50
+
+# polling of the web authorization, while the user has not granted access yet
+WEB_AUTH_POLL_INITIAL_DELAY_SEC: float = 1.0
+WEB_AUTH_POLL_MAX_DELAY_SEC: float = 10.0
+
+
+def get_credentials() -> tuple[str, ...]:
+    """What the network is built from: the env credentials and the version of the session key file."""
+    return (
+        os.getenv("LAST_FM_API_KEY"),
+        os.getenv("LAST_FM_SHARED_SECRET"),
+        os.getenv("LAST_FM_USERNAME"),
+        os.getenv("LAST_FM_PASSWORD_HASH"),
+        os.getenv("LAST_FM_PASSWORD"),
+        get_session_key_file_version())
+
+
+def get_session_key_file_version() -> str:
+    """Modification time of the session key file, None when it does not exist."""
+    try:
+        return str(os.stat(get_last_fm_session_key_file_name()).st_mtime_ns)
+    except OSError:
+        return None
+
+
+def get_last_fm_network(interactive: bool = False) -> pylast.LastFMNetwork:
+    """Get the shared network, building it on first use or after credentials or the session key file changed.
+
+    Only an interactive call (at startup) asks the user to authorize a missing session key,
+    otherwise the call fails, so the scrobble stays queued and is retried.
+    """
+    global g_network
+    global g_network_credentials
+    credentials: tuple[str, ...] = get_credentials()
+    with g_network_lock:
+        if g_network is None or credentials != g_network_credentials:
+            if g_network is not None:
+                print("get_last_fm_network LAST.fm credentials changed, rebuilding network")
+            g_network = create_last_fm_network(interactive=interactive)
+            # the session key file might have been written meanwhile
+            g_network_credentials = get_credentials() if g_network else None
+        return g_network
+
+
+def invalidate_last_fm_network():
+    """Drop the shared network, next call to get_last_fm_network builds a new one."""
+    global g_network
+    global g_network_credentials
+    with g_network_lock:
+        g_network = None
+        g_network_credentials = None
+
+
+def invalidate_on_auth_error(ex: pylast.WSError):
+    if int(ex.get_id()) in AUTH_ERROR_ID_LIST:
+        print(f"LAST.fm authentication error [{ex.get_id()}] [{ex}], network will be rebuilt")
+        invalidate_last_fm_network()
+
+
+def scrobble_many(network: pylast.LastFMNetwork, track_list: list[dict[str, any]]) -> list[int]:
+    """Scrobble up to MAX_SCROBBLE_BATCH_SIZE tracks with a single track.scrobble request.
+
+    Tracks are dicts with the same keys as the arguments of network.scrobble.
+    pylast's scrobble_many discards the response, so we send the request
+    ourselves and return the ignoredMessage code of each track (0 = accepted),
+    in the same order as track_list.
+    """
+    if len(track_list) > MAX_SCROBBLE_BATCH_SIZE:
+        raise ValueError(f"Cannot scrobble more than [{MAX_SCROBBLE_BATCH_SIZE}] tracks at once")
+    params: dict[str, any] = {}
+    i: int
+    track: dict[str, any]
+    for i, track in enumerate(track_list):
+        params[f"artist[{i}]"] = track["artist"]
+        params[f"track[{i}]"] = track["title"]
+        params[f"timestamp[{i}]"] = track["timestamp"]
+        if track.get("album"): params[f"album[{i}]"] = track["album"]
+        if track.get("duration"): params[f"duration[{i}]"] = track["duration"]
+    result: list[int] = get_ignored_codes(execute_request(network, "track.scrobble", params))
+    if len(result) != len(track_list):
+        raise pylast.MalformedResponseError(
+            network,
+            Exception(f"Expected [{len(track_list)}] scrobble results, got [{len(result)}]"))
+    return result
+
+
+def execute_request(
+        network: pylast.LastFMNetwork,
+        method_name: str,
+        params: dict[str, any]) -> xml.dom.minidom.Document:
+    """Signed POST of a LAST.fm api method, returns the parsed response.
+
+    pylast has no public call returning the response of a write method, so this uses
+    the private pylast._Request, checked against pylast 7.0.0 (pinned in requirements.txt).
+    Nothing else in the scrobbler touches pylast internals.
+    """
+    return pylast._Request(network, method_name, params).execute()
+
+
+def get_ignored_codes(doc: xml.dom.minidom.Document) -> list[int]:
+    """ignoredMessage code of each scrobble element of a track.scrobble response, 0 when accepted."""
+    result: list[int] = []
+    element: xml.dom.minidom.Element
+    for element in doc.getElementsByTagName("scrobble"):
+        ignored_list: list[xml.dom.minidom.Element] = element.getElementsByTagName("ignoredMessage")
+        code: str = ignored_list[0].getAttribute("code") if len(ignored_list) > 0 else None
+        result.append(int(code) if code else 0)
+    return result
+
+
+def create_last_fm_network(interactive: bool = False) -> pylast.LastFMNetwork:
+    if not config.is_last_fm_configured():
+        print("create_last_fm_network LAST.fm is not configured")
+        return None
+    last_fm_key: str = os.getenv("LAST_FM_API_KEY")
+    last_fm_secret: str = os.getenv("LAST_FM_SHARED_SECRET")
+    last_fm_username: str = os.getenv("LAST_FM_USERNAME")
+    last_fm_password_hash: str = os.getenv("LAST_FM_PASSWORD_HASH")
+    last_fm_password: str = os.getenv("LAST_FM_PASSWORD")
+    if last_fm_key and last_fm_secret and last_fm_username and (last_fm_password_hash or last_fm_password):
+        return create_last_fm_network_legacy(
+            last_fm_key=last_fm_key,
+            last_fm_secret=last_fm_secret,
+            last_fm_username=last_fm_username,
+            last_fm_password_hash=last_fm_password_hash,
+            last_fm_password=last_fm_password)
+    elif last_fm_key and last_fm_secret:
+        # create a new or use existing session key.
+        return create_last_fm_network_session_key(
+            last_fm_key=last_fm_key,
+            last_fm_secret=last_fm_secret,
+            interactive=interactive)
+    else:
+        # cannot enable last.fm
+        # should be allowed only if last.fm is disabled
+        return None
+
+
+def get_last_fm_session_key_file_name() -> str:
+    return os.path.join(
+        config.get_app_config_dir(),
+        constants.Constants.LAST_FM_CONFIG_DIR_NAME.value,
+        constants.Constants.LAST_FM_SESSION_KEY.value)
+
+
+def create_last_fm_network_session_key(
+        last_fm_key: str,
+        last_fm_secret: str,
+        interactive: bool = False) -> pylast.LastFMNetwork:
+    session_key_dir = os.path.join(
+        config.get_app_config_dir(),
+        constants.Constants.LAST_FM_CONFIG_DIR_NAME.value)
+    os.makedirs(name=session_key_dir, exist_ok=True)
+    session_key_file_name = get_last_fm_session_key_file_name()
+    network: pylast.LastFMNetwork = pylast.LastFMNetwork(last_fm_key, last_fm_secret)
+    # TODO can we allow to dump key and secret?
+    # print(f"Last.FM key [{last_fm_key}] secret [{last_fm_secret}]")
+    session_key_file_exists: bool = os.path.exists(session_key_file_name)
+    # can we validate the LAST.fm connection?
+    if not session_key_file_exists:
+        print(f"LAST.fm session file does not exist at path [{session_key_file_name}]")
+        if not interactive:
+            # never wait for the user on a provider thread, it would hold g_network_lock
+            raise Exception(f"LAST.fm is not authorized, restart to authorize, "
+                            f"session file [{session_key_file_name}] is missing")
+        session_key = get_web_auth_session_key(network, config.get_last_fm_web_auth_timeout_sec())
+        with open(session_key_file_name, "w") as f:
+            print(f"Saving LAST.fm session file at path [{session_key_file_name}]")
+            f.write(session_key)
+    else:
+        session_key = open(session_key_file_name).read()
+    network.session_key = session_key
+    return network
+
+
+def get_web_auth_session_key(network: pylast.LastFMNetwork, timeout_sec: float) -> str:
+    """Ask the user to authorize this script in the browser and wait for it, up to timeout_sec."""
+    skg: pylast.SessionKeyGenerator = pylast.SessionKeyGenerator(network)
+    url = skg.get_web_auth_url()
+    print(f"Please authorize this script to access your account: {url}\n")
+    webbrowser.open(url)
+    backoff: Backoff = Backoff(
+        initial_delay_sec=WEB_AUTH_POLL_INITIAL_DELAY_SEC,
+        max_delay_sec=WEB_AUTH_POLL_MAX_DELAY_SEC)
+    deadline: float = time.monotonic() + timeout_sec
+    while True:
+        try:
+            return skg.get_web_auth_session_key(url)
+        except pylast.WSError as ex:
+            if int(ex.get_id()) == 14:
+                # dump the unexpected error
+                # print(f"LAST.fm authorization failed [{type(ex)}] [{ex.get_id()}] [{ex}]")
+                # keep going!
+                pass
+            else:
+                print(f"LAST.fm authorization failed [{type(ex)}] id [{ex.get_id()}] [{ex}]")
+        except Exception as genericEx:
+            print(f"LAST.fm authorization failed (generic exception) [{type(genericEx)}] [{genericEx}]")
+        if time.monotonic() >= deadline:
+            raise Exception(f"LAST.fm authorization not granted within [{timeout_sec}] sec")
+        backoff.wait_sync()
+
+
+def create_last_fm_network_legacy(
+        last_fm_key: str,
+        last_fm_secret: str,
+        last_fm_username: str,
+        last_fm_password_hash: str = None,
+        last_fm_password: str = None) -> pylast.LastFMNetwork:
+    if not last_fm_password_hash and not last_fm_password:
+        raise Exception("One between last_fm_password_hash and last_fm_password must be provided")
+    if not last_fm_password_hash:
+        # try cleartext, not recommended
+        last_fm_password_hash = pylast.md5(last_fm_password)
+    network: pylast.LastFMNetwork = pylast.LastFMNetwork(
+        api_key=last_fm_key,
+        api_secret=last_fm_secret,
+        username=last_fm_username,
+        password_hash=last_fm_password_hash)
+    return network
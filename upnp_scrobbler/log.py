@@ -0,0 +1,99 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from typing import Callable
+
+import config
+import constants
+
+from util import TimestampFormatter, get_logger
+
+LOG_FORMAT_TEXT: str = "text"
+LOG_FORMAT_JSON: str = "json"
+
+g_listener: logging.handlers.QueueListener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One json object per line: ts, level, logger, message (and exception)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()}
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+class LazyMessage:
+    """Defers a call until the record is formatted, see lazy."""
+
+    def __init__(self, fn: Callable[..., any], *args):
+        self.__fn: Callable[..., any] = fn
+        self.__args: tuple = args
+
+    def __str__(self) -> str:
+        return str(self.__fn(*self.__args))
+
+
+def lazy(fn: Callable[..., any], *args) -> LazyMessage:
+    """Argument computed only if the record is emitted, e.g. logger.debug("song [%s]", lazy(song_to_string, song))."""
+    return LazyMessage(fn, *args)
+
+
+def get_level(name: str) -> int:
+    level: int = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        print(f"Unknown LOG_LEVEL [{name}], using [{constants.DEFAULT_LOG_LEVEL}]", file=sys.stderr)
+        return logging.getLevelName(constants.DEFAULT_LOG_LEVEL)
+    return level
+
+
+def setup_logging():
+    """Configure the application logger from LOG_LEVEL, LOG_FORMAT and LOG_ASYNC.
+
+    With LOG_ASYNC, records are put on a queue and written to stdout by a
+    listener thread, so logging never blocks the event loop on stdout.
+    """
+    global g_listener
+    stop_logging()
+    logger: logging.Logger = get_logger()
+    stream_handler: logging.Handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        JsonFormatter() if config.get_log_format().lower() == LOG_FORMAT_JSON else TimestampFormatter())
+    handler: logging.Handler = stream_handler
+    if config.get_log_async():
+        record_queue: queue.SimpleQueue = queue.SimpleQueue()
+        g_listener = logging.handlers.QueueListener(record_queue, stream_handler)
+        g_listener.start()
+        handler = logging.handlers.QueueHandler(record_queue)
+    existing: logging.Handler
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+    logger.setLevel(get_level(config.get_log_level()))
+
+
+def stop_logging():
+    """Write out the queued records, logging goes on synchronously afterwards."""
+    global g_listener
+    if g_listener is None:
+        return
+    stream_handlers: tuple[logging.Handler, ...] = g_listener.handlers
+    g_listener.stop()
+    g_listener = None
+    logger: logging.Logger = get_logger()
+    existing: logging.Handler
+    for existing in list(logger.handlers):
+        if isinstance(existing, logging.handlers.QueueHandler):
+            logger.removeHandler(existing)
+    handler: logging.Handler
+    for handler in stream_handlers:
+        logger.addHandler(handler)
@@ -0,0 +1,229 @@
+import bisect
+import threading
+
+from aiohttp import web
+from util import print
+
+DEFAULT_BUCKETS: tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH: str = "/metrics"
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = None) -> str:
+    parts: list[str] = list(map(
+        lambda x: f"{x[0]}=\"{escape_label_value(x[1])}\"",
+        zip(label_names, label_values)))
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if len(parts) > 0 else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with labels, thread-safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.__name: str = name
+        self.__help_text: str = help_text
+        self.__label_names: tuple[str, ...] = label_names
+        self.__lock: threading.Lock = threading.Lock()
+        self.__values: dict[tuple[str, ...], float] = {}
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self.__lock:
+            self.__values[label_values] = self.__values.get(label_values, 0.0) + amount
+
+    def get(self, *label_values: str) -> float:
+        with self.__lock:
+            return self.__values.get(label_values, 0.0)
+
+    def render(self) -> list[str]:
+        with self.__lock:
+            values: list[tuple[tuple[str, ...], float]] = list(self.__values.items())
+        result: list[str] = [
+            f"# HELP {self.__name} {self.__help_text}",
+            f"# TYPE {self.__name} counter"]
+        label_values: tuple[str, ...]
+        value: float
+        for label_values, value in values:
+            result.append(f"{self.__name}{format_labels(self.__label_names, label_values)} {format_value(value)}")
+        return result
+
+
+class Histogram:
+    """Cumulative histogram with labels, thread-safe."""
+
+    def __init__(
+            self,
+            name: str,
+            help_text: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.__name: str = name
+        self.__help_text: str = help_text
+        self.__label_names: tuple[str, ...] = label_names
+        self.__buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self.__lock: threading.Lock = threading.Lock()
+        # label values -> (bucket counts, sum, count)
+        self.__values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    def observe(self, value: float, *label_values: str):
+        index: int = bisect.bisect_left(self.__buckets, value)
+        with self.__lock:
+            current: tuple[list[int], float, int] = self.__values.get(label_values)
+            if current is None:
+                current = ([0] * len(self.__buckets), 0.0, 0)
+            bucket_counts: list[int] = current[0]
+            if index < len(bucket_counts):
+                bucket_counts[index] += 1
+            self.__values[label_values] = (bucket_counts, current[1] + value, current[2] + 1)
+
+    def get_count(self, *label_values: str) -> int:
+        with self.__lock:
+            current: tuple[list[int], float, int] = self.__values.get(label_values)
+            return current[2] if current else 0
+
+    def render(self) -> list[str]:
+        with self.__lock:
+            values: list[tuple[tuple[str, ...], tuple[list[int], float, int]]] = list(map(
+                lambda x: (x[0], (list(x[1][0]), x[1][1], x[1][2])),
+                self.__values.items()))
+        result: list[str] = [
+            f"# HELP {self.__name} {self.__help_text}",
+            f"# TYPE {self.__name} histogram"]
+        label_values: tuple[str, ...]
+        for label_values, (bucket_counts, total, count) in values:
+            cumulative: int = 0
+            bound: float
+            bucket_count: int
+            for bound, bucket_count in zip(self.__buckets, bucket_counts):
+                cumulative += bucket_count
+                labels: str = format_labels(self.__label_names, label_values, f"le=\"{format_value(bound)}\"")
+                result.append(f"{self.__name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.__label_names, label_values, "le=\"+Inf\"")
+            result.append(f"{self.__name}_bucket{labels} {count}")
+            labels = format_labels(self.__label_names, label_values)
+            result.append(f"{self.__name}_sum{labels} {format_value(total)}")
+            result.append(f"{self.__name}_count{labels} {count}")
+        return result
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.__metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        metric: Counter = Counter(name=name, help_text=help_text, label_names=label_names)
+        self.__metrics.append(metric)
+        return metric
+
+    def histogram(
+            self,
+            name: str,
+            help_text: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric: Histogram = Histogram(name=name, help_text=help_text, label_names=label_names, buckets=buckets)
+        self.__metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        metric: Counter | Histogram
+        for metric in self.__metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+g_registry: MetricsRegistry = MetricsRegistry()
+
+# set once the endpoint is up, metrics which are costly to label are skipped until then
+g_enabled: bool = False
+
+g_events: Counter = g_registry.counter(
+    "upnp_scrobbler_events_total",
+    "Events which passed the event filter, by device, service and set of variables",
+    ("device", "service", "variables"))
+g_events_filtered: Counter = g_registry.counter(
+    "upnp_scrobbler_events_filtered_total",
+    "Events dropped by the event filter, by device and filter profile",
+    ("device", "profile"))
+g_events_ignored: Counter = g_registry.counter(
+    "upnp_scrobbler_events_ignored_total",
+    "Events which passed the filter but carried neither metadata nor player state",
+    ("device",))
+g_scrobbles_armed: Counter = g_registry.counter(
+    "upnp_scrobbler_scrobbles_armed_total",
+    "Scrobbles armed by the event handlers",
+    ("device",))
+g_scrobbles_executed: Counter = g_registry.counter(
+    "upnp_scrobbler_scrobbles_executed_total",
+    "Scrobbles handed to the providers",
+    ("device",))
+g_scrobbles_rejected: Counter = g_registry.counter(
+    "upnp_scrobbler_scrobbles_rejected_total",
+    "Armed scrobbles not executed, reason is threshold (played too little) "
+    "or minimum_delta (same song again too early)",
+    ("device", "reason"))
+g_scrobbles_deferred: Counter = g_registry.counter(
+    "upnp_scrobbler_scrobbles_deferred_total",
+    "Executed scrobbles left to the queue flush because the dispatcher queue was full",
+    ("device",))
+g_position_fallbacks: Counter = g_registry.counter(
+    "upnp_scrobbler_position_fallbacks_total",
+    "Scrobble decisions on the time since the song was first seen, its position was not polled yet",
+    ("device",))
+g_provider_duration: Histogram = g_registry.histogram(
+    "upnp_scrobbler_provider_duration_seconds",
+    "Duration of provider calls, provider is last.fm or subsonic:<subsonic_key>",
+    ("provider", "operation"))
+g_provider_errors: Counter = g_registry.counter(
+    "upnp_scrobbler_provider_errors_total",
+    "Failed provider calls, provider is last.fm or subsonic:<subsonic_key>",
+    ("provider", "operation"))
+g_discovery_duration: Histogram = g_registry.histogram(
+    "upnp_scrobbler_discovery_duration_seconds",
+    "Duration of device discovery, phase is search (SSDP) or describe (device descriptions)",
+    ("phase",))
+g_resubscribe_duration: Histogram = g_registry.histogram(
+    "upnp_scrobbler_resubscribe_duration_seconds",
+    "Duration of subscription renewals, by device and service",
+    ("device", "service"))
+g_resubscribe_failures: Counter = g_registry.counter(
+    "upnp_scrobbler_resubscribe_failures_total",
+    "Subscription renewals which failed",
+    ("device", "service"))
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=g_registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve the metrics at http://host:port/metrics, returns the runner for cleanup."""
+    global g_enabled
+    app: web.Application = web.Application()
+    app.router.add_get(METRICS_PATH, handle_metrics)
+    runner: web.AppRunner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site: web.TCPSite = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    g_enabled = True
+    print(f"start_metrics_server serving metrics on [{host}:{port}{METRICS_PATH}]")
+    return runner
@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+from typing import Callable
+
+from async_upnp_client.client import UpnpService
+
+import config
+
+from song import Song, copy_song, same_song, song_to_short_string
+from util import duration_str_to_sec
+from util import print
+
+ACTION_GET_TRANSPORT_INFO: str = "GetTransportInfo"
+ACTION_GET_POSITION_INFO: str = "GetPositionInfo"
+TRANSPORT_STATE_PLAYING: str = "PLAYING"
+
+# never poll more often than this, whatever the scrobble point
+MIN_POLL_DELAY_SEC: float = 1.0
+# position progress beyond the elapsed time plus this is a seek, not playback
+SEEK_TOLERANCE_SEC: float = 2.0
+# same assumption as execute_scrobble for songs without duration
+UNKNOWN_DURATION_SEC: float = 120.0
+
+
+def get_scrobble_point_sec(song: Song) -> float:
+    """Played time after which a song can be scrobbled: the threshold or half the duration, whichever first."""
+    song_duration: float = song.duration if song.duration else UNKNOWN_DURATION_SEC
+    return min(float(config.get_duration_threshold()), song_duration / 2.0)
+
+
+def position_to_sec(position: str) -> float:
+    """RelTime of GetPositionInfo in seconds, None when the renderer does not provide it."""
+    if not position or ":" not in position:
+        # e.g. NOT_IMPLEMENTED
+        return None
+    try:
+        return duration_str_to_sec(position)
+    except ValueError:
+        return None
+
+
+class PositionTracker:
+    """Accumulates the time actually played for the current song of a renderer.
+
+    The renderer is polled with GetTransportInfo and, while playing, GetPositionInfo:
+    every poll_playing_sec during playback, and right when the scrobble point is due,
+    every poll_idle_sec otherwise. Pauses do not count, seeks count the elapsed time only.
+    The first poll after playback stops still reads the position, so the time played since
+    the previous poll is not lost.
+    When the played time reaches the scrobble point, on_scrobble_point is called with the song,
+    without waiting for the next track change. wake() polls immediately, e.g. on a new event.
+    monotonic measures the time between polls, clock is the time of Song.playback_start.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            service: UpnpService,
+            get_current_song: Callable[[], Song],
+            on_scrobble_point: Callable[[Song], None],
+            poll_playing_sec: float,
+            poll_idle_sec: float,
+            monotonic: Callable[[], float] = time.monotonic,
+            clock: Callable[[], float] = time.time):
+        self.__name: str = name
+        self.__service: UpnpService = service
+        self.__get_current_song: Callable[[], Song] = get_current_song
+        self.__on_scrobble_point: Callable[[Song], None] = on_scrobble_point
+        self.__poll_playing_sec: float = poll_playing_sec
+        self.__poll_idle_sec: float = poll_idle_sec
+        self.__monotonic: Callable[[], float] = monotonic
+        self.__clock: Callable[[], float] = clock
+        self.__wake_up: asyncio.Event = asyncio.Event()
+        self.__song: Song = None
+        self.__played_sec: float = 0.0
+        self.__playing: bool = False
+        self.__last_poll: float = None
+        self.__last_position: float = None
+        self.__scrobble_point_reached: bool = False
+        self.__polls: int = 0
+
+    @property
+    def polls(self) -> int:
+        return self.__polls
+
+    def wake(self):
+        self.__wake_up.set()
+
+    def played_sec(self, song: Song) -> float:
+        """Time played for song, up to now, None when song is not the tracked one."""
+        if self.__song is None or not same_song(song, self.__song):
+            return None
+        played: float = self.__played_sec
+        if self.__playing and self.__last_poll is not None:
+            played += self.__monotonic() - self.__last_poll
+        return played
+
+    async def run(self):
+        while True:
+            delay_sec: float = self.__poll_idle_sec
+            try:
+                delay_sec = await self.poll()
+            except Exception as ex:
+                print(f"PositionTracker [{self.__name}] poll failed due to [{type(ex)}] [{ex}]")
+            try:
+                await asyncio.wait_for(self.__wake_up.wait(), timeout=delay_sec)
+            except asyncio.TimeoutError:
+                pass
+            self.__wake_up.clear()
+
+    async def poll(self) -> float:
+        """Update the played time, returns the delay until the next poll."""
+        self.__polls += 1
+        transport_info: dict[str, any] = await self.__service.action(ACTION_GET_TRANSPORT_INFO).async_call(
+            InstanceID=0)
+        playing: bool = transport_info.get("CurrentTransportState") == TRANSPORT_STATE_PLAYING
+        position: float = None
+        if playing or self.__playing:
+            # also right after playback stopped, for the time played since the last poll
+            position_info: dict[str, any] = await self.__service.action(ACTION_GET_POSITION_INFO).async_call(
+                InstanceID=0)
+            position = position_to_sec(position_info.get("RelTime"))
+        now: float = self.__monotonic()
+        current_song: Song = self.__get_current_song()
+        if current_song is None:
+            self.__song = None
+        elif self.__song is None or not same_song(current_song, self.__song):
+            # a new track: right after a track change some renderers still report the previous position
+            self.__song = copy_song(current_song)
+            self.__played_sec = (min(position, max(0.0, self.__clock() - current_song.playback_start))
+                                 if position is not None
+                                 else 0.0)
+            self.__scrobble_point_reached = False
+        elif self.__playing and self.__last_poll is not None:
+            elapsed: float = now - self.__last_poll
+            if position is None or self.__last_position is None:
+                self.__played_sec += elapsed
+            elif position >= self.__last_position:
+                # a forward seek counts the elapsed time only
+                self.__played_sec += min(position - self.__last_position, elapsed + SEEK_TOLERANCE_SEC)
+            elif not playing:
+                # stopped, the position went back to the start
+                self.__played_sec += elapsed
+            else:
+                # seek back, or the track restarted
+                self.__played_sec += min(position, elapsed)
+        self.__playing = playing
+        self.__last_poll = now
+        self.__last_position = position
+        if self.__song is None or not playing:
+            return self.__poll_idle_sec
+        remaining_sec: float = get_scrobble_point_sec(self.__song) - self.__played_sec
+        if not self.__scrobble_point_reached and remaining_sec <= 0:
+            self.__scrobble_point_reached = True
+            print(f"PositionTracker [{self.__name}] scrobble point reached for "
+                  f"[{song_to_short_string(self.__song)}] played [{self.__played_sec:.1f}] sec")
+            self.__on_scrobble_point(copy_song(current_song))
+        if self.__scrobble_point_reached:
+            return self.__poll_playing_sec
+        return max(MIN_POLL_DELAY_SEC, min(self.__poll_playing_sec, remaining_sec))
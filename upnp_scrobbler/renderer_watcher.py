@@ -0,0 +1,238 @@
+import asyncio
+
+from typing import Callable
+
+from async_upnp_client.advertisement import SsdpAdvertisementListener
+from async_upnp_client.client import UpnpDevice
+from async_upnp_client.ssdp import udn_from_headers
+from async_upnp_client.utils import CaseInsensitiveDict
+from discovery_cache import DiscoveryCache, get_discovery_cache
+from util import print
+
+import scanner
+
+MEDIA_RENDERER_DEVICE_TYPE: str = "urn:schemas-upnp-org:device:MediaRenderer"
+
+
+class WatchedTarget:
+    """The target device of a RendererWatcher, selected by udn or by friendly name.
+
+    Waiters are woken up when it appears, changes location, restarts or says byebye.
+    """
+
+    def __init__(self, device_udn: str = None, device_name: str = None):
+        self.__device_name: str = device_name
+        self.__udn: str = device_udn.lower() if device_udn else None
+        self.__location: str = None
+        self.__boot_id: str = None
+        self.__gone: bool = False
+        self.__changed: asyncio.Event = asyncio.Event()
+
+    @property
+    def device_name(self) -> str:
+        return self.__device_name
+
+    @property
+    def udn(self) -> str:
+        """The udn of the target, None until it is known (targets by name)."""
+        return self.__udn
+
+    @udn.setter
+    def udn(self, value: str):
+        self.__udn = value.lower() if value else None
+
+    @property
+    def location(self) -> str:
+        """Last advertised location of the target device, None if unknown or gone."""
+        return self.__location
+
+    @property
+    def boot_id(self) -> str:
+        """Last advertised BOOTID.UPNP.ORG of the target device, it changes when the device restarts."""
+        return self.__boot_id
+
+    @property
+    def gone(self) -> bool:
+        return self.__gone
+
+    def found(self, location: str, boot_id: str = None):
+        same_boot: bool = boot_id is None or boot_id == self.__boot_id
+        if location == self.__location and same_boot and not self.__gone:
+            return
+        self.__location = location
+        if boot_id is not None:
+            self.__boot_id = boot_id
+        self.__gone = False
+        self.__changed.set()
+
+    def lost(self):
+        self.__location = None
+        self.__gone = True
+        self.__changed.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for a change of the target device, returns False on timeout."""
+        try:
+            await asyncio.wait_for(self.__changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.__changed.clear()
+        return True
+
+
+class RendererWatcher:
+    """Live table of renderers (udn -> location), built from SSDP advertisements.
+
+    Each watched target is woken up as soon as its device appears, changes
+    location or says byebye, so reconnects do not depend on a retry timer
+    nor on active searches. on_renderer is called for each new renderer.
+    """
+
+    def __init__(self, on_renderer: Callable[[str, str], None] = None):
+        self.__on_renderer: Callable[[str, str], None] = on_renderer
+        self.__renderers: dict[str, str] = {}
+        self.__boot_ids: dict[str, str] = {}
+        self.__names: dict[str, str] = {}
+        # describe tasks by udn, referenced until done
+        self.__describing: dict[str, asyncio.Task] = {}
+        self.__targets: list[WatchedTarget] = []
+        self.__listener: SsdpAdvertisementListener = None
+
+    @property
+    def started(self) -> bool:
+        return self.__listener is not None
+
+    @property
+    def renderers(self) -> dict[str, str]:
+        return dict(self.__renderers)
+
+    @property
+    def on_renderer(self) -> Callable[[str, str], None]:
+        return self.__on_renderer
+
+    @on_renderer.setter
+    def on_renderer(self, value: Callable[[str, str], None]):
+        self.__on_renderer = value
+
+    def watch(self, device_udn: str = None, device_name: str = None) -> WatchedTarget:
+        target: WatchedTarget = WatchedTarget(device_udn=device_udn, device_name=device_name)
+        self.__targets.append(target)
+        # the device might have advertised itself already
+        udn: str
+        location: str
+        for udn, location in self.__renderers.items():
+            self.__match(udn=udn, location=location, target_list=[target])
+        return target
+
+    def unwatch(self, target: WatchedTarget):
+        if target in self.__targets:
+            self.__targets.remove(target)
+
+    async def start(self):
+        listener: SsdpAdvertisementListener = SsdpAdvertisementListener(
+            on_alive=self.__on_alive,
+            on_byebye=self.__on_byebye,
+            on_update=self.__on_update,
+            source=("0.0.0.0", 0))
+        try:
+            await listener.async_start()
+            self.__listener = listener
+        except Exception as ex:
+            print(f"RendererWatcher cannot listen to SSDP advertisements due to [{type(ex)}] [{ex}]")
+
+    async def stop(self):
+        if self.__listener:
+            await self.__listener.async_stop()
+            self.__listener = None
+
+    def __on_alive(self, headers: CaseInsensitiveDict):
+        self.__on_advertisement(headers, boot_id=headers.get_lower("bootid.upnp.org"))
+
+    def __on_update(self, headers: CaseInsensitiveDict):
+        # ssdp:update carries the BOOTID of the advertisements to come as NEXTBOOTID
+        self.__on_advertisement(
+            headers,
+            boot_id=headers.get_lower("nextbootid.upnp.org", headers.get_lower("bootid.upnp.org")))
+
+    def __on_advertisement(self, headers: CaseInsensitiveDict, boot_id: str):
+        udn: str = udn_from_headers(headers)
+        location: str = headers.get_lower("location")
+        if not udn or not location:
+            return
+        cache: DiscoveryCache = get_discovery_cache()
+        if cache and cache.update_location(udn=udn, location=location):
+            cache.save_soon()
+        nt: str = headers.get_lower("nt", "")
+        if udn.lower() not in self.__renderers and not nt.startswith(MEDIA_RENDERER_DEVICE_TYPE):
+            # we only track renderers, they are recognized by their device type advertisement
+            return
+        previous: str = self.__renderers.get(udn.lower())
+        self.__renderers[udn.lower()] = location
+        if boot_id is not None:
+            restarted: bool = udn.lower() in self.__boot_ids and self.__boot_ids[udn.lower()] != boot_id
+            self.__boot_ids[udn.lower()] = boot_id
+            if restarted:
+                # its description might have changed, watchers resubscribe on the new bootid
+                print(f"RendererWatcher renderer [{udn}] restarted, bootid [{boot_id}]")
+                self.__names.pop(udn.lower(), None)
+                self.__describe_soon(udn=udn, location=location)
+        if previous != location:
+            print(f"RendererWatcher renderer [{udn}] at [{location}]")
+        if previous is None and self.__on_renderer:
+            self.__on_renderer(udn.lower(), location)
+        self.__match(udn=udn, location=location, target_list=self.__targets)
+
+    def __on_byebye(self, headers: CaseInsensitiveDict):
+        udn: str = udn_from_headers(headers)
+        if not udn or udn.lower() not in self.__renderers:
+            return
+        print(f"RendererWatcher renderer [{udn}] said byebye")
+        del self.__renderers[udn.lower()]
+        self.__boot_ids.pop(udn.lower(), None)
+        cache: DiscoveryCache = get_discovery_cache()
+        if cache:
+            cache.remove_udn(udn)
+            cache.save_soon()
+        target: WatchedTarget
+        for target in self.__targets:
+            if udn.lower() == target.udn:
+                target.lost()
+
+    def __match(self, udn: str, location: str, target_list: list[WatchedTarget]):
+        target: WatchedTarget
+        for target in target_list:
+            if target.udn is None and target.device_name:
+                name: str = self.__get_name(udn=udn, location=location)
+                if name is not None and name == target.device_name:
+                    target.udn = udn
+            if udn.lower() == target.udn:
+                target.found(location, boot_id=self.__boot_ids.get(udn.lower()))
+
+    def __get_name(self, udn: str, location: str) -> str:
+        name: str = self.__names.get(udn.lower())
+        cache: DiscoveryCache = get_discovery_cache()
+        if name is None and cache and cache.get(udn):
+            name = cache.get(udn).name
+        if name is None:
+            # the name is in the device description only, fetch it once per renderer
+            self.__describe_soon(udn=udn, location=location)
+        return name
+
+    def __describe_soon(self, udn: str, location: str):
+        if udn.lower() in self.__describing:
+            return
+        self.__describing[udn.lower()] = asyncio.get_running_loop().create_task(
+            self.__describe(udn=udn, location=location))
+
+    async def __describe(self, udn: str, location: str):
+        try:
+            described: list[tuple[str, UpnpDevice]] = await scanner.describe_devices(
+                {CaseInsensitiveDict(location=location)})
+            if len(described) == 0:
+                return
+            self.__names[udn.lower()] = described[0][1].friendly_name
+            self.__match(udn=udn, location=location, target_list=self.__targets)
+        except Exception as ex:
+            print(f"RendererWatcher cannot describe renderer [{udn}] due to [{type(ex)}] [{ex}]")
+        finally:
+            self.__describing.pop(udn.lower(), None)
@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import gzip
+import json
+import time
+
+from typing import Callable, Iterable, Mapping
+
+import log
+import metrics
+import scrobbler
+
+from device_state import DeviceState
+from event_filter import create_event_filter
+from scrobble_queue import ScrobbleQueue
+from song import Song, song_to_short_string
+
+DEFAULT_DEVICE: str = "replay"
+DEFAULT_SERVICE: str = "urn:schemas-upnp-org:service:AVTransport:1"
+
+DECISION_NOW_PLAYING: str = "now_playing"
+DECISION_SCROBBLE: str = "scrobble"
+
+# reasons of upnp_scrobbler_scrobbles_rejected_total
+REJECT_REASONS: tuple[str, ...] = ("threshold", "minimum_delta")
+
+
+class ReplayEvent:
+    """A captured set of service variables: t (seconds), device, service and variables by name.
+
+    In a corpus file each event is one json object per line (gzip when the file name ends with .gz):
+    {"t": 12.5, "device": "WiiM Pro", "service": "urn:...:AVTransport:1", "variables": {"TransportState": ...}}
+    Variables are the ones sent by the renderer, a LastChange event is expanded by the handler as for a live renderer.
+    """
+
+    def __init__(self, t: float, variables: dict[str, any], device: str = None, service: str = None):
+        self.__t: float = t
+        self.__variables: dict[str, any] = variables
+        self.__device: str = device or DEFAULT_DEVICE
+        self.__service: str = service or DEFAULT_SERVICE
+
+    @property
+    def t(self) -> float:
+        return self.__t
+
+    @property
+    def variables(self) -> dict[str, any]:
+        return self.__variables
+
+    @property
+    def device(self) -> str:
+        return self.__device
+
+    @property
+    def service(self) -> str:
+        return self.__service
+
+
+class ReplayVariable:
+    """Stands in for UpnpStateVariable, the handlers read name, value and service only."""
+
+    def __init__(self, name: str, value: any, service: "ReplayService"):
+        self.name: str = name
+        self.value: any = value
+        self.service: ReplayService = service
+
+
+class ReplayService:
+    """Stands in for UpnpService, expanded LastChange variables go to on_event like for a live service."""
+
+    def __init__(self, service_type: str, on_event: Callable[["ReplayService", list[ReplayVariable]], None]):
+        self.service_type: str = service_type
+        self.service_id: str = "urn:upnp-org:serviceId:" + service_type.split(":")[-2]
+        self.on_event: Callable[[ReplayService, list[ReplayVariable]], None] = on_event
+
+    def to_variables(self, variables: Mapping[str, any]) -> list[ReplayVariable]:
+        return list(map(lambda x: ReplayVariable(x[0], x[1], self), variables.items()))
+
+    def notify_changed_state_variables(self, changes: Mapping[str, str]) -> None:
+        self.on_event(self, self.to_variables(changes))
+
+
+class Decision:
+
+    def __init__(self, t: float, device: str, kind: str, song: Song):
+        self.__t: float = t
+        self.__device: str = device
+        self.__kind: str = kind
+        self.__song: Song = song
+
+    @property
+    def t(self) -> float:
+        return self.__t
+
+    @property
+    def device(self) -> str:
+        return self.__device
+
+    @property
+    def kind(self) -> str:
+        return self.__kind
+
+    @property
+    def song(self) -> Song:
+        return self.__song
+
+
+class VirtualClock:
+    """Clock of the replayed devices, time() follows the corpus timestamps."""
+
+    def __init__(self, start: float):
+        self.now: float = start
+
+    def time(self) -> float:
+        return self.now
+
+
+class RecordingDispatcher:
+    """Stands in for the scrobbler dispatcher: provider jobs are recorded as decisions, never executed."""
+
+    def __init__(self, clock: VirtualClock, start: float):
+        self.__clock: VirtualClock = clock
+        self.__start: float = start
+        self.device: str = None
+        self.decisions: list[Decision] = []
+
+    def submit(self, name: str, fn: Callable[..., any], *args) -> bool:
+        submitted: Song = args[0] if len(args) > 0 else None
+        self.decisions.append(Decision(
+            t=self.__clock.now - self.__start,
+            device=self.device,
+            kind=name,
+            song=submitted))
+        return True
+
+
+class ReplayResult:
+
+    def __init__(
+            self,
+            events: int,
+            filtered: int,
+            elapsed_sec: float,
+            latencies: list[float],
+            decisions: list[Decision],
+            rejected: dict[str, int]):
+        self.__events: int = events
+        self.__filtered: int = filtered
+        self.__elapsed_sec: float = elapsed_sec
+        self.__latencies: list[float] = latencies
+        self.__decisions: list[Decision] = decisions
+        self.__rejected: dict[str, int] = rejected
+
+    @property
+    def events(self) -> int:
+        return self.__events
+
+    @property
+    def filtered(self) -> int:
+        return self.__filtered
+
+    @property
+    def elapsed_sec(self) -> float:
+        return self.__elapsed_sec
+
+    @property
+    def latencies(self) -> list[float]:
+        return self.__latencies
+
+    @property
+    def decisions(self) -> list[Decision]:
+        return self.__decisions
+
+    @property
+    def rejected(self) -> dict[str, int]:
+        """Armed scrobbles not handed to the providers, by reason."""
+        return self.__rejected
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.__events / self.__elapsed_sec if self.__elapsed_sec > 0 else 0.0
+
+    def latency_percentile(self, percent: float) -> float:
+        if len(self.__latencies) == 0:
+            return 0.0
+        ordered: list[float] = sorted(self.__latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+
+def load_corpus(file_name: str) -> list[ReplayEvent]:
+    opener: Callable[..., any] = gzip.open if file_name.endswith(".gz") else open
+    result: list[ReplayEvent] = []
+    with opener(file_name, "rt", encoding="utf-8") as f:
+        line: str
+        for line in f:
+            if not line.strip():
+                continue
+            data: dict[str, any] = json.loads(line)
+            result.append(ReplayEvent(
+                t=float(data["t"]),
+                variables=data["variables"],
+                device=data.get("device"),
+                service=data.get("service")))
+    return result
+
+
+def get_handler(service_type: str) -> Callable[[DeviceState, ReplayService, list[ReplayVariable]], None]:
+    """Handler of the service, as subscribed for a live renderer, None for services which are not subscribed."""
+    subscription: scrobbler.Subscription
+    for subscription in scrobbler.subscription_list:
+        if subscription.enabled and f":{subscription.service_name}:" in service_type:
+            return subscription.handler
+    return None
+
+
+def replay(
+        events: Iterable[ReplayEvent],
+        manufacturer: str = None,
+        model_name: str = None,
+        start: float = 1_000_000_000.0) -> ReplayResult:
+    """Feed the events to the handlers of the subscribed services, in order and as fast as possible.
+
+    Each device gets a fresh DeviceState, its event filter is selected from manufacturer/model_name
+    like for a live renderer. Its clock is start plus the time since the first event,
+    so scrobble thresholds are evaluated on the captured timing. Its dispatcher records
+    the provider jobs as decisions and its scrobble queue is in memory, nothing leaves the process.
+    """
+    clock: VirtualClock = VirtualClock(start)
+    dispatcher: RecordingDispatcher = RecordingDispatcher(clock, start)
+    scrobble_queue: ScrobbleQueue = ScrobbleQueue(":memory:")
+    states: dict[str, DeviceState] = {}
+    services: dict[tuple[str, str], ReplayService] = {}
+    latencies: list[float] = []
+    # recorded timestamps are monotonic, decisions are reported from the first event
+    origin: float = None
+    # the handlers count rejected scrobbles in the metrics only
+    rejected_before: dict[tuple[str, str], float] = {}
+    replay_start: float = time.perf_counter()
+    event: ReplayEvent
+    for event in events:
+        handler: Callable[[DeviceState, ReplayService, list[ReplayVariable]], None] = get_handler(event.service)
+        if handler is None:
+            continue
+        state: DeviceState = states.get(event.device)
+        if state is None:
+            state = DeviceState(name=event.device)
+            state.event_filter = create_event_filter(manufacturer=manufacturer, model_name=model_name)
+            state.clock = clock.time
+            state.dispatcher = dispatcher
+            state.scrobble_queue = scrobble_queue
+            states[event.device] = state
+            reason: str
+            for reason in REJECT_REASONS:
+                rejected_before[(event.device, reason)] = metrics.g_scrobbles_rejected.get(event.device, reason)
+        service: ReplayService = services.get((event.device, event.service))
+        if service is None:
+            service = ReplayService(event.service, on_event=functools.partial(handler, state))
+            services[(event.device, event.service)] = service
+        service_variables: list[ReplayVariable] = service.to_variables(event.variables)
+        if origin is None:
+            origin = event.t
+        clock.now = start + event.t - origin
+        dispatcher.device = event.device
+        event_start: float = time.perf_counter()
+        handler(state, service, service_variables)
+        latencies.append(time.perf_counter() - event_start)
+    scrobble_queue.close()
+    rejected: dict[str, int] = {}
+    device: str
+    reason: str
+    for device, reason in rejected_before.keys():
+        delta: float = metrics.g_scrobbles_rejected.get(device, reason) - rejected_before[(device, reason)]
+        rejected[reason] = rejected.get(reason, 0) + int(delta)
+    return ReplayResult(
+        events=len(latencies),
+        filtered=sum(map(lambda x: x.event_filter.dropped, states.values())),
+        elapsed_sec=time.perf_counter() - replay_start,
+        latencies=latencies,
+        decisions=dispatcher.decisions,
+        rejected=rejected)
+
+
+def decision_to_string(decision: Decision) -> str:
+    return f"[{decision.t:10.2f}] [{decision.device}] [{decision.kind}] {song_to_short_string(decision.song)}"
+
+
+def print_result(result: ReplayResult, show_decisions: bool = True) -> None:
+    if show_decisions:
+        decision: Decision
+        for decision in result.decisions:
+            print(decision_to_string(decision))
+    scrobbles: int = len(list(filter(lambda x: x.kind == DECISION_SCROBBLE, result.decisions)))
+    now_playing: int = len(list(filter(lambda x: x.kind == DECISION_NOW_PLAYING, result.decisions)))
+    print(f"events [{result.events}] filtered [{result.filtered}] "
+          f"scrobbles [{scrobbles}] now_playing [{now_playing}] rejected {result.rejected}")
+    print(f"elapsed [{result.elapsed_sec:.3f}] sec events/sec [{result.events_per_sec:.0f}] "
+          f"latency us p50 [{result.latency_percentile(50) * 1e6:.1f}] "
+          f"p95 [{result.latency_percentile(95) * 1e6:.1f}] "
+          f"p99 [{result.latency_percentile(99) * 1e6:.1f}] "
+          f"max [{result.latency_percentile(100) * 1e6:.1f}]")
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="Replay captured AVTransport events, report decisions and handler latency")
+    parser.add_argument("corpus", nargs="+", help="ndjson corpus files, optionally gzipped")
+    parser.add_argument("--manufacturer", help="selects the event filter profile, as for a live renderer")
+    parser.add_argument("--model-name", help="selects the event filter profile, as for a live renderer")
+    parser.add_argument("--repeat", type=int, default=1, help="replay each corpus this many times")
+    parser.add_argument("--quiet", action="store_true", help="do not list the decisions")
+    args: argparse.Namespace = parser.parse_args()
+    log.setup_logging()
+    try:
+        file_name: str
+        for file_name in args.corpus:
+            events: list[ReplayEvent] = load_corpus(file_name)
+            print(f"Replaying [{file_name}] events [{len(events)}] repeat [{args.repeat}]")
+            iteration: int
+            for iteration in range(args.repeat):
+                result: ReplayResult = replay(events, manufacturer=args.manufacturer, model_name=args.model_name)
+                print_result(result, show_decisions=not args.quiet and iteration == 0)
+    finally:
+        log.stop_logging()
+
+
+if __name__ == "__main__":
+    main()
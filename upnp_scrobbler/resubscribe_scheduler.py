@@ -0,0 +1,82 @@
+import time
+
+from datetime import timedelta
+
+from async_upnp_client.client import UpnpService
+from async_upnp_client.event_handler import UpnpEventHandler
+from async_upnp_client.exceptions import UpnpError
+from util import print
+
+import metrics
+
+# never renew more often than this, whatever the renderer grants
+MIN_RENEW_DELAY_SEC: float = 5.0
+
+
+class ResubscribeScheduler:
+    """Renews each service subscription from the timeout granted by the renderer.
+
+    A subscription is renewed when renew_percent of its granted timeout has elapsed.
+    A rejected renewal (e.g. 412 after a renderer reboot, the SID is unknown)
+    is followed by a full subscribe; a renewal failing on connection errors
+    is raised, the device is most likely gone.
+    """
+
+    def __init__(self, event_handler: UpnpEventHandler, timeout_sec: int, renew_percent: int):
+        self.__event_handler: UpnpEventHandler = event_handler
+        self.__timeout: timedelta = timedelta(seconds=timeout_sec)
+        self.__renew_percent: int = min(max(renew_percent, 10), 90)
+        self.__renew_at: dict[UpnpService, float] = {}
+
+    @property
+    def services(self) -> list[UpnpService]:
+        return list(self.__renew_at.keys())
+
+    async def subscribe(self, service: UpnpService):
+        sid: str
+        granted: timedelta
+        sid, granted = await self.__event_handler.async_subscribe(service, timeout=self.__timeout)
+        self.__schedule(service, sid, granted)
+
+    def next_delay_sec(self) -> float:
+        """Time until the next renewal is due, None when there is nothing to renew."""
+        if len(self.__renew_at) == 0:
+            return None
+        return max(0.0, min(self.__renew_at.values()) - time.monotonic())
+
+    async def renew_due(self):
+        now: float = time.monotonic()
+        service: UpnpService
+        for service in [k for k, v in self.__renew_at.items() if v <= now]:
+            await self.renew(service)
+
+    async def renew(self, service: UpnpService):
+        previous_sid: str = self.__event_handler.sid_for_service(service)
+        if previous_sid is None:
+            # registration dropped (failed renewal), subscribe again
+            print(f"ResubscribeScheduler subscription to [{service}] was lost, subscribing again")
+            await self.subscribe(service)
+            return
+        sid: str
+        granted: timedelta
+        labels: tuple[str, str] = (service.device.friendly_name, service.service_id.rsplit(":", 1)[-1])
+        start: float = time.monotonic()
+        try:
+            sid, granted = await self.__event_handler.async_resubscribe(service, timeout=self.__timeout)
+        except UpnpError:
+            metrics.g_resubscribe_failures.inc(*labels)
+            # connection errors are not retried by the event handler, the registration is gone
+            self.__renew_at.pop(service, None)
+            raise
+        finally:
+            metrics.g_resubscribe_duration.observe(time.monotonic() - start, *labels)
+        if sid != previous_sid:
+            print(f"ResubscribeScheduler subscription to [{service}] was lost, resubscribed with sid [{sid}]")
+        self.__schedule(service, sid, granted)
+
+    def __schedule(self, service: UpnpService, sid: str, granted: timedelta):
+        granted_sec: float = granted.total_seconds() if granted else self.__timeout.total_seconds()
+        delay_sec: float = max(MIN_RENEW_DELAY_SEC, granted_sec * self.__renew_percent / 100.0)
+        self.__renew_at[service] = time.monotonic() + delay_sec
+        print(f"ResubscribeScheduler [{service}] sid [{sid}] granted [{granted_sec}] sec, "
+              f"renewing in [{delay_sec:.0f}] sec")
@@ -1,13 +1,18 @@
 import asyncio
+import time
 # import sys
 
-from async_upnp_client.aiohttp import AiohttpRequester
 from async_upnp_client.client_factory import UpnpFactory
-from async_upnp_client.client import UpnpDevice
+from async_upnp_client.client import UpnpDevice, UpnpRequester
 from async_upnp_client.profiles.dlna import DmrDevice
 from async_upnp_client.utils import CaseInsensitiveDict
+from discovery_cache import DiscoveryCache, get_discovery_cache
 from util import print
 
+import config
+import metrics
+import upnp_session
+
 
 async def discover_dmr_devices(source, timeout) -> set[CaseInsensitiveDict]:
     """Discover DMR devices."""
@@ -20,7 +25,9 @@ async def discover_dmr_devices(source, timeout) -> set[CaseInsensitiveDict]:
 
 
 async def discover(timeout: int, source=("0.0.0.0", 0), dump_discovery: bool = False):
+    start: float = time.monotonic()
     discoveries: set[CaseInsensitiveDict] = await discover_dmr_devices(source=("0.0.0.0", 0), timeout=timeout)
+    metrics.g_discovery_duration.observe(time.monotonic() - start, "search")
     discovery: CaseInsensitiveDict
     for discovery in discoveries if discoveries else set():
         location: str = discovery["location"] if "location" in discovery else None
@@ -40,7 +47,7 @@ async def show_discoveries(discoveries: set[CaseInsensitiveDict]):
 async def show_discovery(d: CaseInsensitiveDict):
     location: str = d["location"] if "location" in d else None
     if location:
-        requester = AiohttpRequester()
+        requester = upnp_session.get_requester(timeout=5)
         factory = UpnpFactory(requester)
         # create a device
         device = await factory.async_create_device(location)
@@ -53,66 +60,112 @@ async def show_discovery(d: CaseInsensitiveDict):
         print("Location is empty, nothing to do.")
 
 
-async def get_device_url_by_name(device_name: str, timeout: int) -> list[str]:
-    discoveries: set[CaseInsensitiveDict] = await discover(timeout=timeout)
-    by_name: dict[str, list] = dict()
-    current: CaseInsensitiveDict
-    for current in discoveries if discoveries else set():
-        # get location
-        location: str = current["location"] if "location" in current else None
-        if not location:
-            continue
-        # extract name
-        requester = AiohttpRequester()
-        factory = UpnpFactory(requester)
-        # create a device
-        device: UpnpDevice = await factory.async_create_device(location)
+async def describe_device(
+        factory: UpnpFactory,
+        semaphore: asyncio.Semaphore,
+        location: str,
+        timeout: float) -> UpnpDevice:
+    async with semaphore:
+        try:
+            return await asyncio.wait_for(factory.async_create_device(location), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"describe_device timed out after [{timeout}] sec for url:[{location}]")
+        except Exception as ex:
+            print(f"describe_device failed for url:[{location}] due to [{type(ex)}] [{ex}]")
+        return None
+
+
+async def describe_devices(discoveries: set[CaseInsensitiveDict]) -> list[tuple[str, UpnpDevice]]:
+    """Fetch device descriptions concurrently, returns (location, device) for each device which answered.
+
+    Fetches share the keep-alive UPnP session, at most SCANNER_MAX_CONCURRENCY at a time,
+    each one is bounded by SCANNER_DEVICE_TIMEOUT_SEC.
+    """
+    location_list: list[str] = list(dict.fromkeys(filter(
+        lambda x: x is not None,
+        map(lambda x: x["location"] if "location" in x else None,
+            discoveries if discoveries else set()))))
+    if len(location_list) == 0:
+        return []
+    timeout: float = float(config.get_scanner_device_timeout_sec())
+    requester: UpnpRequester = upnp_session.get_requester(timeout=timeout)
+    factory: UpnpFactory = UpnpFactory(requester)
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(config.get_scanner_max_concurrency())
+    start: float = time.monotonic()
+    device_list: list[UpnpDevice] = await asyncio.gather(*map(
+        lambda x: describe_device(
+            factory=factory,
+            semaphore=semaphore,
+            location=x,
+            timeout=timeout),
+        location_list))
+    metrics.g_discovery_duration.observe(time.monotonic() - start, "describe")
+    result: list[tuple[str, UpnpDevice]] = []
+    cache: DiscoveryCache = get_discovery_cache()
+    location: str
+    device: UpnpDevice
+    for location, device in zip(location_list, device_list):
         if device:
-            fn: str = device.friendly_name
             print(f"Found device with udn:[{device.udn}] name:[{device.friendly_name}] url:[{location}]")
-            if device_name == fn:
-                print(f"Device [{device.udn}] matches friendly name [{fn}]")
-                # does by_name already contain friendly name?
-                device_list: list[str] = None
-                if fn in by_name:
-                    device_list: list[str] = by_name[fn]
-                else:
-                    device_list = []
-                    by_name[fn] = device_list
-                print(f"Adding location [{location}] for friendly_name [{fn}] -> ([{device.udn}])")
-                device_list.append(location)
-    return by_name[device_name] if device_name in by_name else []
+            result.append((location, device))
+            if cache: cache.put(udn=device.udn, name=device.friendly_name, location=location)
+    if cache: cache.save_soon()
+    return result
+
+
+async def get_cached_device_urls(device_udn: str = None, device_name: str = None) -> list[str]:
+    """Locations from the discovery cache, confirmed by fetching their description.
+
+    Locations which now belong to a different device are dropped from the cache.
+    Locations which do not answer are kept, e.g. a renderer in standby.
+    """
+    cache: DiscoveryCache = get_discovery_cache()
+    if not cache:
+        return []
+    location_list: list[str] = (cache.get_locations_by_udn(device_udn) if device_udn
+                                else cache.get_locations_by_name(device_name))
+    if len(location_list) == 0:
+        return []
+    described: list[tuple[str, UpnpDevice]] = await describe_devices(
+        set(map(lambda x: CaseInsensitiveDict(location=x), location_list)))
+    result: list[str] = []
+    location: str
+    device: UpnpDevice
+    for location, device in described:
+        if (device.udn.lower() == device_udn.lower() if device_udn else device.friendly_name == device_name):
+            result.append(location)
+        else:
+            print(f"get_cached_device_urls cached location [{location}] is stale, "
+                  f"now [{device.friendly_name}] udn [{device.udn}]")
+            cache.remove_location(location)
+    cache.save_soon()
+    return result
+
+
+async def get_device_url_by_name(device_name: str, timeout: int) -> list[str]:
+    discoveries: set[CaseInsensitiveDict] = await discover(timeout=timeout)
+    result: list[str] = []
+    location: str
+    device: UpnpDevice
+    for location, device in await describe_devices(discoveries):
+        if device_name == device.friendly_name:
+            print(f"Device [{device.udn}] matches friendly name [{device.friendly_name}]")
+            print(f"Adding location [{location}] for friendly_name [{device_name}] -> ([{device.udn}])")
+            result.append(location)
+    return result
 
 
 async def get_device_url_by_udn(device_udn: str, timeout: int) -> list[str]:
     discoveries: set[CaseInsensitiveDict] = await discover(timeout=timeout)
-    by_name: dict[str, list] = dict()
-    current: CaseInsensitiveDict
-    for current in discoveries if discoveries else set():
-        # get location
-        location: str = current["location"] if "location" in current else None
-        if not location:
-            continue
-        # extract name
-        requester = AiohttpRequester()
-        factory = UpnpFactory(requester)
-        # create a device
-        device: UpnpDevice = await factory.async_create_device(location)
-        if device:
-            udn: str = device.udn
-            print(f"Found device with udn:[{udn}] name:[{device.friendly_name}] url:[{location}]")
-            if device_udn.lower() == udn.lower():
-                print(f"Device [{device.friendly_name}] matches udn [{device.udn}]")
-                # does by_name already contain udn?
-                device_list: list[str] = None
-                if device_udn in by_name:
-                    device_list: list[str] = by_name[device_udn]
-                else:
-                    device_list = []
-                    by_name[device_udn] = device_list
-                print(f"Adding location [{location}] for udn [{device_udn}] -> [{device.friendly_name}]")
-                device_list.append(location)
-    return by_name[device_udn] if device_udn in by_name else []
+    result: list[str] = []
+    location: str
+    device: UpnpDevice
+    for location, device in await describe_devices(discoveries):
+        if device_udn.lower() == device.udn.lower():
+            print(f"Device [{device.friendly_name}] matches udn [{device.udn}]")
+            print(f"Adding location [{location}] for udn [{device_udn}] -> [{device.friendly_name}]")
+            result.append(location)
+    return result
 
 
 if __name__ == "__main__":
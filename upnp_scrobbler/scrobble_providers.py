@@ -0,0 +1,466 @@
+import concurrent.futures
+import functools
+import os
+import threading
+import time
+import pylast
+
+import backoff
+import config
+import constants
+import last_fm
+import metrics
+from song import Song, song_to_dict, song_from_dict, song_to_short_string
+from scrobble_queue import ScrobbleQueue, QueueEntry
+from subsonic import ScrobblerSubsonicConfiguration
+from subsonic import get_song_by_uri as get_subsonic_song_by_uri
+from subsonic import scrobble_song as scrobble_subsonic_song
+from subsonic import get_subsonic_config_keys
+from subsonic import get_single_subsonic_config
+from subsonic import match_song as match_subsonic_song
+from subsonic_connector.song import Song as SubsonicSong
+from typing import Callable
+from util import print
+
+PROVIDER_LAST_FM: str = "last.fm"
+PROVIDER_SUBSONIC_PREFIX: str = "subsonic:"
+
+# a queued entry being submitted is not picked again before this time
+QUEUE_LEASE_SEC: float = 300.0
+QUEUE_FLUSH_BATCH_SIZE: int = last_fm.MAX_SCROBBLE_BATCH_SIZE
+
+# codes of ignoredMessage in track.scrobble responses
+LAST_FM_IGNORED_OK: int = 0
+LAST_FM_IGNORED_DAILY_LIMIT: int = 5
+
+g_scrobble_queue: ScrobbleQueue = None
+g_scrobble_queue_lock: threading.Lock = threading.Lock()
+
+# providers are called concurrently, so the slowest one sets the latency
+g_provider_executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.get_provider_worker_count(),
+    thread_name_prefix="provider")
+
+
+def timed_job(provider: str, operation: str, job: Callable[[], bool]) -> bool:
+    """Run a provider job, recording its duration and failure in the provider metrics."""
+    start: float = time.monotonic()
+    try:
+        return job()
+    except Exception:
+        metrics.g_provider_errors.inc(provider, operation)
+        raise
+    finally:
+        metrics.g_provider_duration.observe(time.monotonic() - start, provider, operation)
+
+
+def fan_out(job_name: str, job_list: list[tuple[str, Callable[[], bool]]]) -> int:
+    """Run (provider, job) pairs concurrently, returns how many jobs returned True within the timeout.
+
+    A job which times out keeps running in the background,
+    queued entries it works on stay leased until it is done.
+    """
+    if len(job_list) == 0:
+        return 0
+    future_dict: dict[concurrent.futures.Future, str] = dict(map(
+        lambda x: (g_provider_executor.submit(x[1]), x[0]),
+        job_list))
+    done, not_done = concurrent.futures.wait(
+        future_dict.keys(),
+        timeout=config.get_provider_timeout_sec())
+    future: concurrent.futures.Future
+    for future in not_done:
+        print(f"fan_out [{job_name}] provider [{future_dict[future]}] "
+              f"timed out after [{config.get_provider_timeout_sec()}] sec")
+    success_count: int = 0
+    for future in done:
+        try:
+            if future.result():
+                success_count += 1
+        except Exception as ex:
+            print(f"fan_out [{job_name}] provider [{future_dict[future]}] "
+                  f"failed due to [{type(ex)}] [{ex}]")
+    return success_count
+
+
+def get_scrobble_queue() -> ScrobbleQueue:
+    global g_scrobble_queue
+    with g_scrobble_queue_lock:
+        if g_scrobble_queue is None:
+            g_scrobble_queue = ScrobbleQueue(os.path.join(
+                config.get_app_config_dir(),
+                constants.Constants.SCROBBLE_QUEUE_FILE.value))
+        return g_scrobble_queue
+
+
+def get_subsonic_provider(subsonic_key: str) -> str:
+    return f"{PROVIDER_SUBSONIC_PREFIX}{subsonic_key}"
+
+
+def get_scrobble_providers() -> list[str]:
+    result: list[str] = []
+    if config.is_last_fm_configured():
+        result.append(PROVIDER_LAST_FM)
+    else:
+        print("get_scrobble_providers not scrobbling to LAST.fm because it is not configured")
+    subsonic_key: str
+    for subsonic_key in get_subsonic_config_keys():
+        result.append(get_subsonic_provider(subsonic_key))
+    return result
+
+
+def submit_to_provider(provider: str, current_song: Song, timestamp: int) -> bool:
+    """Scrobble to one provider.
+
+    Returns False if the provider does not apply (anymore) to the song,
+    raises if the submission failed and should be retried.
+    """
+    if provider == PROVIDER_LAST_FM:
+        if not config.is_last_fm_configured():
+            return False
+        last_fm_scrobble(current_song=current_song, timestamp=timestamp)
+        return True
+    if provider.startswith(PROVIDER_SUBSONIC_PREFIX):
+        return subsonic_scrobble_to_server(
+            subsonic_key=provider[len(PROVIDER_SUBSONIC_PREFIX):],
+            current_song=current_song,
+            submission=True,
+            timestamp=timestamp)
+    print(f"submit_to_provider unknown provider [{provider}]")
+    return False
+
+
+def attempt_entry(entry: QueueEntry) -> bool:
+    """Try to submit a queued entry, returns True if the provider accepted the scrobble."""
+    queue: ScrobbleQueue = get_scrobble_queue()
+    try:
+        scrobbled: bool = timed_job(
+            provider=entry.provider,
+            operation="scrobble",
+            job=lambda: submit_to_provider(
+                provider=entry.provider,
+                current_song=song_from_dict(entry.payload),
+                timestamp=entry.timestamp))
+        queue.remove(entry.entry_id)
+        return scrobbled
+    except Exception as ex:
+        delay: float = get_retry_delay_sec(entry.attempts)
+        print(f"attempt_entry scrobble to [{entry.provider}] failed "
+              f"(attempt [{entry.attempts + 1}]) due to [{type(ex)}] [{ex}], "
+              f"retrying in [{delay:.0f}] sec")
+        queue.reschedule(
+            entry_id=entry.entry_id,
+            next_attempt=time.time() + delay,
+            last_error=f"{type(ex).__name__}: {ex}")
+        return False
+
+
+def get_retry_delay_sec(attempts: int) -> float:
+    return backoff.get_delay_sec(
+        attempts=attempts,
+        initial_delay_sec=config.get_scrobble_retry_initial_delay_sec(),
+        max_delay_sec=config.get_scrobble_retry_max_delay_sec())
+
+
+def queue_scrobble(current_song: Song, timestamp: int, queue: ScrobbleQueue = None) -> list[QueueEntry]:
+    """Write the scrobble to the queue, one entry per provider, before any attempt.
+
+    LAST.fm entries are left in the queue for the batch window (if enabled),
+    so that flush_scrobble_queue submits them together with others.
+    The other entries are returned leased: the caller is expected to pass them
+    to scrobble_to_providers, or to release_scrobble if it cannot.
+    """
+    queue = queue if queue is not None else get_scrobble_queue()
+    batch_window_sec: int = config.get_last_fm_batch_window_sec()
+    provider_lease_list: list[tuple[str, float]] = list(map(
+        lambda x: (x, batch_window_sec if x == PROVIDER_LAST_FM and batch_window_sec > 0 else QUEUE_LEASE_SEC),
+        get_scrobble_providers()))
+    if len(provider_lease_list) == 0:
+        return []
+    entry_list: list[QueueEntry] = queue.add_many(
+        provider_lease_list=provider_lease_list,
+        payload=song_to_dict(current_song),
+        timestamp=timestamp)
+    deferred_count: int = 0
+    if batch_window_sec > 0:
+        deferred_count = len(list(filter(lambda x: x.provider == PROVIDER_LAST_FM, entry_list)))
+    if deferred_count > 0:
+        print(f"queue_scrobble [{song_to_short_string(current_song)}] batched for [{deferred_count}] provider(s)")
+        return list(filter(lambda x: x.provider != PROVIDER_LAST_FM, entry_list))
+    return entry_list
+
+
+def release_scrobble(entry_list: list[QueueEntry], queue: ScrobbleQueue = None):
+    """Leave queued entries to flush_scrobble_queue, e.g. when they cannot be dispatched."""
+    queue = queue if queue is not None else get_scrobble_queue()
+    queue.release(list(map(lambda x: x.entry_id, entry_list)))
+
+
+def queue_and_scrobble(current_song: Song, timestamp: int, queue: ScrobbleQueue = None) -> int:
+    """Dispatcher job of a new scrobble: queue it, then try the providers right away."""
+    return scrobble_to_providers(current_song, queue_scrobble(current_song, timestamp=timestamp, queue=queue))
+
+
+def defer_scrobble(current_song: Song, timestamp: int, queue: ScrobbleQueue = None):
+    """Queue a scrobble which cannot be dispatched, flush_scrobble_queue attempts it."""
+    release_scrobble(queue_scrobble(current_song, timestamp=timestamp, queue=queue), queue=queue)
+
+
+def scrobble_to_providers(current_song: Song, entry_list: list[QueueEntry]) -> int:
+    """Try to submit entries written by queue_scrobble right away.
+
+    Failed submissions stay in the queue, flush_scrobble_queue retries them.
+    """
+    scrobble_provider_count: int = fan_out(
+        job_name="scrobble",
+        job_list=list(map(lambda x: (x.provider, functools.partial(attempt_entry, x)), entry_list)))
+    print(f"Scrobble success (provider count=[{scrobble_provider_count}]) "
+          f"for [{song_to_short_string(current_song)}]")
+    return scrobble_provider_count
+
+
+def flush_scrobble_queue() -> int:
+    """Retry queued scrobbles which are due, returns the number of accepted scrobbles.
+
+    LAST.fm entries are submitted in batches, the others one by one.
+    """
+    queue: ScrobbleQueue = get_scrobble_queue()
+    expired: int = queue.remove_older_than(int(time.time()) - config.get_scrobble_queue_max_age_sec())
+    if expired > 0:
+        print(f"flush_scrobble_queue dropped [{expired}] scrobble(s) which are too old")
+    scrobbled: int = 0
+    # entries rescheduled during this flush are not picked again
+    flush_start: float = time.time()
+    while True:
+        entry_list: list[QueueEntry] = queue.claim_due(
+            limit=QUEUE_FLUSH_BATCH_SIZE,
+            lease_sec=QUEUE_LEASE_SEC,
+            due_before=flush_start)
+        if len(entry_list) == 0:
+            break
+        print(f"flush_scrobble_queue submitting [{len(entry_list)}] queued scrobble(s) ...")
+        last_fm_entry_list: list[QueueEntry] = list(filter(lambda x: x.provider == PROVIDER_LAST_FM, entry_list))
+        if len(last_fm_entry_list) > 0:
+            scrobbled += attempt_last_fm_batch(last_fm_entry_list)
+        scrobbled += fan_out(
+            job_name="flush",
+            job_list=list(map(
+                lambda x: (x.provider, functools.partial(attempt_entry, x)),
+                filter(lambda x: x.provider != PROVIDER_LAST_FM, entry_list))))
+    return scrobbled
+
+
+def attempt_last_fm_batch(entry_list: list[QueueEntry]) -> int:
+    """Submit LAST.fm entries with a single request, returns the number of accepted scrobbles.
+
+    If the request fails as a whole, entries are attempted (and rescheduled) one by one.
+    """
+    if len(entry_list) == 1 or not config.is_last_fm_configured():
+        return len(list(filter(attempt_entry, entry_list)))
+    try:
+        code_list: list[int] = timed_job(
+            provider=PROVIDER_LAST_FM,
+            operation="scrobble_batch",
+            job=lambda: last_fm_scrobble_many(list(map(
+                lambda x: (song_from_dict(x.payload), x.timestamp),
+                entry_list))))
+    except Exception as ex:
+        print(f"attempt_last_fm_batch batch of [{len(entry_list)}] failed due to [{type(ex)}] [{ex}], "
+              "submitting one by one")
+        return len(list(filter(attempt_entry, entry_list)))
+    return apply_last_fm_batch_codes(get_scrobble_queue(), entry_list, code_list)
+
+
+def apply_last_fm_batch_codes(queue: ScrobbleQueue, entry_list: list[QueueEntry], code_list: list[int]) -> int:
+    """Remove or reschedule entries by their ignoredMessage code, returns the number of accepted scrobbles.
+
+    Accepted entries are removed, the daily limit is retried later,
+    other codes are not going to change on retry, so those entries are dropped.
+    """
+    accepted: int = 0
+    entry: QueueEntry
+    code: int
+    for entry, code in zip(entry_list, code_list):
+        if code == LAST_FM_IGNORED_OK:
+            queue.remove(entry.entry_id)
+            accepted += 1
+        elif code == LAST_FM_IGNORED_DAILY_LIMIT:
+            # not a problem with the scrobble, try again later
+            queue.reschedule(
+                entry_id=entry.entry_id,
+                next_attempt=time.time() + get_retry_delay_sec(entry.attempts),
+                last_error=f"ignored with code {code}")
+        else:
+            print(f"attempt_last_fm_batch LAST.fm ignored scrobble "
+                  f"[{entry.payload.get('title')}] by [{entry.payload.get('artist')}] with code [{code}]")
+            queue.remove(entry.entry_id)
+    print(f"attempt_last_fm_batch LAST.fm accepted [{accepted}] out of [{len(entry_list)}] scrobble(s)")
+    return accepted
+
+
+def do_update_now_playing(current_song: Song) -> int:
+    job_list: list[tuple[str, Callable[[], bool]]] = []
+    if config.is_last_fm_configured():
+        job_list.append((PROVIDER_LAST_FM, functools.partial(
+            timed_job,
+            provider=PROVIDER_LAST_FM,
+            operation="now_playing",
+            job=functools.partial(last_fm_now_playing, current_song))))
+    else:
+        print("do_update_now_playing not updating now playing on LAST.fm because it not configured")
+    if (current_song.av_transport_uri is None and
+            current_song.track_uri is None):
+        print("do_update_now_playing no uri is available for song.")
+    subsonic_key: str
+    for subsonic_key in get_subsonic_config_keys():
+        job_list.append((
+            get_subsonic_provider(subsonic_key),
+            functools.partial(
+                timed_job,
+                provider=get_subsonic_provider(subsonic_key),
+                operation="now_playing",
+                job=functools.partial(
+                    subsonic_scrobble_to_server,
+                    subsonic_key=subsonic_key,
+                    current_song=current_song,
+                    submission=False))))
+    return fan_out(job_name="now_playing", job_list=job_list)
+
+
+def last_fm_now_playing(current_song: Song) -> bool:
+    if not config.is_last_fm_configured():
+        print("last_fm_now_playing cannot update now playing on LAST.fm because it is not configured")
+        return False
+    network: pylast.LastFMNetwork = last_fm.get_last_fm_network()
+    artist: str = get_first_artist(current_song.artist)
+    duration: int = int(current_song.duration) if current_song.duration else None
+    print(f"last_fm_now_playing for [{current_song.title}] "
+          f"from [{current_song.album}] "
+          f"by [{artist}] "
+          f"[{duration}] sec ...")
+    try:
+        network.update_now_playing(
+            artist=artist,
+            title=current_song.title,
+            album=current_song.album,
+            duration=duration)
+        return True
+    except pylast.WSError as ex:
+        last_fm.invalidate_on_auth_error(ex)
+        raise
+
+
+def last_fm_scrobble(current_song: Song, timestamp: int = None):
+    if not config.is_last_fm_configured():
+        print("last_fm_scrobble: cannot scrobble because LAST.fm is not configured")
+        return
+    network: pylast.LastFMNetwork = last_fm.get_last_fm_network()
+    unix_timestamp: int = timestamp if timestamp else int(time.time())
+    artist: str = get_first_artist(current_song.artist)
+    duration: int = int(current_song.duration) if current_song.duration else None
+    print(f"last_fm_scrobble for [{current_song.title}] "
+          f"from [{current_song.album}] "
+          f"by [{artist}] "
+          f"[{duration}] sec ...")
+    try:
+        network.scrobble(
+            artist=artist,
+            title=current_song.title,
+            album=current_song.album,
+            duration=duration,
+            timestamp=unix_timestamp)
+    except pylast.WSError as ex:
+        last_fm.invalidate_on_auth_error(ex)
+        raise
+
+
+def last_fm_scrobble_many(song_list: list[tuple[Song, int]]) -> list[int]:
+    """Scrobble (song, timestamp) pairs with one request, returns the ignored code for each."""
+    network: pylast.LastFMNetwork = last_fm.get_last_fm_network()
+    print(f"last_fm_scrobble_many for [{len(song_list)}] song(s) ...")
+    try:
+        return last_fm.scrobble_many(
+            network=network,
+            track_list=list(map(
+                lambda x: {
+                    "artist": get_first_artist(x[0].artist),
+                    "title": x[0].title,
+                    "album": x[0].album,
+                    "duration": int(x[0].duration) if x[0].duration else None,
+                    "timestamp": x[1]},
+                song_list)))
+    except pylast.WSError as ex:
+        last_fm.invalidate_on_auth_error(ex)
+        raise
+
+
+def subsonic_scrobble_to_server(
+        subsonic_key: str,
+        current_song: Song,
+        submission: bool = True,
+        timestamp: int = None) -> bool:
+    """Scrobble to one subsonic server.
+
+    Returns False if the song is not available on that server, raises on errors.
+    """
+    config: ScrobblerSubsonicConfiguration = get_single_subsonic_config(subsonic_key=subsonic_key)
+    if not config:
+        print(f"subsonic_scrobble_to_server subsonic_key [{subsonic_key}] is not configured anymore")
+        return False
+    scrobble_type: str = "submission" if submission else "now playing"
+    uri: str = current_song.av_transport_uri if current_song.av_transport_uri else current_song.track_uri
+    # is it a now playing (submission=False)?
+    # if so, now playing must be enabled on the current subsonic server in order to go on
+    if not submission and not config.enable_now_playing:
+        # print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
+        #       f"now playing not enabled, skipping")
+        return False
+    # resolve the uri to a song on this server (results are cached)
+    subsonic_song: SubsonicSong = get_subsonic_song_by_uri(uri=uri, config=config) if uri else None
+    # report if we did not find the song
+    if not subsonic_song:
+        print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
+              f"cannot get a song for uri [{uri}] -> "
+              f"might belong to a different server")
+    # if we have loaded the song we need the title to match, otherwise we reset subsonic_song
+    if subsonic_song:
+        if not subsonic_song.getTitle().lower() == current_song.title.lower():
+            print(f"subsonic_scrobble found song [{subsonic_song.getId()}] on [{subsonic_key}] but "
+                  f"song title [{subsonic_song.getTitle()}] "
+                  f"does not match [{current_song.title}] "
+                  "the song might belong to a different server")
+            subsonic_song = None
+    # if we didn't find the song yet and this is a submission,
+    # we can try and see if the song is available on the server
+    if not subsonic_song and (submission and config.allow_match):
+        # match_subsonic_song executes all matching, results are cached
+        print(f"subsonic_scrobble [{scrobble_type}] on [{subsonic_key}] -> no song_id, trying to match song ...")
+        subsonic_song = match_subsonic_song(
+            config=config,
+            song_title=current_song.title,
+            song_artist=current_song.artist,
+            song_album=current_song.album)
+        print(f"subsonic_scrobble [{scrobble_type}] on [{subsonic_key}] -> matched [{subsonic_song is not None}]")
+    if not subsonic_song:
+        return False
+    # we have a match somehow, so let's go for the scrobble.
+    print(f"subsonic_scrobble found match for [{current_song.title}] "
+          f"from [{current_song.album}] "
+          f"by [{current_song.artist}] "
+          f"on [{subsonic_key}] -> "
+          f"song_id [{subsonic_song.getId()}]")
+    scrobble_subsonic_song(
+        song=subsonic_song,
+        config=config,
+        submission=submission,
+        listen_time=timestamp)
+    print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
+          f"scrobbled song_id [{subsonic_song.getId()}] "
+          f"mode [{'Scrobble' if submission else 'Now Playing'}]")
+    return True
+
+
+def get_first_artist(artist: str) -> str:
+    if not artist: return None
+    artist_list: list[str] = artist.split(",")
+    return artist_list[0] if artist_list and len(artist_list) > 0 else None
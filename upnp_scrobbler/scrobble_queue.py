@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class QueueEntry:
+
+    def __init__(
+            self,
+            entry_id: int,
+            provider: str,
+            payload: dict[str, any],
+            timestamp: int,
+            attempts: int):
+        self.__entry_id: int = entry_id
+        self.__provider: str = provider
+        self.__payload: dict[str, any] = payload
+        self.__timestamp: int = timestamp
+        self.__attempts: int = attempts
+
+    @property
+    def entry_id(self) -> int:
+        return self.__entry_id
+
+    @property
+    def provider(self) -> str:
+        return self.__provider
+
+    @property
+    def payload(self) -> dict[str, any]:
+        return self.__payload
+
+    @property
+    def timestamp(self) -> int:
+        return self.__timestamp
+
+    @property
+    def attempts(self) -> int:
+        return self.__attempts
+
+
+class ScrobbleQueue:
+    """Durable queue of pending scrobbles, one entry per provider, stored in sqlite.
+
+    Entries are written before the first attempt and removed on success,
+    so scrobbles survive provider outages and restarts.
+    An entry which is being submitted is leased (its next attempt is moved
+    in the future), so it is not picked twice.
+    """
+
+    def __init__(self, file_name: str):
+        self.__lock: threading.Lock = threading.Lock()
+        self.__db: sqlite3.Connection = sqlite3.connect(file_name, check_same_thread=False)
+        with self.__lock, self.__db:
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS scrobble_queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "provider TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "timestamp INTEGER NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt REAL NOT NULL, "
+                "last_error TEXT)")
+            self.__db.execute(
+                "CREATE INDEX IF NOT EXISTS scrobble_queue_next_attempt "
+                "ON scrobble_queue (next_attempt)")
+
+    def add(self, provider: str, payload: dict[str, any], timestamp: int, lease_sec: float) -> QueueEntry:
+        """Add an entry, leased to the caller, which is expected to attempt the submission."""
+        return self.add_many([(provider, lease_sec)], payload, timestamp)[0]
+
+    def add_many(
+            self,
+            provider_lease_list: list[tuple[str, float]],
+            payload: dict[str, any],
+            timestamp: int) -> list[QueueEntry]:
+        """Add one entry per (provider, lease_sec) for the same scrobble, in a single transaction."""
+        payload_json: str = json.dumps(payload)
+        now: float = time.time()
+        result: list[QueueEntry] = []
+        with self.__lock, self.__db:
+            provider: str
+            lease_sec: float
+            for provider, lease_sec in provider_lease_list:
+                cursor: sqlite3.Cursor = self.__db.execute(
+                    "INSERT INTO scrobble_queue (provider, payload, timestamp, next_attempt) VALUES (?, ?, ?, ?)",
+                    (provider, payload_json, timestamp, now + lease_sec))
+                result.append(QueueEntry(
+                    entry_id=cursor.lastrowid,
+                    provider=provider,
+                    payload=payload,
+                    timestamp=timestamp,
+                    attempts=0))
+        return result
+
+    def claim_due(self, limit: int, lease_sec: float, due_before: float = None) -> list[QueueEntry]:
+        """Get entries due for a new attempt (by due_before, defaults to now), leasing them to the caller."""
+        now: float = time.time()
+        with self.__lock, self.__db:
+            rows: list[tuple] = self.__db.execute(
+                "SELECT id, provider, payload, timestamp, attempts FROM scrobble_queue "
+                "WHERE next_attempt <= ? ORDER BY timestamp LIMIT ?",
+                (due_before if due_before is not None else now, limit)).fetchall()
+            self.__db.executemany(
+                "UPDATE scrobble_queue SET next_attempt = ? WHERE id = ?",
+                list(map(lambda x: (now + lease_sec, x[0]), rows)))
+        return list(map(
+            lambda x: QueueEntry(
+                entry_id=x[0],
+                provider=x[1],
+                payload=json.loads(x[2]),
+                timestamp=x[3],
+                attempts=x[4]),
+            rows))
+
+    def release(self, entry_id_list: list[int]):
+        """End the lease of entries nobody is going to attempt, so the next claim_due picks them."""
+        now: float = time.time()
+        with self.__lock, self.__db:
+            self.__db.executemany(
+                "UPDATE scrobble_queue SET next_attempt = ? WHERE id = ?",
+                list(map(lambda x: (now, x), entry_id_list)))
+
+    def remove(self, entry_id: int):
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM scrobble_queue WHERE id = ?", (entry_id,))
+
+    def reschedule(self, entry_id: int, next_attempt: float, last_error: str):
+        with self.__lock, self.__db:
+            self.__db.execute(
+                "UPDATE scrobble_queue SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?",
+                (next_attempt, last_error, entry_id))
+
+    def remove_older_than(self, timestamp: int) -> int:
+        with self.__lock, self.__db:
+            return self.__db.execute(
+                "DELETE FROM scrobble_queue WHERE timestamp < ?",
+                (timestamp,)).rowcount
+
+    def count(self) -> int:
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(*) FROM scrobble_queue").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
@@ -3,27 +3,31 @@
 # pylint: disable=invalid-name
 
 import asyncio
+import functools
+import hashlib
 import json
+import logging
 import time
 import xmltodict
 import os
-import datetime
-import pylast
-import webbrowser
 import random
 import string
 
-from typing import Optional, Sequence, Callable
+from typing import Optional, Sequence, Callable, Coroutine
 
-from async_upnp_client.aiohttp import AiohttpNotifyServer, AiohttpRequester
+from aiohttp import web
+from async_upnp_client.aiohttp import AiohttpNotifyServer
 from async_upnp_client.client import UpnpDevice, UpnpService, UpnpStateVariable, UpnpRequester
 from async_upnp_client.client_factory import UpnpFactory
+from async_upnp_client.event_handler import UpnpEventHandler
 from async_upnp_client.exceptions import UpnpResponseError, UpnpConnectionError
 from async_upnp_client.profiles.dlna import dlna_handle_notify_last_change
 from async_upnp_client.utils import get_local_ip
 from async_upnp_client.const import DeviceInfo
 
-from song import Song, copy_song, same_song
+from song import Song, copy_song, same_song, song_to_short_string, song_to_string
+from song import song_to_metadata, song_from_metadata
+from cache import LruTtlCache
 from player_state import PlayerState, get_player_state
 from util import duration_str_to_sec
 from util import get_ip
@@ -33,15 +37,36 @@ from event_name import EventName
 import config
 import constants
 import scanner
+import upnp_session
+from renderer_watcher import RendererWatcher, WatchedTarget
+from backoff import Backoff
+from event_recorder import EventRecorder
+import position_tracker
+from position_tracker import PositionTracker
+from event_filter import create_event_filter
+from didl_extractor import extract_didl_item, extract_transport_state
+from resubscribe_scheduler import ResubscribeScheduler
+from device_state import DeviceState, DeviceTarget, parse_device_target
+import last_fm
+import metrics
+from dispatcher import Dispatcher
+from scrobble_providers import queue_and_scrobble, defer_scrobble
+from scrobble_providers import flush_scrobble_queue, do_update_now_playing, get_scrobble_queue
+from scrobble_queue import ScrobbleQueue
 from subsonic import ScrobblerSubsonicConfiguration
-from subsonic import get_song_id as get_subsonic_song_id
-from subsonic import get_song_by_id as get_subsonic_song_by_id
-from subsonic import scrobble_song as scrobble_subsonic_song
 from subsonic import get_subsonic_config_keys
 from subsonic import get_single_subsonic_config
-from subsonic import find_song as find_subsonic_song
-from subsonic_connector.song import Song as SubsonicSong
+from subsonic import get_subsonic_config_registry
+from subsonic import get_subsonic_connector_pool
+from subsonic import get_song_cache as get_subsonic_song_cache
+from subsonic import get_match_cache as get_subsonic_match_cache
+from subsonic import sync_library_index as sync_subsonic_library_index
 from util import print
+from util import get_logger
+import log
+from log import lazy
+
+logger: logging.Logger = get_logger()
 
 key_title: str = "dc:title"
 key_subtitle: str = "dc:subtitle"
@@ -49,21 +74,56 @@ key_artist: str = "upnp:artist"
 key_album: str = "upnp:album"
 key_duration: tuple[str, str] = ["res", "@duration"]
 
-g_previous_song: Song = None
-g_current_song: Song = None
-g_last_scrobbled: Song = None
+# one notify server per local ip, receives the events of all devices reached from that ip
+g_notify_servers: dict[str, AiohttpNotifyServer] = {}
+g_notify_server_lock: asyncio.Lock = asyncio.Lock()
+
+# timeout of SUBSCRIBE/UNSUBSCRIBE requests
+NOTIFY_REQUEST_TIMEOUT_SEC: int = 5
+# wait time of the keep-alive loop when no subscription needs renewal
+IDLE_KEEP_ALIVE_SEC: int = 60
+
+g_renderer_watcher: RendererWatcher = None
+
+g_metrics_runner: web.AppRunner = None
+
+# set when RECORD_EVENTS_FILE is configured
+g_event_recorder: EventRecorder = None
+# set while a service event is handled, on the event loop only
+g_handling_event: bool = False
+
+# parsed track metadata, used from the event loop only
+g_metadata_cache: LruTtlCache = None
+
+g_dispatcher: Dispatcher = Dispatcher(
+    queue_size=config.get_dispatch_queue_size(),
+    worker_count=config.get_dispatch_worker_count())
+
+# long running tasks, referenced until done, the event loop keeps weak references only
+g_background_tasks: set[asyncio.Task] = set()
+
 
-g_items: dict = {}
+def start_background_task(name: str, coro: Coroutine) -> asyncio.Task:
+    task: asyncio.Task = asyncio.create_task(coro, name=name)
+    g_background_tasks.add(task)
+    task.add_done_callback(on_background_task_done)
+    return task
 
-g_event_handler = None
-g_player_state: PlayerState = PlayerState.UNKNOWN
+
+def on_background_task_done(task: asyncio.Task):
+    g_background_tasks.discard(task)
+    if task.cancelled():
+        return
+    ex: BaseException = task.exception()
+    if ex is not None:
+        logger.error("Background task [%s] failed due to [%s] [%s]", task.get_name(), type(ex), ex)
 
 
 async def create_device(description_url: str) -> UpnpDevice:
     """Create UpnpDevice."""
     timeout: int = 60
     non_strict: bool = True
-    requester: UpnpRequester = AiohttpRequester(timeout)
+    requester: UpnpRequester = upnp_session.get_requester(timeout)
     factory: UpnpFactory = UpnpFactory(requester, non_strict=non_strict)
     return await factory.async_create_device(description_url)
 
@@ -80,312 +140,101 @@ def service_from_device(
     return None
 
 
-def song_to_short_string(song: Song) -> str:
-    if song:
-        return (f"Song [{song.title}] from [{song.album}] by [{song.artist}] "
-                f"TrackUri avail [{song.track_uri is not None}] "
-                f"AvTransportUri avail [{song.av_transport_uri is not None}]")
-    else:
-        return "<NO_DATA>"
+def get_dispatcher(state: DeviceState) -> Dispatcher:
+    return state.dispatcher if state.dispatcher else g_dispatcher
 
 
-def song_to_string(song: Song) -> str:
-    if song:
-        return (f"Song [{song.title}] from [{song.album}] by [{song.artist}] "
-                f"Duration [{song.duration}] "
-                f"PlaybackStart [{song.playback_start}] "
-                f"Subtitle [{song.subtitle}] "
-                f"TrackUri [{song.track_uri}] "
-                f"AvTransportUri [{song.av_transport_uri}]")
-    else:
-        return "<NO_DATA>"
-
-
-def maybe_scrobble(current_song: Song) -> bool:
-    global g_last_scrobbled
-    if g_last_scrobbled and same_song(current_song, g_last_scrobbled):
+def maybe_scrobble(state: DeviceState, current_song: Song) -> bool:
+    metrics.g_scrobbles_armed.inc(state.name)
+    if state.last_scrobbled and same_song(current_song, state.last_scrobbled):
         # too close in time?
-        delta: float = current_song.playback_start - g_last_scrobbled.playback_start
+        delta: float = current_song.playback_start - state.last_scrobbled.playback_start
+        if delta == 0:
+            # e.g. scrobbled at the scrobble point by the position tracker, now the track changed
+            logger.debug("[%s] Song already scrobbled, not scrobbling", state.name)
+            metrics.g_scrobbles_rejected.inc(state.name, "minimum_delta")
+            return False
         if delta < config.get_minimum_delta():
-            print("Requesting a new scrobble for the same song again too early, not scrobbling")
+            print(f"[{state.name}] Requesting a new scrobble for the same song again too early, not scrobbling")
+            metrics.g_scrobbles_rejected.inc(state.name, "minimum_delta")
             return False
-    if execute_scrobble(current_song):
-        g_last_scrobbled = copy_song(current_song)
+    played_sec: float = state.position_tracker.played_sec(current_song) if state.position_tracker else None
+    if state.position_tracker and played_sec is None:
+        # e.g. a track change before the first poll of the song
+        logger.info("[%s] Position of [%s] not polled yet, using the time since the song was first seen",
+                    state.name, lazy(song_to_short_string, current_song))
+        metrics.g_position_fallbacks.inc(state.name)
+    if execute_scrobble(
+            current_song,
+            device_name=state.name,
+            played_sec=played_sec,
+            now=state.clock(),
+            dispatcher=get_dispatcher(state),
+            queue=state.scrobble_queue):
+        state.last_scrobbled = copy_song(current_song)
         return True
     return False
 
 
-def execute_scrobble(current_song: Song) -> bool:
-    now: float = time.time()
+def execute_scrobble(
+        current_song: Song,
+        device_name: str = None,
+        played_sec: float = None,
+        now: float = None,
+        dispatcher: Dispatcher = None,
+        queue: ScrobbleQueue = None) -> bool:
+    """Queue the song for the providers and dispatch the attempt, if played long enough.
+
+    played_sec is the time actually played when the position is tracked,
+    otherwise the time since the song was first seen is used.
+    now, dispatcher and queue default to the wall clock, the shared dispatcher and the shared queue.
+    """
+    now = now if now is not None else time.time()
+    dispatcher = dispatcher if dispatcher else g_dispatcher
     # if we have no duration, we assume 4 m, so we scrobble at 2 minutes
     song_duration: float = current_song.duration if current_song.duration else float(120)
     duration_estimated: bool = current_song.duration is None
-    elapsed: float = now - current_song.playback_start
+    elapsed: float = played_sec if played_sec is not None else now - current_song.playback_start
     over_threshold: bool = elapsed >= config.get_duration_threshold()
     over_half: bool = elapsed >= (song_duration / 2.0)
-    print(f"execute_scrobble for "
-          f"[{song_to_short_string(current_song)}] "
-          f"duration [{song_duration}] "
-          # f"now [{now}] "
-          # f"playback_start [{current_song.playback_start}] -> "
-          f"elapsed [{elapsed}] "
-          f"over_threshold [{over_threshold}] over_half [{over_half}]")
+    logger.debug("execute_scrobble for [%s] duration [%s] elapsed [%s] over_threshold [%s] over_half [%s]",
+                 lazy(song_to_short_string, current_song), song_duration, elapsed, over_threshold, over_half)
     if over_threshold or over_half:
-        print(f"execute_scrobble we can scrobble [{song_to_short_string(current_song)}] "
-              f"elapsed [{elapsed:.2f}] "
-              f"duration [{song_duration:.2f}] "
-              f"threshold [{config.get_duration_threshold()}] "
-              f"over_threshold [{over_threshold}] "
-              f"over_half [{over_half}]")
-        scrobble_provider_count: int = 0
-        if config.is_last_fm_configured():
-            last_fm_scrobble(
-                current_song=current_song)
-            scrobble_provider_count += 1
-        else:
-            print("execute_scrobble not scrobbling to LAST.fm because it is not configured")
-        ss_cnt: int = subsonic_scrobble(
-            current_song=current_song,
-            submission=True)
-        scrobble_provider_count += ss_cnt
-        print(f"Scrobble success (provider count=[{scrobble_provider_count}]) "
-              f"for [{song_to_short_string(current_song)}]")
+        logger.info("execute_scrobble we can scrobble [%s] elapsed [%.2f] duration [%.2f] threshold [%s] "
+                    "over_threshold [%s] over_half [%s]",
+                    lazy(song_to_short_string, current_song),
+                    elapsed,
+                    song_duration,
+                    config.get_duration_threshold(),
+                    over_threshold,
+                    over_half)
+        scrobbled_song: Song = copy_song(current_song)
+        timestamp: int = int(now)
+        metrics.g_scrobbles_executed.inc(device_name)
+        # the queue write and the provider calls are blocking, so they run on the dispatcher
+        # the job writes the scrobble to the durable queue before any provider call
+        if not dispatcher.submit("scrobble", queue_and_scrobble, scrobbled_song, timestamp, queue):
+            logger.info("execute_scrobble dispatcher is full, [%s] left to the queue flush",
+                        lazy(song_to_short_string, current_song))
+            # still written to the queue, off the event loop, without waiting for a worker
+            dispatcher.submit_unbounded("defer_scrobble", defer_scrobble, scrobbled_song, timestamp, queue)
+            metrics.g_scrobbles_deferred.inc(device_name)
         return True
     else:
-        print(f"execute_scrobble cannot scrobble [{current_song.title}] "
-              f"from [{current_song.album}] "
-              f"by [{current_song.artist}], "
-              f"elapsed: [{elapsed:.2f}] "
-              f"duration: [{song_duration:.2f}] "
-              f"estimated [{duration_estimated}] "
-              f"over_threshold [{over_threshold}] "
-              f"over_half [{over_half}]")
+        logger.info("execute_scrobble cannot scrobble [%s] from [%s] by [%s], elapsed: [%.2f] duration: [%.2f] "
+                    "estimated [%s] over_threshold [%s] over_half [%s]",
+                    current_song.title,
+                    current_song.album,
+                    current_song.artist,
+                    elapsed,
+                    song_duration,
+                    duration_estimated,
+                    over_threshold,
+                    over_half)
+        metrics.g_scrobbles_rejected.inc(device_name, "threshold")
         return False
 
 
-def create_last_fm_network() -> pylast.LastFMNetwork:
-    if not config.is_last_fm_configured():
-        print("create_last_fm_network LAST.fm is not configured")
-        return None
-    last_fm_key: str = os.getenv("LAST_FM_API_KEY")
-    last_fm_secret: str = os.getenv("LAST_FM_SHARED_SECRET")
-    last_fm_username: str = os.getenv("LAST_FM_USERNAME")
-    last_fm_password_hash: str = os.getenv("LAST_FM_PASSWORD_HASH")
-    last_fm_password: str = os.getenv("LAST_FM_PASSWORD")
-    if last_fm_key and last_fm_secret and last_fm_username and (last_fm_password_hash or last_fm_password):
-        return create_last_fm_network_legacy(
-            last_fm_key=last_fm_key,
-            last_fm_secret=last_fm_secret,
-            last_fm_username=last_fm_username,
-            last_fm_password_hash=last_fm_password_hash,
-            last_fm_password=last_fm_password)
-    elif last_fm_key and last_fm_secret:
-        # create a new or use existing session key.
-        return create_last_fm_network_session_key(
-            last_fm_key=last_fm_key,
-            last_fm_secret=last_fm_secret)
-    else:
-        # cannot enable last.fm
-        # should be allowed only if last.fm is disabled
-        return None
-
-
-def get_last_fm_session_key_file_name() -> str:
-    return os.path.join(
-        config.get_app_config_dir(),
-        constants.Constants.LAST_FM_CONFIG_DIR_NAME.value,
-        constants.Constants.LAST_FM_SESSION_KEY.value)
-
-
-def create_last_fm_network_session_key(
-        last_fm_key: str,
-        last_fm_secret: str) -> pylast.LastFMNetwork:
-    session_key_dir = os.path.join(
-        config.get_app_config_dir(),
-        constants.Constants.LAST_FM_CONFIG_DIR_NAME.value)
-    os.makedirs(name=session_key_dir, exist_ok=True)
-    session_key_file_name = get_last_fm_session_key_file_name()
-    network: pylast.LastFMNetwork = pylast.LastFMNetwork(last_fm_key, last_fm_secret)
-    # TODO can we allow to dump key and secret?
-    # print(f"Last.FM key [{last_fm_key}] secret [{last_fm_secret}]")
-    session_key_file_exists: bool = os.path.exists(session_key_file_name)
-    # can we validate the LAST.fm connection?
-    if not session_key_file_exists:
-        print(f"LAST.fm session file does not exist at path [{session_key_file_name}]")
-        skg: pylast.SessionKeyGenerator = pylast.SessionKeyGenerator(network)
-        url = skg.get_web_auth_url()
-        print(f"Please authorize this script to access your account: {url}\n")
-        webbrowser.open(url)
-        while True:
-            try:
-                session_key = skg.get_web_auth_session_key(url)
-                with open(session_key_file_name, "w") as f:
-                    print(f"Saving LAST.fm session file at path [{session_key_file_name}]")
-                    f.write(session_key)
-                break
-            except pylast.WSError as ex:
-                if int(ex.get_id()) == 14:
-                    # dump the unexpected error
-                    # print(f"LAST.fm authorization failed [{type(ex)}] [{ex.get_id()}] [{ex}]")
-                    # keep going!
-                    pass
-                else:
-                    print(f"LAST.fm authorization failed [{type(ex)}] id [{ex.get_id()}] [{ex}]")
-                time.sleep(1)
-            except Exception as genericEx:
-                print(f"LAST.fm authorization failed (generic exception) [{type(genericEx)}] [{genericEx}]")
-                time.sleep(1)
-    else:
-        session_key = open(session_key_file_name).read()
-    network.session_key = session_key
-    return network
-
-
-def create_last_fm_network_legacy(
-        last_fm_key: str,
-        last_fm_secret: str,
-        last_fm_username: str,
-        last_fm_password_hash: str = None,
-        last_fm_password: str = None) -> pylast.LastFMNetwork:
-    if not last_fm_password_hash and not last_fm_password:
-        raise Exception("One between last_fm_password_hash and last_fm_password must be provided")
-    if not last_fm_password_hash:
-        # try cleartext, not recommended
-        last_fm_password_hash = pylast.md5(last_fm_password)
-    network: pylast.LastFMNetwork = pylast.LastFMNetwork(
-        api_key=last_fm_key,
-        api_secret=last_fm_secret,
-        username=last_fm_username,
-        password_hash=last_fm_password_hash)
-    return network
-
-
-def do_update_now_playing(current_song: Song):
-    if config.is_last_fm_configured():
-        last_fm_now_playing(current_song)
-    else:
-        print("do_update_now_playing not updating now playing on LAST.fm because it not configured")
-    subsonic_scrobble(
-        current_song=current_song,
-        submission=False)
-
-
-def last_fm_now_playing(current_song: Song):
-    if not config.is_last_fm_configured():
-        print("last_fm_now_playing cannot update now playing on LAST.fm because it is not configured")
-        return
-    network: pylast.LastFMNetwork = create_last_fm_network()
-    artist: str = get_first_artist(current_song.artist)
-    duration: int = int(current_song.duration) if current_song.duration else None
-    print(f"last_fm_now_playing for [{current_song.title}] "
-          f"from [{current_song.album}] "
-          f"by [{artist}] "
-          f"[{duration}] sec ...")
-    network.update_now_playing(
-        artist=artist,
-        title=current_song.title,
-        album=current_song.album,
-        duration=duration)
-
-
-def last_fm_scrobble(current_song: Song):
-    if not config.is_last_fm_configured():
-        print("last_fm_scrobble: cannot scrobble because LAST.fm is not configured")
-        return
-    network: pylast.LastFMNetwork = create_last_fm_network()
-    unix_timestamp: int = int(time.mktime(datetime.datetime.now().timetuple()))
-    artist: str = get_first_artist(current_song.artist)
-    duration: int = int(current_song.duration) if current_song.duration else None
-    print(f"last_fm_scrobble for [{current_song.title}] "
-          f"from [{current_song.album}] "
-          f"by [{artist}] "
-          f"[{duration}] sec ...")
-    network.scrobble(
-        artist=artist,
-        title=current_song.title,
-        album=current_song.album,
-        duration=duration,
-        timestamp=unix_timestamp)
-
-
-def subsonic_scrobble(current_song: Song, submission: bool = True) -> int:
-    if (current_song.av_transport_uri is None and
-            current_song.track_uri is None):
-        print("subsonic_scrobble no uri is available for song.")
-    scrobble_type: str = "submission" if submission else "now playing"
-    ss_cnt: int = 0
-    uri: str = current_song.av_transport_uri if current_song.av_transport_uri else current_song.track_uri
-    subsonic_key: str
-    for subsonic_key in get_subsonic_config_keys():
-        config: ScrobblerSubsonicConfiguration = get_single_subsonic_config(subsonic_key=subsonic_key)
-        # is it a now playing (submission=False)?
-        # if so, now playing must be enabled on the current subsonic server in order to go on
-        if not submission and not config.enable_now_playing:
-            # print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
-            #       f"now playing not enabled, skipping")
-            continue
-        subsonic_song_id: str = get_subsonic_song_id(uri=uri, config=config) if uri else None
-        if not subsonic_song_id:
-            print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
-                  f"cannot get a song_id for uri [{uri}]")
-            # continue
-        # if we have a subsonic song id we try to load that long.
-        subsonic_song: SubsonicSong = (get_subsonic_song_by_id(
-                                       song_id=subsonic_song_id,
-                                       config=config)
-                                       if subsonic_song_id else None)
-        # report if we did not find the song
-        if subsonic_song_id and not subsonic_song:
-            print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
-                  f"cannot get a song for song_id [{subsonic_song_id}] -> "
-                  f"might belong to a different server")
-        # if we have loaded the song we need the title to match, otherwise we reset subsonic_song
-        if subsonic_song:
-            if not subsonic_song.getTitle().lower() == current_song.title.lower():
-                print(f"subsonic_scrobble found song [{subsonic_song.getId()}] on [{subsonic_key}] but "
-                      f"song title [{subsonic_song.getTitle()}] "
-                      f"does not match [{current_song.title}] "
-                      "the song might belong to a different server")
-                subsonic_song = None
-        # if we didn't find the song yet and this is a submission,
-        # we can try and see if the song is available on the server
-        if not subsonic_song and (submission and config.allow_match):
-            # find_subsonic_song executes all matching
-            print(f"subsonic_scrobble [{scrobble_type}] on [{subsonic_key}] -> no song_id, trying to match song ...")
-            subsonic_song = find_subsonic_song(
-                config=config,
-                song_title=current_song.title,
-                song_artist=current_song.artist,
-                song_album=current_song.album)
-            print(f"subsonic_scrobble [{scrobble_type}] on [{subsonic_key}] -> matched [{subsonic_song is not None}]")
-        if subsonic_song:
-            # we have a match somehow, so let's go for the scrobble.
-            print(f"subsonic_scrobble found match for [{current_song.title}] "
-                  f"from [{current_song.album}] "
-                  f"by [{current_song.artist}] "
-                  f"on [{subsonic_key}] -> "
-                  f"song_id [{subsonic_song.getId()}]")
-            scrobble_subsonic_song(
-                song=subsonic_song,
-                config=config,
-                submission=submission)
-            ss_cnt += 1
-            print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
-                  f"scrobbled song_id [{subsonic_song_id}] "
-                  f"mode [{'Scrobble' if submission else 'Now Playing'}]")
-        # else:
-        #     print(f"subsonic_scrobble subsonic_key [{subsonic_key}] "
-        #           f"found wrong song for [{subsonic_song_id}]: "
-        #           f"title is [{subsonic_song.getTitle()}], should be [{current_song.title}]")
-    return ss_cnt
-
-
-def get_first_artist(artist: str) -> str:
-    if not artist: return None
-    artist_list: list[str] = artist.split(",")
-    return artist_list[0] if artist_list and len(artist_list) > 0 else None
-
-
 def metadata_to_new_current_song(items: dict[str, any], track_uri: str = None) -> Song:
     current_song: Song = Song()
     current_song.title = items[key_title] if key_title in items else None
@@ -400,14 +249,18 @@ def metadata_to_new_current_song(items: dict[str, any], track_uri: str = None) -
     return current_song
 
 
-def on_playing(song: Song):
+def on_playing(song: Song, dispatcher: Dispatcher = None):
     update_now_playing: bool = config.get_enable_now_playing()
     # if song:
     #     song_info: str = (f"[{song.title}] from [{song.album}] "
     #                       f"by [{get_first_artist(song.artist)}]")
     #     print(f"Updating [now playing] [{'enabled' if update_now_playing else 'disabled'}] for song {song_info}")
     if update_now_playing and song:
-        do_update_now_playing(song)
+        # provider calls are blocking, so they run on the dispatcher
+        (dispatcher if dispatcher else g_dispatcher).submit(
+            "now_playing",
+            do_update_now_playing,
+            copy_song(song))
 
 
 def get_in_dict(from_dict: dict[str, any], path: list[str]) -> any:
@@ -422,33 +275,47 @@ def get_in_dict(from_dict: dict[str, any], path: list[str]) -> any:
 
 
 def get_player_state_from_last_change(last_change_data: str) -> str:
-    lcd_dict: dict = xmltodict.parse(last_change_data)
-    transport_state: str = (lcd_dict["Event"]["InstanceID"]["TransportState"]["@val"]
-                            if "Event" in lcd_dict
-                            and "InstanceID" in lcd_dict["Event"]
-                            and "TransportState" in lcd_dict["Event"]["InstanceID"]
-                            and "@val" in lcd_dict["Event"]["InstanceID"]["TransportState"]
-                            else None)
-    return transport_state
+    try:
+        return extract_transport_state(last_change_data)
+    except Exception as ex:
+        print(f"get_player_state_from_last_change parse failed due to [{type(ex)}] [{ex}]")
+        return None
 
 
 def get_items(event_name: str, event_value: any) -> any:
+    if config.get_dump_upnp_data():
+        # the dump needs the whole document
+        return get_all_items(event_name, event_value)
+    p_items: dict[str, any]
+    try:
+        # only the fields read by metadata_to_new_current_song
+        p_items = extract_didl_item(event_value)
+    except Exception as ex:
+        print(f"get_items parse failed due to [{type(ex)}] [{ex}]")
+        return None
+    if p_items is None:
+        msg: str = f"get_items event [{event_name}] -> no data."
+        print(msg)
+        raise Exception(msg)
+    return p_items
+
+
+def get_all_items(event_name: str, event_value: any) -> any:
     item_path: list[str] = ["DIDL-Lite", "item"]
     parsed: dict[str, any]
     try:
         parsed = xmltodict.parse(event_value)
     except Exception as ex:
-        print(f"get_items parse failed due to [{type(ex)}] [{ex}]")
+        print(f"get_all_items parse failed due to [{type(ex)}] [{ex}]")
         return None
     didl_lite = parsed[item_path[0]] if item_path[0] in parsed else dict()
     p_items = didl_lite[item_path[1]] if item_path[1] in didl_lite else None
     if p_items is None:
-        msg: str = f"get_items event [{event_name}] -> no data."
+        msg: str = f"get_all_items event [{event_name}] -> no data."
         print(msg)
         raise Exception(msg)
-    if config.get_dump_upnp_data():
-        # Print the entire mess
-        print(f"get_items event_name [{event_name}] data:[{json.dumps(p_items, indent=4)}]")
+    # Print the entire mess
+    print(f"get_all_items event_name [{event_name}] data:[{json.dumps(p_items, indent=4)}]")
     return p_items
 
 
@@ -467,7 +334,6 @@ def service_variables_by_name(service_variables: Sequence[UpnpStateVariable]) ->
 
 
 def get_new_metadata(sv_dict: dict[str, any]) -> Song:
-    global g_current_song
     has_current_track_meta_data: bool = EventName.CURRENT_TRACK_META_DATA.value in sv_dict
     has_av_transport_uri_meta_data: bool = EventName.AV_TRANSPORT_URI_META_DATA.value in sv_dict
     # get metadata
@@ -476,15 +342,51 @@ def get_new_metadata(sv_dict: dict[str, any]) -> Song:
         metadata_key = EventName.CURRENT_TRACK_META_DATA.value
     elif has_av_transport_uri_meta_data:
         metadata_key = EventName.AV_TRANSPORT_URI_META_DATA.value
-    print(f"get_new_metadata metadata available: [{metadata_key is not None}]")
+    logger.debug("get_new_metadata metadata available: [%s]", metadata_key is not None)
     incoming_metadata: Song = None
     if metadata_key:
-        g_items = get_items(metadata_key, sv_dict[metadata_key])
-        incoming_metadata = metadata_to_new_current_song(g_items) if g_items else None
-        if incoming_metadata is None or incoming_metadata.is_empty():
-            print("get_new_metadata incoming_metadata is missing or empty!")
-            incoming_metadata = None
-        return incoming_metadata if incoming_metadata else None
+        incoming_metadata = get_metadata_song(metadata_key, sv_dict[metadata_key])
+        if incoming_metadata is None:
+            logger.debug("get_new_metadata incoming_metadata is missing or empty!")
+        return incoming_metadata
+
+
+def parse_metadata_song(metadata_key: str, metadata: any) -> Song:
+    items = get_items(metadata_key, metadata)
+    song: Song = metadata_to_new_current_song(items) if items else None
+    return song if song and not song.is_empty() else None
+
+
+def get_metadata_song(metadata_key: str, metadata: any) -> Song:
+    """Song from DIDL-Lite metadata, payloads seen before are not parsed again.
+
+    The cache holds the parsed fields by payload digest, each call returns a new Song.
+    """
+    if config.get_dump_upnp_data() or not isinstance(metadata, str):
+        return parse_metadata_song(metadata_key, metadata)
+    cache: LruTtlCache = get_metadata_cache()
+    key: tuple[str] = (hashlib.sha1(metadata.encode("utf-8")).hexdigest(),)
+    found: bool
+    fields: tuple[str, str, str, str, float]
+    found, fields = cache.get(key)
+    if found:
+        logger.debug("get_metadata_song cache hit, hits [%s] misses [%s]", cache.hits, cache.misses)
+        return song_from_metadata(fields) if fields else None
+    song: Song = parse_metadata_song(metadata_key, metadata)
+    cache.put(key, song_to_metadata(song) if song else None)
+    logger.debug("get_metadata_song cache miss, hits [%s] misses [%s]", cache.hits, cache.misses)
+    return song
+
+
+def get_metadata_cache() -> LruTtlCache:
+    """Cache (payload digest,) -> song_to_metadata fields, None for payloads without metadata."""
+    global g_metadata_cache
+    if g_metadata_cache is None:
+        g_metadata_cache = LruTtlCache(
+            name="metadata",
+            max_size=config.get_metadata_cache_size(),
+            ttl_sec=config.get_metadata_cache_ttl_sec())
+    return g_metadata_cache
 
 
 def display_player_state(state: PlayerState) -> str:
@@ -496,10 +398,10 @@ class Subscription:
     def __init__(
             self,
             service_name: str,
-            handler: Callable[[UpnpService, Sequence[UpnpStateVariable]], None],
+            handler: Callable[[DeviceState, UpnpService, Sequence[UpnpStateVariable]], None],
             enabled: bool = False):
         self.__service_name: str = service_name
-        self.__handler: Callable[[UpnpService, Sequence[UpnpStateVariable]], None] = handler
+        self.__handler: Callable[[DeviceState, UpnpService, Sequence[UpnpStateVariable]], None] = handler
         self.__enabled: bool = enabled
 
     @property
@@ -511,39 +413,40 @@ class Subscription:
         return self.__service_name
 
     @property
-    def handler(self) -> Callable[[UpnpService, Sequence[UpnpStateVariable]], None]:
+    def handler(self) -> Callable[[DeviceState, UpnpService, Sequence[UpnpStateVariable]], None]:
         return self.__handler
 
 
 def on_valid_rendering_control_event(
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_valid_rendering_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_valid_rendering_control_event: Keys in event [%s]",
+                 lazy(list, map(lambda x: x.name, service_variables)))
 
 
 def on_valid_qplay_control_event(
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_valid_qplay_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_valid_qplay_control_event: Keys in event [%s]",
+                 lazy(list, map(lambda x: x.name, service_variables)))
 
 
 def on_valid_connection_manager_control_event(
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_valid_connection_manager_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_valid_connection_manager_control_event: Keys in event [%s]",
+                 lazy(list, map(lambda x: x.name, service_variables)))
 
 
 def get_current_player_state(sv_dict: dict[str, any]) -> PlayerState:
     # first, we try TRANSPORT_STATE
     result: PlayerState = PlayerState.UNKNOWN
     if EventName.TRANSPORT_STATE.value in sv_dict:
-        print(f"get_current_player_state trying to get PlayerState from [{EventName.TRANSPORT_STATE.value}] ...")
+        logger.debug("get_current_player_state trying to get PlayerState from [%s] ...",
+                     EventName.TRANSPORT_STATE.value)
         result = get_player_state_from_transport_state(sv_dict)
     elif EventName.LAST_CHANGE.value in sv_dict:
-        print(f"get_current_player_state trying to get PlayerState from [{EventName.LAST_CHANGE.value}] ...")
+        logger.debug("get_current_player_state trying to get PlayerState from [%s] ...", EventName.LAST_CHANGE.value)
         transport_state: str = get_player_state_from_last_change(sv_dict[EventName.LAST_CHANGE.value])
         if transport_state:
             result = get_player_state(transport_state)
@@ -551,47 +454,31 @@ def get_current_player_state(sv_dict: dict[str, any]) -> PlayerState:
 
 
 def on_valid_avtransport_event(
+        state: DeviceState,
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
-    global g_player_state
-    global g_items
-    global g_current_song
-    global g_previous_song
-    global g_last_scrobbled
     event_id_length: int = 8
     event_id = ''.join(random.choices(string.ascii_letters + string.digits, k=event_id_length))
     sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_valid_avtransport_event [{event_id}] keys [{sv_dict.keys()}]")
-    # ignore some events ...
-    if (EventName.NEXT_AV_TRANSPORT_URI.value in sv_dict.keys() and
-        EventName.NEXT_AV_TRANSPORT_URI_META_DATA.value in sv_dict.keys() and
-            len(sv_dict.keys()) == 2):
-        # print(f"on_valid_avtransport_event keys [{sv_dict.keys()}]")
-        return
-    if (EventName.LAST_CHANGE.value in sv_dict.keys() and len(sv_dict.keys()) == 1):
-        # print(f"on_valid_avtransport_event keys [{sv_dict.keys()}]")
-        return
-    if (EventName.CURRENT_TRACK_DURATION.value in sv_dict.keys() and len(sv_dict.keys()) == 1):
-        # print(f"on_valid_avtransport_event keys [{sv_dict.keys()}] -> "
-        #       f"[{sv_dict[EventName.CURRENT_TRACK_DURATION.value]}] -> "
-        #       f"[{duration_str_to_sec(sv_dict[EventName.CURRENT_TRACK_DURATION.value])}]")
-        # shall we do something with this?
-        return
+    logger.debug("on_valid_avtransport_event [%s] device [%s] keys [%s]", event_id, state.name, lazy(list, sv_dict))
     # preserve previous player state
-    previous_player_state: PlayerState = g_player_state
+    previous_player_state: PlayerState = state.player_state
     # see if we have a new player state
     curr_player_state: PlayerState = get_current_player_state(sv_dict)
     # player_state_changed: bool = curr_player_state != previous_player_state
-    g_player_state = (curr_player_state
-                      if curr_player_state and curr_player_state != PlayerState.UNKNOWN
-                      else g_player_state)
+    state.player_state = (curr_player_state
+                          if curr_player_state and curr_player_state != PlayerState.UNKNOWN
+                          else state.player_state)
     was_playing: bool = previous_player_state == PlayerState.PLAYING
     playback_just_stated: bool = (curr_player_state == PlayerState.PLAYING and
                                   previous_player_state != PlayerState.PLAYING)
-    print(f"on_valid_avtransport_event [{event_id}] Player state [{display_player_state(previous_player_state)}] -> "
-          f"[{display_player_state(g_player_state)}] "
-          f"-> playback just started [{playback_just_stated}], "
-          f"was playing [{was_playing}]")
+    logger.debug("on_valid_avtransport_event [%s] Player state [%s] -> [%s] "
+                 "-> playback just started [%s], was playing [%s]",
+                 event_id,
+                 lazy(display_player_state, previous_player_state),
+                 lazy(display_player_state, state.player_state),
+                 playback_just_stated,
+                 was_playing)
     # get current track uri
     track_uri: str = (sv_dict[EventName.CURRENT_TRACK_URI.value]
                       if EventName.CURRENT_TRACK_URI.value in sv_dict
@@ -600,10 +487,15 @@ def on_valid_avtransport_event(
     av_transport_uri: str = (sv_dict[EventName.AV_TRANSPORT_URI.value]
                              if EventName.AV_TRANSPORT_URI.value in sv_dict
                              else None)
-    print(f"on_valid_avtransport_event [{event_id}] track_uri [{track_uri}] "
-          f"av_transport_uri [{av_transport_uri}]")
+    logger.debug("on_valid_avtransport_event [%s] track_uri [%s] av_transport_uri [%s]",
+                 event_id, track_uri, av_transport_uri)
     # get metadata
     incoming_metadata: Song = get_new_metadata(sv_dict)
+    if incoming_metadata:
+        # first seen now, the song might come from the metadata cache
+        incoming_metadata.playback_start = state.clock()
+    if incoming_metadata is None and curr_player_state in [None, PlayerState.UNKNOWN]:
+        metrics.g_events_ignored.inc(state.name)
     metadata_is_new: bool = False
     todo_update_now_playing: bool = False
     todo_scrobble: bool = False
@@ -614,84 +506,91 @@ def on_valid_avtransport_event(
     if incoming_metadata and av_transport_uri:
         incoming_metadata.av_transport_uri = av_transport_uri
     metadata_is_new = ((incoming_metadata is not None) and
-                       (g_current_song is None or not same_song(g_current_song, incoming_metadata)))
+                       (state.current_song is None or not same_song(state.current_song, incoming_metadata)))
     if incoming_metadata:
-        print(f"on_valid_avtransport_event [{event_id}] incoming_metadata: "
-              f"empty g_current_song: [{g_current_song is None}] "
-              f"track_uri: [{track_uri}] "
-              f"av_transport_uri: [{av_transport_uri}] "
-              f"metadata_is_new: [{metadata_is_new}] -> "
-              f"[{song_to_string(incoming_metadata)}]")
-    is_playing: bool = g_player_state == PlayerState.PLAYING
+        logger.log(
+            logging.INFO if metadata_is_new else logging.DEBUG,
+            "on_valid_avtransport_event [%s] incoming_metadata: empty current_song: [%s] "
+            "track_uri: [%s] av_transport_uri: [%s] metadata_is_new: [%s] -> [%s]",
+            event_id,
+            state.current_song is None,
+            track_uri,
+            av_transport_uri,
+            metadata_is_new,
+            lazy(song_to_string, incoming_metadata))
+    is_playing: bool = state.player_state == PlayerState.PLAYING
     if is_playing:
-        print(f"on_valid_avtransport_event [{event_id}] arming Now Playing "
-              f"because metadata_is_new [{metadata_is_new}] ...")
+        logger.debug("on_valid_avtransport_event [%s] arming Now Playing because metadata_is_new [%s] ...",
+                     event_id, metadata_is_new)
         todo_update_now_playing = True
         song_to_be_notified = (incoming_metadata if incoming_metadata
-                               else g_current_song if g_current_song
-                               else g_previous_song)
+                               else state.current_song if state.current_song
+                               else state.previous_song)
         if song_to_be_notified is None:
-            print(f"on_valid_avtransport_event [{event_id}] WARN we lost track of what is playing...")
+            logger.warning("on_valid_avtransport_event [%s] we lost track of what is playing...", event_id)
     else:
-        print(f"on_valid_avtransport_event [{event_id}] not arming Now Playing because "
-              f"player state is [{g_player_state.value}] (so not playing) ...")
+        logger.debug("on_valid_avtransport_event [%s] not arming Now Playing because "
+                     "player state is [%s] (so not playing) ...", event_id, state.player_state.value)
     # consider arming scrobbling
-    if g_current_song is not None:
-        # we can scrobble the g_current_song
-        print(f"on_valid_avtransport_event [{event_id}] arming Scrobble "
-              f"because g_current_song is not empty [{song_to_string(g_current_song)}] ...")
+    if state.current_song is not None:
+        # we can scrobble the current_song
+        logger.debug("on_valid_avtransport_event [%s] arming Scrobble because current_song is not empty [%s] ...",
+                     event_id, lazy(song_to_string, state.current_song))
         todo_scrobble = True
-        song_to_be_scrobbled = copy_song(g_current_song)
+        song_to_be_scrobbled = copy_song(state.current_song)
     else:
-        print(f"on_valid_avtransport_event [{event_id}] not arming scrobble because g_current_song is empty")
-    # store g_current_song if not the same ...
-    if g_current_song is None or not same_song(g_current_song, incoming_metadata):
+        logger.debug("on_valid_avtransport_event [%s] not arming scrobble because current_song is empty", event_id)
+    # store current_song if not the same ...
+    if state.current_song is None or not same_song(state.current_song, incoming_metadata):
         previous_song: Song = None
         if incoming_metadata:
-            print(f"on_valid_avtransport_event [{event_id}] updating "
-                  f"g_previous_song to [{song_to_short_string(incoming_metadata)}] ...")
-            previous_song = copy_song(g_current_song) if g_current_song else None
-            g_current_song = copy_song(incoming_metadata) if incoming_metadata else None
+            logger.debug("on_valid_avtransport_event [%s] updating previous_song to [%s] ...",
+                         event_id, lazy(song_to_short_string, incoming_metadata))
+            previous_song = copy_song(state.current_song) if state.current_song else None
+            state.current_song = copy_song(incoming_metadata) if incoming_metadata else None
         if previous_song:
-            print(f"on_valid_avtransport_event [{event_id}] setting "
-                  f"g_previous_song to [{song_to_short_string(previous_song)}] ...")
-            # update g_previous_song and g_current_song
-            g_previous_song = copy_song(previous_song)
+            logger.debug("on_valid_avtransport_event [%s] setting previous_song to [%s] ...",
+                         event_id, lazy(song_to_short_string, previous_song))
+            # update previous_song and current_song
+            state.previous_song = copy_song(previous_song)
     # examing states
-    if PlayerState.PLAYING.value == g_player_state.value:
-        if (not todo_scrobble) and (metadata_is_new and incoming_metadata and g_previous_song):
-            print(f"on_valid_avtransport_event [{event_id}] arming scrobble of previous_song "
-                  f"[{song_to_string(g_previous_song)}] "
-                  f"while handling [{PlayerState.PLAYING.value}] ...")
+    if PlayerState.PLAYING.value == state.player_state.value:
+        if (not todo_scrobble) and (metadata_is_new and incoming_metadata and state.previous_song):
+            logger.info("on_valid_avtransport_event [%s] arming scrobble of previous_song [%s] "
+                        "while handling [%s] ...",
+                        event_id, lazy(song_to_string, state.previous_song), PlayerState.PLAYING.value)
             todo_scrobble = True
-            song_to_be_scrobbled = copy_song(g_previous_song)
-    elif PlayerState.STOPPED.value == g_player_state.value:
-        if not todo_scrobble and g_current_song is not None:
+            song_to_be_scrobbled = copy_song(state.previous_song)
+    elif PlayerState.STOPPED.value == state.player_state.value:
+        if not todo_scrobble and state.current_song is not None:
             # as it is now stopped, we can scrobble only if it "was playing"
             if was_playing:
-                print(f"on_valid_avtransport_event [{event_id}] "
-                      f"arming scrobble of current song [{song_to_string(g_current_song)}] "
-                      f"because of the {PlayerState.STOPPED.value} state ...")
+                logger.info("on_valid_avtransport_event [%s] arming scrobble of current song [%s] "
+                            "because of the %s state ...",
+                            event_id, lazy(song_to_string, state.current_song), PlayerState.STOPPED.value)
                 todo_scrobble = True
-                song_to_be_scrobbled = copy_song(g_current_song)
+                song_to_be_scrobbled = copy_song(state.current_song)
+    if state.position_tracker and (metadata_is_new or state.player_state != previous_player_state):
+        # the polling schedule depends on the song and on the player state
+        state.position_tracker.wake()
     # Execute armed actions
     if todo_update_now_playing:
         if song_to_be_notified:
-            on_playing(song=song_to_be_notified)
+            on_playing(song=song_to_be_notified, dispatcher=get_dispatcher(state))
         else:
-            print(f"on_valid_avtransport_event [{event_id}] "
-                  "now playing was armed but song_to_be_notified is not set")
+            logger.warning("on_valid_avtransport_event [%s] now playing was armed but song_to_be_notified is not set",
+                           event_id)
     if todo_scrobble:
-        maybe_scrobble(current_song=song_to_be_scrobbled)
+        maybe_scrobble(state=state, current_song=song_to_be_scrobbled)
 
 
 def on_rendering_control_event(
+        state: DeviceState,
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
     """Handle a UPnP RenderingControl event."""
-    print(f"on_rendering_control_event [{service.service_type}]")
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_rendering_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_rendering_control_event [%s] keys [%s]",
+                 service.service_type, lazy(list, map(lambda x: x.name, service_variables)))
     if config.get_dump_upnp_data():
         print(f"on_rendering_control_event: service_variables=[{service_variables}]")
     if (len(service_variables) == 1 and
@@ -702,12 +601,12 @@ def on_rendering_control_event(
 
 
 def on_qplay_control_event(
+        state: DeviceState,
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
     """Handle a UPnP QPlay event."""
-    print(f"on_qplay_control_event [{service.service_type}]")
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_qplay_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_qplay_control_event [%s] keys [%s]",
+                 service.service_type, lazy(list, map(lambda x: x.name, service_variables)))
     if config.get_dump_upnp_data():
         print(f"on_qplay_control_event: service_variables=[{service_variables}]")
     if (len(service_variables) == 1 and
@@ -718,12 +617,12 @@ def on_qplay_control_event(
 
 
 def on_connection_manager_control_event(
+        state: DeviceState,
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
     """Handle a UPnP QPlay event."""
-    print(f"on_connection_manager_control_event [{service.service_type}]")
-    sv_dict: dict[str, any] = service_variables_by_name(service_variables)
-    print(f"on_connection_manager_control_event: Keys in event [{sv_dict.keys()}]")
+    logger.debug("on_connection_manager_control_event [%s] keys [%s]",
+                 service.service_type, lazy(list, map(lambda x: x.name, service_variables)))
     if config.get_dump_upnp_data():
         print(f"on_connection_manager_control_event: service_variables=[{service_variables}]")
     if (len(service_variables) == 1 and
@@ -734,10 +633,24 @@ def on_connection_manager_control_event(
 
 
 def on_avtransport_event(
+        state: DeviceState,
         service: UpnpService,
         service_variables: Sequence[UpnpStateVariable]) -> None:
     """Handle a UPnP AVTransport event."""
-    print(f"on_avtransport_event [{service.service_type}] len(service_variables)=[{len(service_variables)}]")
+    # special handling for DLNA LastChange state variable, its content comes back as a new event
+    if (len(service_variables) == 1 and
+            service_variables[0].name == EventName.LAST_CHANGE.value):
+        dlna_handle_notify_last_change(service_variables[0])
+    # fast path, before any parsing or logging
+    if state.event_filter.ignores(service_variables):
+        metrics.g_events_filtered.inc(state.name, state.event_filter.profile)
+        return
+    if metrics.g_enabled:
+        metrics.g_events.inc(
+            state.name,
+            service.service_id.rsplit(":", 1)[-1],
+            ",".join(sorted(map(lambda x: x.name, service_variables))))
+    logger.debug("on_avtransport_event [%s] len(service_variables)=[%s]", service.service_type, len(service_variables))
     sv_dict: dict[str, any] = service_variables_by_name(service_variables)
     if config.get_dump_event_keys():
         print(f"on_avtransport_event Keys in event [{sv_dict.keys()}]")
@@ -747,12 +660,28 @@ def on_avtransport_event(
             print(f"Event Key [{event_key}] -> [{sv_dict[event_key]}]")
     if config.get_dump_upnp_data():
         print(f"on_avtransport_event service_variables [{service_variables}]")
-    # special handling for DLNA LastChange state variable
-    if (len(service_variables) == 1 and
-            service_variables[0].name == EventName.LAST_CHANGE.value):
-        last_change = service_variables[0]
-        dlna_handle_notify_last_change(last_change)
-    on_valid_avtransport_event(service, service_variables)
+    on_valid_avtransport_event(state, service, service_variables)
+
+
+def on_service_event(
+        state: DeviceState,
+        handler: Callable[[DeviceState, UpnpService, Sequence[UpnpStateVariable]], None],
+        service: UpnpService,
+        service_variables: Sequence[UpnpStateVariable]) -> None:
+    """Entry point of the events of all services, records them when RECORD_EVENTS_FILE is set.
+
+    A LastChange event comes back here, expanded, while it is handled:
+    only the event sent by the renderer is recorded, the replay expands it again.
+    """
+    global g_handling_event
+    if g_event_recorder and not g_handling_event:
+        g_event_recorder.record(service.device.udn, service.service_type, service_variables)
+    nested: bool = g_handling_event
+    g_handling_event = True
+    try:
+        handler(state, service, service_variables)
+    finally:
+        g_handling_event = nested
 
 
 subscription_list: list[Subscription] = [
@@ -762,11 +691,56 @@ subscription_list: list[Subscription] = [
     Subscription("ConnectionManager", on_connection_manager_control_event)]
 
 
-async def subscribe(description_url: str, subscription_list: list[Subscription]) -> None:
-    """Subscribe to service(s) and output updates."""
-    global g_event_handler  # pylint: disable=global-statement
+async def get_notify_server(device_url: str) -> AiohttpNotifyServer:
+    """The notify server of the local ip which reaches the device, shared by devices, started on first use.
+
+    The callback url is on that ip, so each device is told an address it can reach.
+    """
+    local_ip: str = get_local_ip(device_url)
+    async with g_notify_server_lock:
+        server: AiohttpNotifyServer = g_notify_servers.get(local_ip)
+        if server is None:
+            logger.info("get_notify_server starting notify server on [%s] for [%s]", local_ip, device_url)
+            server = AiohttpNotifyServer(
+                upnp_session.get_requester(NOTIFY_REQUEST_TIMEOUT_SEC),
+                source=(local_ip, 0))
+            await server.async_start_server()
+            g_notify_servers[local_ip] = server
+            logger.info("get_notify_server callback url [%s]", server.callback_url)
+        return server
+
+
+def get_reconnect_backoff() -> Backoff:
+    return Backoff(
+        initial_delay_sec=config.get_reconnect_initial_delay_sec(),
+        max_delay_sec=config.get_reconnect_max_delay_sec())
+
+
+async def unsubscribe(event_handler: UpnpEventHandler, service_list: list[UpnpService]):
+    service: UpnpService
+    for service in service_list:
+        if not event_handler.sid_for_service(service):
+            continue
+        try:
+            await event_handler.async_unsubscribe(service)
+            print(f"unsubscribe: Unsubscribed from service [{service}].")
+        except Exception as ex:
+            # the device might be gone already, the registration is removed anyway
+            print(f"unsubscribe: cannot unsubscribe from [{service}] due to [{type(ex)}] [{ex}]")
+
+
+async def subscribe(
+        state: DeviceState,
+        description_url: str,
+        subscription_list: list[Subscription],
+        watched: WatchedTarget = None) -> None:
+    """Subscribe to service(s) and output updates.
+
+    Raises when the device is lost, returns when the watched device restarted.
+    """
     device = None
     firstException: UpnpConnectionError = None
+    backoff: Backoff = get_reconnect_backoff()
     while device is None:
         try:
             device = await create_device(description_url)
@@ -777,8 +751,12 @@ async def subscribe(description_url: str, subscription_list: list[Subscription])
             if firstException is None:
                 print(f"subscribe exception [{type(ex)}] [{ex}]")
                 firstException = ex
-            time.sleep(5)
-    # start notify server/event handler
+            # an advertisement of the device ends the wait early
+            if await backoff.wait(watched.wait if watched else None):
+                if watched.gone:
+                    raise Exception(f"Device at [{description_url}] is gone")
+                if watched.location and watched.location != description_url:
+                    raise Exception(f"Device moved to [{watched.location}]")
     print(f"Device url [{device.device_url}]")
     print(f"Device type [{device.device_type}]")
     device_info: DeviceInfo = device.device_info
@@ -788,10 +766,13 @@ async def subscribe(description_url: str, subscription_list: list[Subscription])
     print(f"Device Model Name: {device_info.model_name}")
     print(f"Device Model Description: {device_info.model_description}")
     print(f"Available services for device: [{device.services.keys()}]")
-    source = (get_local_ip(device.device_url), 0)
-    print(f"subscribe: source=[{source}]")
-    server = AiohttpNotifyServer(device.requester, source=source)
-    await server.async_start_server()
+    state.name = device_info.friendly_name if device_info.friendly_name else state.name
+    state.event_filter = create_event_filter(
+        manufacturer=device_info.manufacturer,
+        model_name=device_info.model_name)
+    print(f"Event filter profile [{state.event_filter.profile}]")
+    # get the shared notify server/event handler
+    server: AiohttpNotifyServer = await get_notify_server(device.device_url)
     # gather all wanted services
     services = []
     # for service_name in service_names:
@@ -808,90 +789,330 @@ async def subscribe(description_url: str, subscription_list: list[Subscription])
             # sys.exit(1)
             continue
         print(f"subscribe: Got service [{subscription.service_name}] from device.")
-        service.on_event = subscription.handler
+        # events are handled with the state of this device
+        service.on_event = functools.partial(on_service_event, state, subscription.handler)
         services.append(service)
     # subscribe to services
-    g_event_handler = server.event_handler
-    for service in services:
-        print(f"subscribe: Subscribing to service [{service}] ...")
-        try:
-            await g_event_handler.async_subscribe(service)
-            print(f"subscribe: Subscribed to service [{service}].")
-        except UpnpResponseError as ex:
-            print(f"Unable to subscribe to {service}: {ex}")
-    s = 0
-    # keep the webservice running
-    while True:
-        await asyncio.sleep(10)
-        s = s + 1
-        if s >= 12:
-            await g_event_handler.async_resubscribe_all()
-            s = 0
+    event_handler: UpnpEventHandler = server.event_handler
+    scheduler: ResubscribeScheduler = ResubscribeScheduler(
+        event_handler=event_handler,
+        timeout_sec=config.get_subscription_timeout_sec(),
+        renew_percent=config.get_resubscribe_percent())
+    boot_id: str = watched.boot_id if watched else None
+    tracker_task: asyncio.Task = None
+    try:
+        for service in services:
+            print(f"subscribe: Subscribing to service [{service}] ...")
+            try:
+                await scheduler.subscribe(service)
+                print(f"subscribe: Subscribed to service [{service}].")
+            except UpnpResponseError as ex:
+                print(f"Unable to subscribe to {service}: {ex}")
+        if config.get_position_tracking():
+            tracker_task = start_position_tracker(state, device)
+        # keep the webservice running, renewing each subscription when due
+        while True:
+            delay_sec: float = scheduler.next_delay_sec()
+            if delay_sec is None:
+                delay_sec = IDLE_KEEP_ALIVE_SEC
+            if watched:
+                if await watched.wait(delay_sec):
+                    if watched.gone:
+                        raise Exception(f"Device at [{description_url}] is gone")
+                    if watched.location and watched.location != description_url:
+                        raise Exception(f"Device moved to [{watched.location}]")
+                    if boot_id is not None and watched.boot_id != boot_id:
+                        # the renderer lost its subscriptions, and its description might have changed
+                        print(f"subscribe: Device at [{description_url}] restarted, describing it again")
+                        return
+                    boot_id = watched.boot_id
+                    continue
+            else:
+                await asyncio.sleep(delay_sec)
+            await scheduler.renew_due()
+    finally:
+        if tracker_task:
+            tracker_task.cancel()
+            state.position_tracker = None
+        # the notify server outlives this device, drop its subscriptions before reconnecting
+        await unsubscribe(event_handler, scheduler.services)
+
+
+def start_position_tracker(state: DeviceState, device: UpnpDevice) -> asyncio.Task:
+    """Poll the position of the device for the played time of its songs, None if it cannot be polled."""
+    service: UpnpService = service_from_device(device, "AVTransport")
+    if (service is None or
+            not service.has_action(position_tracker.ACTION_GET_TRANSPORT_INFO) or
+            not service.has_action(position_tracker.ACTION_GET_POSITION_INFO)):
+        print(f"start_position_tracker device [{state.name}] cannot be polled, position tracking is disabled")
+        return None
+    state.position_tracker = PositionTracker(
+        name=state.name,
+        service=service,
+        get_current_song=lambda: state.current_song,
+        on_scrobble_point=functools.partial(maybe_scrobble, state),
+        poll_playing_sec=config.get_position_poll_playing_sec(),
+        poll_idle_sec=config.get_position_poll_idle_sec(),
+        clock=state.clock)
+    print(f"start_position_tracker tracking the position of [{state.name}]")
+    return asyncio.create_task(state.position_tracker.run())
+
+
+async def find_device_url(target: DeviceTarget, watched: WatchedTarget, timeout: int) -> str:
+    device_url: str = None
+    if target.device_url:
+        print(f"Using specified device url [{target.device_url}]")
+        device_url = target.device_url
+    if not device_url and watched and watched.location:
+        print(f"Using advertised device url [{watched.location}]")
+        device_url = watched.location
+    if not device_url and target.device_udn:
+        print(f"Trying to find device by udn [{target.device_udn}]")
+        # try known locations first, search only on a miss
+        device_url_list: list[str] = await scanner.get_cached_device_urls(device_udn=target.device_udn)
+        if len(device_url_list) == 0:
+            device_url_list = await scanner.get_device_url_by_udn(
+                device_udn=target.device_udn,
+                timeout=timeout)
+        print(f"Devices for [{target.device_udn}] -> [{device_url_list}]")
+        url_list_len: str = len(device_url_list if device_url_list else [])
+        if url_list_len == 1:
+            # one match
+            device_url = device_url_list[0]
+        else:
+            # missing, or more than one
+            print(f"There are [{url_list_len}] devices matching udn [{target.device_udn}], expecting 1")
+    elif not device_url and target.device_name:
+        print(f"Trying to find device by friendly name [{target.device_name}]")
+        # try known locations first, search only on a miss
+        device_url_list: list[str] = await scanner.get_cached_device_urls(device_name=target.device_name)
+        if len(device_url_list) == 0:
+            device_url_list = await scanner.get_device_url_by_name(
+                device_name=target.device_name,
+                timeout=timeout)
+        print(f"Devices for [{target.device_name}] -> [{device_url_list}]")
+        url_list_len: str = len(device_url_list if device_url_list else [])
+        if url_list_len == 1:
+            # one match
+            device_url = device_url_list[0]
+        else:
+            # missing, or more than one
+            print(f"There are [{url_list_len}] devices matching [{target.device_name}], expecting 1")
+    return device_url
 
 
-async def async_main() -> None:
-    """Async main."""
+async def monitor_device(target: DeviceTarget) -> None:
+    """Find the device, subscribe to its events, reconnect when needed."""
     device_timeout_sec_initial: int = int(os.getenv("DEVICE_TIMEOUT_SEC_INITIAL", "5"))
     device_timeout_sec_delta: int = int(os.getenv("DEVICE_TIMEOUT_SEC_DELTA", "5"))
-    device_timeout_sec_max: int = int(os.getenv("DEVICE_TIMEOUT_SEC_DELTA", "120"))
+    device_timeout_sec_max: int = int(os.getenv("DEVICE_TIMEOUT_SEC_MAX", "60"))
     device_timeout_sec: int = device_timeout_sec_initial
-    cfg_device_url: str = os.getenv("DEVICE_URL")
-    cfg_device_udn: str = os.getenv("DEVICE_UDN")
-    cfg_device_name: str = os.getenv("DEVICE_NAME")
-    if not (cfg_device_url or cfg_device_udn or cfg_device_name):
-        # misconfiguration
-        print("Please specify one among DEVICE_URL, DEVICE_UDN or DEVICE_NAME!")
-        return None
+    state: DeviceState = DeviceState(name=target.label)
+    watched: WatchedTarget = (g_renderer_watcher.watch(
+        device_udn=target.device_udn,
+        device_name=target.device_name)
+        if g_renderer_watcher and g_renderer_watcher.started and not target.device_url
+        else None)
+    backoff: Backoff = get_reconnect_backoff()
     while True:
-        print(f"Current timeout is [{device_timeout_sec}] second(s)")
-        device_url: str = None
-        if cfg_device_url:
-            print(f"Using specified device url [{cfg_device_url}]")
-            device_url = cfg_device_url
-        if not device_url and cfg_device_udn:
-            print(f"Trying to find device by udn [{cfg_device_udn}]")
-            device_url_list: list[str] = await scanner.get_device_url_by_udn(
-                device_udn=cfg_device_udn,
-                timeout=device_timeout_sec)
-            print(f"Devices for [{cfg_device_udn}] -> [{device_url_list}]")
-            url_list_len: str = len(device_url_list if device_url_list else [])
-            if url_list_len == 1:
-                # one match
-                device_url = device_url_list[0]
-            else:
-                # missing, or more than one
-                print(f"There are [{url_list_len}] devices matching udn [{cfg_device_udn}], expecting 1")
-        elif not device_url and cfg_device_name:
-            print(f"Trying to find device by friendly name [{cfg_device_name}]")
-            device_url_list: list[str] = await scanner.get_device_url_by_name(
-                device_name=cfg_device_name,
-                timeout=device_timeout_sec)
-            print(f"Devices for [{cfg_device_name}] -> [{device_url_list}]")
-            url_list_len: str = len(device_url_list if device_url_list else [])
-            if url_list_len == 1:
-                # one match
-                device_url = device_url_list[0]
-            else:
-                # missing, or more than one
-                print(f"There are [{url_list_len}] devices matching [{cfg_device_name}], expecting 1")
+        print(f"[{target.label}] Current timeout is [{device_timeout_sec}] second(s)")
+        device_url: str = await find_device_url(
+            target=target,
+            watched=watched,
+            timeout=device_timeout_sec)
         # did we get the device_url?
         if not device_url:
             # raise Exception("We need a DEVICE_URL!")
             if device_timeout_sec < device_timeout_sec_max:
                 device_timeout_sec += device_timeout_sec_delta
-            print("Device not found, retrying ...")
+            if watched:
+                # no need to search again until the device advertises itself
+                print(f"Device [{target.label}] not found, waiting for it to show up ...")
+                await watched.wait(config.get_ssdp_search_interval_sec())
+            else:
+                print(f"Device [{target.label}] not found, retrying ...")
+                await backoff.wait()
         if device_url:
             device_timeout_sec = device_timeout_sec_initial
             print(f"Selected device with URL [{device_url}] ...")
+            subscribed_at: float = time.monotonic()
             try:
                 await subscribe(
+                    state=state,
                     description_url=device_url,
-                    subscription_list=subscription_list)
+                    subscription_list=subscription_list,
+                    watched=watched)
+                # the device restarted, describe it and subscribe again right away
+                continue
             except Exception as ex:
-                print(f"An error occurred [{type(ex)}] [{ex}], retrying ...")
+                print(f"[{state.name}] An error occurred [{type(ex)}] [{ex}], retrying ...")
+            if watched and watched.location and watched.location != device_url:
+                # the device moved, reconnect right away
+                continue
+            if time.monotonic() - subscribed_at > config.get_reconnect_max_delay_sec():
+                # the device has been connected for a while, this is a new failure
+                backoff.reset()
+            await backoff.wait(watched.wait if watched else None)
+
+
+async def monitor_all_devices() -> None:
+    """Monitor every renderer, as it is advertised or found by a periodic search."""
+    monitored_udn_set: set[str] = set()
+
+    def start_monitor(udn: str):
+        if udn.lower() in monitored_udn_set:
+            return
+        print(f"monitor_all_devices start monitoring [{udn}]")
+        monitored_udn_set.add(udn.lower())
+        task: asyncio.Task = start_background_task(
+            f"monitor_device {udn}",
+            monitor_device(DeviceTarget(device_udn=udn)))
+        # should the monitor fail, the next discovery of the device starts a new one
+        task.add_done_callback(lambda _: monitored_udn_set.discard(udn.lower()))
+
+    if g_renderer_watcher:
+        g_renderer_watcher.on_renderer = lambda udn, location: start_monitor(udn)
+        udn: str
+        for udn in g_renderer_watcher.renderers.keys():
+            start_monitor(udn)
+    while True:
+        discoveries = await scanner.discover(timeout=int(os.getenv("DEVICE_TIMEOUT_SEC_INITIAL", "5")))
+        location: str
+        device: UpnpDevice
+        for location, device in await scanner.describe_devices(discoveries):
+            start_monitor(device.udn)
+        await asyncio.sleep(config.get_ssdp_search_interval_sec())
+
+
+def get_device_targets() -> list[DeviceTarget]:
+    device_list: list[str] = config.get_device_list()
+    if len(device_list) > 0:
+        return list(map(parse_device_target, device_list))
+    cfg_device_url: str = os.getenv("DEVICE_URL")
+    cfg_device_udn: str = os.getenv("DEVICE_UDN")
+    cfg_device_name: str = os.getenv("DEVICE_NAME")
+    if not (cfg_device_url or cfg_device_udn or cfg_device_name):
+        return []
+    return [DeviceTarget(
+        device_url=cfg_device_url,
+        device_udn=cfg_device_udn,
+        device_name=cfg_device_name)]
+
+
+async def watch_subsonic_config(interval_sec: int) -> None:
+    """Reload subsonic configuration files when they change, close idle connections."""
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            if await asyncio.to_thread(get_subsonic_config_registry().refresh):
+                print(f"Subsonic configuration reloaded, keys [{get_subsonic_config_keys()}]")
+            # release connections to servers we did not talk to in a while
+            await asyncio.to_thread(get_subsonic_connector_pool().close_idle)
+        except Exception as ex:
+            print(f"watch_subsonic_config refresh failed due to [{type(ex)}] [{ex}]")
+
+
+async def sync_subsonic_libraries(interval_sec: int) -> None:
+    """Keep the local library index of subsonic servers up to date, when enabled."""
+    while True:
+        subsonic_key: str
+        for subsonic_key in get_subsonic_config_keys():
+            subsonic_config: ScrobblerSubsonicConfiguration = get_single_subsonic_config(subsonic_key)
+            if not subsonic_config or not subsonic_config.enable_library_index:
+                continue
+            try:
+                await asyncio.to_thread(sync_subsonic_library_index, subsonic_config)
+            except Exception as ex:
+                print(f"sync_subsonic_libraries [{subsonic_key}] failed due to [{type(ex)}] [{ex}]")
+        await asyncio.sleep(interval_sec)
+
+
+async def periodic_flush_scrobble_queue(interval_sec: int) -> None:
+    """Retry scrobbles which could not be submitted, e.g. while a provider was offline."""
+    while True:
+        try:
+            await asyncio.to_thread(flush_scrobble_queue)
+        except Exception as ex:
+            print(f"periodic_flush_scrobble_queue failed due to [{type(ex)}] [{ex}]")
+        await asyncio.sleep(interval_sec)
+
+
+async def periodic_flush_event_recorder(interval_sec: int) -> None:
+    """Write the recorded events off the event loop."""
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            await asyncio.to_thread(g_event_recorder.flush)
+        except Exception as ex:
+            print(f"periodic_flush_event_recorder failed due to [{type(ex)}] [{ex}]")
+
+
+def save_caches() -> None:
+    get_subsonic_song_cache().save()
+    get_subsonic_match_cache().save()
+
+
+async def periodic_save_caches(interval_sec: int) -> None:
+    """Write caches to disk so that a restart starts with warm caches."""
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            await asyncio.to_thread(save_caches)
+        except Exception as ex:
+            print(f"periodic_save_caches failed due to [{type(ex)}] [{ex}]")
+
+
+async def async_main() -> None:
+    """Async main."""
+    monitor_all: bool = config.get_monitor_all_devices()
+    target_list: list[DeviceTarget] = get_device_targets() if not monitor_all else []
+    if not monitor_all and len(target_list) == 0:
+        # misconfiguration
+        print("Please specify one among DEVICE_URL, DEVICE_UDN, DEVICE_NAME or DEVICE_LIST!")
+        return None
+    await g_dispatcher.start()
+    global g_renderer_watcher
+    global g_metrics_runner
+    global g_event_recorder
+    metrics_port: int = config.get_metrics_port()
+    if metrics_port > 0:
+        g_metrics_runner = await metrics.start_metrics_server(host=config.get_metrics_host(), port=metrics_port)
+    record_events_file: str = config.get_record_events_file()
+    if record_events_file:
+        g_event_recorder = EventRecorder(
+            file_name=record_events_file,
+            max_bytes=config.get_record_events_max_bytes(),
+            backup_count=config.get_record_events_backup_count())
+        print(f"Recording events to [{record_events_file}]")
+        start_background_task(
+            "periodic_flush_event_recorder",
+            periodic_flush_event_recorder(config.get_record_events_flush_interval_sec()))
+    if config.get_enable_ssdp_listener():
+        # follows devices through SSDP advertisements, keeps the discovery cache up to date
+        g_renderer_watcher = RendererWatcher()
+        await g_renderer_watcher.start()
+    subsonic_config_refresh_interval_sec: int = config.get_subsonic_config_refresh_interval_sec()
+    if subsonic_config_refresh_interval_sec > 0:
+        start_background_task("watch_subsonic_config", watch_subsonic_config(subsonic_config_refresh_interval_sec))
+    start_background_task(
+        "sync_subsonic_libraries",
+        sync_subsonic_libraries(config.get_subsonic_library_refresh_interval_sec()))
+    flush_interval_sec: int = config.get_scrobble_queue_flush_interval_sec()
+    last_fm_batch_window_sec: int = config.get_last_fm_batch_window_sec()
+    if last_fm_batch_window_sec > 0:
+        # batched LAST.fm scrobbles must not wait much longer than the batch window
+        flush_interval_sec = min(flush_interval_sec, last_fm_batch_window_sec)
+    start_background_task("periodic_flush_scrobble_queue", periodic_flush_scrobble_queue(flush_interval_sec))
+    if config.get_persist_caches():
+        start_background_task("periodic_save_caches", periodic_save_caches(config.get_cache_save_interval_sec()))
+    if monitor_all:
+        await monitor_all_devices()
+    else:
+        await asyncio.gather(*map(monitor_device, target_list))
 
 
 def main() -> None:
+    log.setup_logging()
     last_fm_config_dir: str = config.get_lastfm_config_dir()
     if os.path.exists(os.path.join(last_fm_config_dir, constants.Constants.LAST_FM_CONFIG.value)):
         config.load_env_file(os.path.join(last_fm_config_dir, constants.Constants.LAST_FM_CONFIG.value))
@@ -906,7 +1127,11 @@ def main() -> None:
     print(f"Subsonic is configured: [{config.is_subsonic_configured()}]")
     # early initialization of last.fm network
     if config.is_last_fm_configured():
-        create_last_fm_network()
+        # the only place where the user is asked to authorize, if there is no session key yet
+        try:
+            last_fm.get_last_fm_network(interactive=True)
+        except Exception as ex:
+            print(f"LAST.fm is not available due to [{type(ex)}] [{ex}], scrobbles are kept in the queue")
     else:
         print("LAST.fm is not configured.")
     host_ip: str = get_ip()
@@ -914,15 +1139,31 @@ def main() -> None:
     print(f"Now Playing enabled: [{config.get_enable_now_playing()}]")
     print(f"Dump UPnP Data: [{config.get_dump_upnp_data()}]")
     print(f"Dump UPnP Event Key/Values: [{config.get_dump_event_key_values()}]")
+    print(f"Dispatcher queue size: [{config.get_dispatch_queue_size()}] "
+          f"workers: [{config.get_dispatch_worker_count()}]")
+    # opened here, not lazily on the event loop by the first scrobble
+    print(f"Scrobble queue pending: [{get_scrobble_queue().count()}]")
     """Set up async loop and run the main program."""
     loop = asyncio.get_event_loop()
     try:
         loop.run_until_complete(async_main())
     except KeyboardInterrupt:
-        if g_event_handler:
-            loop.run_until_complete(g_event_handler.async_unsubscribe_all())
+        server: AiohttpNotifyServer
+        for server in g_notify_servers.values():
+            loop.run_until_complete(server.event_handler.async_unsubscribe_all())
+            loop.run_until_complete(server.async_stop_server())
+        loop.run_until_complete(upnp_session.close_upnp_session())
+        if g_renderer_watcher:
+            loop.run_until_complete(g_renderer_watcher.stop())
+        if g_metrics_runner:
+            loop.run_until_complete(g_metrics_runner.cleanup())
+        loop.run_until_complete(g_dispatcher.stop())
+        if g_event_recorder:
+            g_event_recorder.flush()
+        save_caches()
     finally:
         loop.close()
+        log.stop_logging()
 
 
 if __name__ == "__main__":
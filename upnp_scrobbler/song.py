@@ -103,3 +103,61 @@ def copy_song(song: Song) -> Song:
     copied.track_uri = song.track_uri
     copied.av_transport_uri = song.av_transport_uri
     return copied
+
+
+def song_to_dict(song: Song) -> dict[str, any]:
+    return {
+        "title": song.title,
+        "subtitle": song.subtitle,
+        "artist": song.artist,
+        "album": song.album,
+        "duration": song.duration,
+        "playback_start": song.playback_start,
+        "track_uri": song.track_uri,
+        "av_transport_uri": song.av_transport_uri}
+
+
+def song_from_dict(d: dict[str, any]) -> Song:
+    song: Song = Song()
+    song.title = d.get("title")
+    song.subtitle = d.get("subtitle")
+    song.artist = d.get("artist")
+    song.album = d.get("album")
+    song.duration = d.get("duration")
+    song.playback_start = d.get("playback_start", song.playback_start)
+    song.track_uri = d.get("track_uri")
+    song.av_transport_uri = d.get("av_transport_uri")
+    return song
+
+
+def song_to_short_string(song: Song) -> str:
+    if song:
+        return (f"Song [{song.title}] from [{song.album}] by [{song.artist}] "
+                f"TrackUri avail [{song.track_uri is not None}] "
+                f"AvTransportUri avail [{song.av_transport_uri is not None}]")
+    else:
+        return "<NO_DATA>"
+
+
+def song_to_string(song: Song) -> str:
+    if song:
+        return (f"Song [{song.title}] from [{song.album}] by [{song.artist}] "
+                f"Duration [{song.duration}] "
+                f"PlaybackStart [{song.playback_start}] "
+                f"Subtitle [{song.subtitle}] "
+                f"TrackUri [{song.track_uri}] "
+                f"AvTransportUri [{song.av_transport_uri}]")
+    else:
+        return "<NO_DATA>"
+
+
+def song_to_metadata(song: Song) -> tuple[str, str, str, str, float]:
+    """The fields parsed from DIDL-Lite metadata, as an immutable tuple."""
+    return (song.title, song.subtitle, song.artist, song.album, song.duration)
+
+
+def song_from_metadata(metadata: tuple[str, str, str, str, float]) -> Song:
+    """A new Song from song_to_metadata fields, playback_start is now."""
+    song: Song = Song()
+    song.title, song.subtitle, song.artist, song.album, song.duration = metadata
+    return song
@@ -1,14 +1,19 @@
 import os
+import threading
+from libsonic.errors import DataNotFoundError as SubsonicDataNotFoundError
 import constants
 import config
+from cache import LruTtlCache
 from util import is_true
 from util import joined_words_lower
 from subsonic_connector.song import Song as SubsonicSong
 from subsonic_connector.connector import Connector as SubsonicConnector
 from subsonic_connector.response import Response as SubsonicResponse
 from subsonic_connector.search_result import SearchResult as SubsonicSearchResult
-from subsonic_configuration import SubsonicConnectorConfiguration
 from subsonic_configuration import ScrobblerSubsonicConfiguration
+from subsonic_connector_pool import SubsonicConnectorPool
+from subsonic_library import SubsonicLibraryIndex
+from subsonic_library import get_library_index
 
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
@@ -16,18 +21,174 @@ from util import print
 import dotenv
 
 
+class SubsonicConfigRegistry:
+    """Keeps the subsonic configurations in memory.
+
+    Files are parsed on first use, then again only when refresh() finds
+    that the files of a subsonic_key have changed (mtime or size).
+    """
+
+    def __init__(self):
+        self.__lock: threading.Lock = threading.Lock()
+        self.__config_dict: dict[str, ScrobblerSubsonicConfiguration] = None
+        self.__fingerprint_dict: dict[str, tuple] = {}
+
+    def get_keys(self) -> list[str]:
+        return list(self.__get_config_dict().keys())
+
+    def get(self, subsonic_key: str) -> ScrobblerSubsonicConfiguration:
+        return self.__get_config_dict().get(subsonic_key)
+
+    def invalidate(self):
+        with self.__lock:
+            self.__config_dict = None
+            self.__fingerprint_dict = {}
+
+    def refresh(self) -> bool:
+        """Reload configurations whose files have changed, returns True if anything changed.
+
+        Cached songs and matches, negative ones included, are dropped on a change,
+        as they might not hold for the new configuration.
+        """
+        with self.__lock:
+            loaded: bool = self.__config_dict is not None
+            changed: bool = self.__load()
+        if changed and loaded:
+            clear_subsonic_caches()
+        return changed
+
+    def __get_config_dict(self) -> dict[str, ScrobblerSubsonicConfiguration]:
+        config_dict: dict[str, ScrobblerSubsonicConfiguration] = self.__config_dict
+        if config_dict is not None:
+            return config_dict
+        with self.__lock:
+            if self.__config_dict is None:
+                self.__load()
+            return self.__config_dict
+
+    def __load(self) -> bool:
+        ssf_dict: dict[str, list[str]] = config.find_subsonic_env_files() or {}
+        old_config_dict: dict[str, ScrobblerSubsonicConfiguration] = self.__config_dict or {}
+        config_dict: dict[str, ScrobblerSubsonicConfiguration] = {}
+        fingerprint_dict: dict[str, tuple] = {}
+        changed: bool = self.__config_dict is None or set(ssf_dict.keys()) != set(self.__fingerprint_dict.keys())
+        subsonic_key: str
+        for subsonic_key in sorted(ssf_dict.keys()):
+            fingerprint: tuple = get_files_fingerprint(ssf_dict[subsonic_key])
+            fingerprint_dict[subsonic_key] = fingerprint
+            if (subsonic_key in old_config_dict and
+                    self.__fingerprint_dict.get(subsonic_key) == fingerprint):
+                # unchanged, keep the same instance
+                config_dict[subsonic_key] = old_config_dict[subsonic_key]
+                continue
+            changed = True
+            current: ScrobblerSubsonicConfiguration = load_single_subsonic_config(
+                subsonic_key=subsonic_key,
+                file_list=ssf_dict[subsonic_key])
+            if current:
+                config_dict[subsonic_key] = current
+                print(f"SubsonicConfigRegistry loaded configuration for subsonic_key [{subsonic_key}]")
+            else:
+                print(f"SubsonicConfigRegistry configuration for subsonic_key [{subsonic_key}] is not valid")
+        self.__fingerprint_dict = fingerprint_dict
+        self.__config_dict = config_dict
+        return changed
+
+
+def get_files_fingerprint(file_list: list[str]) -> tuple:
+    result: list[tuple] = []
+    config_dir: str = config.get_subsonic_config_dir()
+    file_name: str
+    for file_name in sorted(file_list):
+        try:
+            st: os.stat_result = os.stat(os.path.join(config_dir, file_name))
+            result.append((file_name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append((file_name, None, None))
+    return tuple(result)
+
+
+g_subsonic_config_registry: SubsonicConfigRegistry = SubsonicConfigRegistry()
+
+g_subsonic_connector_pool: SubsonicConnectorPool = SubsonicConnectorPool(
+    pool_size=config.get_subsonic_pool_size(),
+    idle_timeout_sec=config.get_subsonic_idle_timeout_sec(),
+    request_timeout_sec=config.get_subsonic_request_timeout_sec())
+
+
+def get_subsonic_config_registry() -> SubsonicConfigRegistry:
+    return g_subsonic_config_registry
+
+
+def get_subsonic_connector_pool() -> SubsonicConnectorPool:
+    return g_subsonic_connector_pool
+
+
+def get_connector(config: ScrobblerSubsonicConfiguration) -> SubsonicConnector:
+    return g_subsonic_connector_pool.get(config)
+
+
+g_song_cache: LruTtlCache = None
+g_match_cache: LruTtlCache = None
+g_cache_lock: threading.Lock = threading.Lock()
+
+
+def get_song_cache() -> LruTtlCache:
+    """Cache (subsonic_key, uri) -> SubsonicSong, None when the uri does not resolve on that server."""
+    global g_song_cache
+    with g_cache_lock:
+        if g_song_cache is None:
+            g_song_cache = LruTtlCache(
+                name="subsonic_song",
+                max_size=config.get_subsonic_song_cache_size(),
+                ttl_sec=config.get_subsonic_song_cache_ttl_sec(),
+                negative_ttl_sec=config.get_subsonic_song_cache_negative_ttl_sec(),
+                file_name=config.get_cache_file_name(constants.Constants.SUBSONIC_SONG_CACHE_FILE.value),
+                value_to_json=lambda song: song.getItem().getData(),
+                value_from_json=lambda data: SubsonicSong(data))
+            g_song_cache.load()
+        return g_song_cache
+
+
+def get_match_cache() -> LruTtlCache:
+    """Cache (subsonic_key, title, artist, album) -> SubsonicSong, None when find_song did not match."""
+    global g_match_cache
+    with g_cache_lock:
+        if g_match_cache is None:
+            g_match_cache = LruTtlCache(
+                name="subsonic_match",
+                max_size=config.get_subsonic_match_cache_size(),
+                ttl_sec=config.get_subsonic_match_cache_ttl_sec(),
+                negative_ttl_sec=config.get_subsonic_match_cache_negative_ttl_sec(),
+                file_name=config.get_cache_file_name(constants.Constants.SUBSONIC_MATCH_CACHE_FILE.value),
+                value_to_json=lambda song: song.getItem().getData(),
+                value_from_json=lambda data: SubsonicSong(data))
+            g_match_cache.load()
+        return g_match_cache
+
+
+def clear_subsonic_caches():
+    cache: LruTtlCache
+    for cache in [g_song_cache, g_match_cache]:
+        if cache is not None:
+            cache.clear()
+    print("clear_subsonic_caches subsonic configuration changed, song and match caches cleared")
+
+
 def get_subsonic_config_key_count() -> int:
     return len(get_subsonic_config_keys())
 
 
 def get_subsonic_config_keys() -> list[str]:
-    ssf_dict: dict[str, list[str]] = config.find_subsonic_env_files()
-    return list(ssf_dict.keys()) if ssf_dict else []
+    return g_subsonic_config_registry.get_keys()
 
 
 def get_single_subsonic_config(subsonic_key: str) -> ScrobblerSubsonicConfiguration:
-    ssf_dict: dict[str, list[str]] = config.find_subsonic_env_files()
-    lst: list[str] = ssf_dict[subsonic_key] if subsonic_key in ssf_dict else None
+    return g_subsonic_config_registry.get(subsonic_key)
+
+
+def load_single_subsonic_config(subsonic_key: str, file_list: list[str]) -> ScrobblerSubsonicConfiguration:
+    lst: list[str] = file_list
     if not lst:
         return None
     # build ScrobblerSubsonicConfiguration
@@ -69,6 +230,10 @@ def get_single_subsonic_config(subsonic_key: str) -> ScrobblerSubsonicConfigurat
         v=__cfg_value_or_default_value(
             from_dict=cfg_dict,
             key=constants.ConfigParam.SUBSONIC_ENABLE_SONG_MATCH))
+    enable_library_index: bool = is_true(
+        v=__cfg_value_or_default_value(
+            from_dict=cfg_dict,
+            key=constants.ConfigParam.SUBSONIC_ENABLE_LIBRARY_INDEX))
     return ScrobblerSubsonicConfiguration(
         subsonic_key=subsonic_key,
         base_url=base_url,
@@ -78,7 +243,8 @@ def get_single_subsonic_config(subsonic_key: str) -> ScrobblerSubsonicConfigurat
         server_path=server_path,
         legacy_auth=legacy_auth,
         enable_now_playing=enable_now_playing,
-        allow_match=allow_match)
+        allow_match=allow_match,
+        enable_library_index=enable_library_index)
 
 
 def __cfg_value_or_default_value(from_dict: dict[str, any], key: constants.ConfigParam) -> str:
@@ -92,17 +258,17 @@ def __cfg_value_or_default_value(from_dict: dict[str, any], key: constants.Confi
 def scrobble_song(
         song: SubsonicSong,
         config: ScrobblerSubsonicConfiguration,
-        submission: bool = True):
-    subsonic_config: SubsonicConnectorConfiguration = SubsonicConnectorConfiguration(cfg=config)
-    cn: SubsonicConnector = SubsonicConnector(configuration=subsonic_config)
+        submission: bool = True,
+        listen_time: int = None):
+    cn: SubsonicConnector = get_connector(config)
     cn.scrobble(
         song_id=song.getId(),
-        submission=submission)
+        submission=submission,
+        listenTime=listen_time)
 
 
 def get_song_by_id(song_id: str, config: ScrobblerSubsonicConfiguration) -> SubsonicSong:
-    subsonic_config: SubsonicConnectorConfiguration = SubsonicConnectorConfiguration(cfg=config)
-    cn: SubsonicConnector = SubsonicConnector(configuration=subsonic_config)
+    cn: SubsonicConnector = get_connector(config)
     subsonic_song_res: SubsonicResponse[SubsonicSong] = None
     try:
         subsonic_song_res = cn.getSong(song_id=song_id)
@@ -112,6 +278,32 @@ def get_song_by_id(song_id: str, config: ScrobblerSubsonicConfiguration) -> Subs
     return subsonic_song_res.getObj() if subsonic_song_res and subsonic_song_res.isOk() else None
 
 
+def get_song_by_uri(uri: str, config: ScrobblerSubsonicConfiguration) -> SubsonicSong:
+    """Resolve a track uri to a song on the server, results are cached.
+
+    Only definitive answers are cached (no id in the uri, song not found),
+    connection errors are not and they are raised to the caller.
+    """
+    cache: LruTtlCache = get_song_cache()
+    cache_key: tuple[str, str] = (config.subsonic_key, uri)
+    found, song = cache.get(cache_key)
+    if found:
+        return song
+    song_id: str = get_song_id(uri=uri, config=config)
+    if not song_id:
+        cache.put(cache_key, None)
+        return None
+    cn: SubsonicConnector = get_connector(config)
+    try:
+        subsonic_song_res: SubsonicResponse[SubsonicSong] = cn.getSong(song_id=song_id)
+    except SubsonicDataNotFoundError:
+        cache.put(cache_key, None)
+        return None
+    song = subsonic_song_res.getObj() if subsonic_song_res and subsonic_song_res.isOk() else None
+    cache.put(cache_key, song)
+    return song
+
+
 def get_song_id(uri: str, config: ScrobblerSubsonicConfiguration) -> str | None:
     parsed_url = urlparse(uri)
     host: str = f"{parsed_url.scheme}://{parsed_url.hostname}:{parsed_url.port}"
@@ -243,6 +435,77 @@ def match_song_with_artist(song: SubsonicSong, artist: str) -> bool:
     return False
 
 
+def match_song(
+        config: ScrobblerSubsonicConfiguration,
+        song_title: str,
+        song_artist: str,
+        song_album: str = None) -> SubsonicSong:
+    """Same as find_song, but results (including no match) are cached."""
+    cache: LruTtlCache = get_match_cache()
+    cache_key: tuple[str, str, str, str] = (
+        config.subsonic_key,
+        joined_words_lower(song_title) if song_title else "",
+        joined_words_lower(song_artist) if song_artist else "",
+        joined_words_lower(song_album) if song_album else "")
+    found, song = cache.get(cache_key)
+    if found:
+        return song
+    index: SubsonicLibraryIndex = get_library_index(config.subsonic_key) if config.enable_library_index else None
+    if index and index.ready:
+        # the local index replaces searching on the server
+        song = find_song_in_index(
+            index=index,
+            song_title=song_title,
+            song_artist=song_artist,
+            song_album=song_album)
+    else:
+        song = find_song(
+            config=config,
+            song_title=song_title,
+            song_artist=song_artist,
+            song_album=song_album)
+    if song is None and index and not index.ready:
+        # not found by searching the server, let the index decide once it is synced
+        return song
+    cache.put(cache_key, song)
+    return song
+
+
+def is_matching_song(
+        song: SubsonicSong,
+        match_song_title: str,
+        song_artist: str,
+        cmp_song_album: str = None) -> bool:
+    # must match title
+    match: bool = match_song_title == joined_words_lower(song.getTitle())
+    # must match artist(s)
+    match = match and match_song_with_artist(song, song_artist)
+    # match album if required, cmp_song_album is None only when there is no album
+    # an album normalizing to "" is still compared
+    return match and (cmp_song_album is None or joined_words_lower(song.getAlbum()) == cmp_song_album)
+
+
+def find_song_in_index(
+        index: SubsonicLibraryIndex,
+        song_title: str,
+        song_artist: str,
+        song_album: str = None) -> SubsonicSong:
+    cmp_song_album: str = joined_words_lower(song_album) if song_album else None
+    match_song_title: str = joined_words_lower(song_title)
+    current_song: SubsonicSong
+    for current_song in index.get_candidates(song_title, song_artist):
+        if is_matching_song(current_song, match_song_title, song_artist, cmp_song_album):
+            return current_song
+    return None
+
+
+def sync_library_index(subsonic_config: ScrobblerSubsonicConfiguration):
+    index: SubsonicLibraryIndex = get_library_index(subsonic_config.subsonic_key)
+    index.sync(
+        cn=get_connector(subsonic_config),
+        full_sync_interval_sec=config.get_subsonic_library_full_sync_interval_sec())
+
+
 def find_song(
         config: ScrobblerSubsonicConfiguration,
         song_title: str,
@@ -252,8 +515,7 @@ def find_song(
         next_search_size: int = 50,
         max_search_size: int = 310) -> SubsonicSong:
     cmp_song_album: str = joined_words_lower(song_album) if song_album else None
-    subsonic_config: SubsonicConnectorConfiguration = SubsonicConnectorConfiguration(cfg=config)
-    cn: SubsonicConnector = SubsonicConnector(configuration=subsonic_config)
+    cn: SubsonicConnector = get_connector(config)
     search_counter: int = 0
     match_song_title: str = joined_words_lower(song_title)
     while (search_counter < max_search_size):
@@ -281,12 +543,7 @@ def find_song(
         current_song: SubsonicSong
         for current_song in sr.getSongs():
             search_counter += 1
-            # must match title
-            match: bool = match_song_title == joined_words_lower(current_song.getTitle())
-            # must match artist(s)
-            match = match and match_song_with_artist(current_song, song_artist)
-            # match album if required
-            if match and (not song_album or joined_words_lower(current_song.getAlbum()) == cmp_song_album):
+            if is_matching_song(current_song, match_song_title, song_artist, cmp_song_album):
                 # album match not required, or album matches, so we return this song
                 return current_song
     return None
@@ -13,7 +13,8 @@ class ScrobblerSubsonicConfiguration:
             server_path: str,
             legacy_auth: bool,
             enable_now_playing: bool,
-            allow_match: bool):
+            allow_match: bool,
+            enable_library_index: bool = False):
         self.__subsonic_key: str = subsonic_key
         self.__base_url: str = base_url
         self.__port: int = port
@@ -23,6 +24,7 @@ class ScrobblerSubsonicConfiguration:
         self.__legacy_auth: bool = legacy_auth
         self.__enable_now_playing: bool = enable_now_playing
         self.__allow_match: bool = allow_match
+        self.__enable_library_index: bool = enable_library_index
 
     @property
     def subsonic_key(self) -> str:
@@ -60,6 +62,10 @@ class ScrobblerSubsonicConfiguration:
     def allow_match(self) -> bool:
         return self.__allow_match
 
+    @property
+    def enable_library_index(self) -> bool:
+        return self.__enable_library_index
+
 
 class SubsonicConnectorConfiguration(SubsonicConnectorConfigurationInterface):
 
@@ -0,0 +1,188 @@
+import threading
+import time
+import urllib.error
+import libsonic
+import requests
+
+from requests.adapters import HTTPAdapter
+from subsonic_connector.connector import Connector as SubsonicConnector
+from subsonic_configuration import SubsonicConnectorConfiguration
+from subsonic_configuration import ScrobblerSubsonicConfiguration
+from util import print
+
+
+# The pool hooks into private parts of these versions, pinned in requirements.txt:
+# subsonic-connector 0.3.10 (Connector.__connect, its server path logic) and py-sonic 1.0.3 (Connection._doInfoReq).
+# test/subsonic_connector_pool_test.py fails when an upgrade bypasses the pool or changes the urls.
+CONNECTOR_CONNECT_ATTRIBUTE: str = "_Connector__connect"
+
+
+def get_rest_path(server_path: str) -> str:
+    """Server path as built by subsonic-connector 0.3.10 Connector.__connect."""
+    if server_path and len(server_path) > 0:
+        if not server_path.startswith("/"):
+            server_path = f"/{server_path}"
+        return "/".join([server_path, "rest"])
+    return "/rest"
+
+
+class PooledLibsonicConnection(libsonic.Connection):
+    """libsonic connection sending requests through a shared requests session.
+
+    libsonic builds a new urllib opener for each connection, so every call
+    pays for a new TCP connection (and TLS handshake), the session keeps them alive.
+    Errors are raised as urllib errors, like libsonic does.
+    """
+
+    def __init__(self, session: requests.Session, request_timeout_sec: float, **kwargs):
+        self.__session: requests.Session = session
+        self.__request_timeout_sec: float = request_timeout_sec
+        self.__lock: threading.Lock = threading.Lock()
+        self.__in_flight: int = 0
+        self.__last_used: float = time.monotonic()
+        super().__init__(**kwargs)
+
+    @property
+    def in_flight(self) -> int:
+        with self.__lock:
+            return self.__in_flight
+
+    @property
+    def last_used(self) -> float:
+        with self.__lock:
+            return self.__last_used
+
+    def _doInfoReq(self, req):
+        with self.__lock:
+            self.__in_flight += 1
+        try:
+            res: requests.Response = self.__session.request(
+                method=req.get_method(),
+                url=req.full_url,
+                data=req.data,
+                headers=dict(req.header_items()),
+                timeout=self.__request_timeout_sec)
+        except requests.RequestException as ex:
+            raise urllib.error.URLError(ex) from ex
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+                self.__last_used = time.monotonic()
+        if res.status_code >= 400:
+            raise urllib.error.HTTPError(req.full_url, res.status_code, res.reason, res.headers, None)
+        return res.json()["subsonic-response"]
+
+
+class PooledSubsonicConnector(SubsonicConnector):
+
+    def __init__(self, configuration: SubsonicConnectorConfiguration, connection: PooledLibsonicConnection):
+        if not hasattr(SubsonicConnector, CONNECTOR_CONNECT_ATTRIBUTE):
+            # an upgrade of subsonic-connector would silently bypass the pool
+            raise Exception(f"Unsupported subsonic-connector version, [{CONNECTOR_CONNECT_ATTRIBUTE}] not found")
+        super().__init__(configuration=configuration)
+        self.__connection: PooledLibsonicConnection = connection
+
+    @property
+    def connection(self) -> PooledLibsonicConnection:
+        return self.__connection
+
+    def _Connector__connect(self):
+        # replaces the connection built by the base class for each call
+        return self.__connection
+
+
+class _PoolEntry:
+
+    def __init__(
+            self,
+            config: ScrobblerSubsonicConfiguration,
+            connector: PooledSubsonicConnector,
+            session: requests.Session):
+        self.config: ScrobblerSubsonicConfiguration = config
+        self.connector: PooledSubsonicConnector = connector
+        self.session: requests.Session = session
+        self.last_used: float = time.monotonic()
+
+    def is_idle(self, now: float, idle_timeout_sec: float) -> bool:
+        """Not used for idle_timeout_sec, and no request running on a provider thread."""
+        connection: PooledLibsonicConnection = self.connector.connection
+        if connection.in_flight > 0:
+            return False
+        return (now - max(self.last_used, connection.last_used)) > idle_timeout_sec
+
+
+class SubsonicConnectorPool:
+    """One connector per subsonic_key, with its own keep-alive http session.
+
+    The connector is rebuilt when the configuration instance for the
+    subsonic_key changes, and its session is closed after idle_timeout_sec.
+    """
+
+    def __init__(self, pool_size: int, idle_timeout_sec: float, request_timeout_sec: float):
+        self.__pool_size: int = pool_size
+        self.__idle_timeout_sec: float = idle_timeout_sec
+        self.__request_timeout_sec: float = request_timeout_sec
+        self.__lock: threading.Lock = threading.Lock()
+        self.__entries: dict[str, _PoolEntry] = {}
+
+    def get(self, config: ScrobblerSubsonicConfiguration) -> SubsonicConnector:
+        now: float = time.monotonic()
+        with self.__lock:
+            entry: _PoolEntry = self.__entries.get(config.subsonic_key)
+            if entry and entry.config is not config:
+                print(f"SubsonicConnectorPool configuration for [{config.subsonic_key}] changed, "
+                      "rebuilding connector")
+                entry.session.close()
+                entry = None
+            elif entry and entry.is_idle(now, self.__idle_timeout_sec):
+                entry.session.close()
+                entry = None
+            if not entry:
+                entry = self.__create_entry(config)
+                self.__entries[config.subsonic_key] = entry
+            entry.last_used = now
+            return entry.connector
+
+    def close_idle(self):
+        now: float = time.monotonic()
+        with self.__lock:
+            subsonic_key: str
+            for subsonic_key in list(self.__entries.keys()):
+                entry: _PoolEntry = self.__entries[subsonic_key]
+                if entry.is_idle(now, self.__idle_timeout_sec):
+                    entry.session.close()
+                    del self.__entries[subsonic_key]
+
+    def close(self):
+        with self.__lock:
+            entry: _PoolEntry
+            for entry in self.__entries.values():
+                entry.session.close()
+            self.__entries = {}
+
+    def __create_entry(self, config: ScrobblerSubsonicConfiguration) -> _PoolEntry:
+        connector_config: SubsonicConnectorConfiguration = SubsonicConnectorConfiguration(cfg=config)
+        session: requests.Session = requests.Session()
+        adapter: HTTPAdapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.__pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        connection: PooledLibsonicConnection = PooledLibsonicConnection(
+            session=session,
+            request_timeout_sec=self.__request_timeout_sec,
+            baseUrl=connector_config.getBaseUrl(),
+            username=connector_config.getUserName(),
+            password=connector_config.getPassword(),
+            port=int(connector_config.getPort()),
+            serverPath=get_rest_path(connector_config.getServerPath()),
+            legacyAuth=connector_config.getLegacyAuth(),
+            appName=connector_config.getAppName(),
+            apiVersion=connector_config.getApiVersion(),
+            userAgent=connector_config.getUserAgent())
+        return _PoolEntry(
+            config=config,
+            connector=PooledSubsonicConnector(
+                configuration=connector_config,
+                connection=connection),
+            session=session)
@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+import config
+
+from subsonic_connector.connector import Connector as SubsonicConnector
+from subsonic_connector.song import Song as SubsonicSong
+from subsonic_connector.album import Album as SubsonicAlbum
+from subsonic_connector.album_list import AlbumList as SubsonicAlbumList
+from subsonic_connector.response import Response as SubsonicResponse
+from subsonic_connector.search_result import SearchResult as SubsonicSearchResult
+from util import joined_words_lower
+from util import print
+
+# song fields we keep in the index, enough for matching title, artist(s) and album
+INDEXED_SONG_FIELD_LIST: list[str] = [
+    "id",
+    "title",
+    "artist",
+    "album",
+    "albumId",
+    "displayArtist",
+    "displayAlbumArtist"]
+INDEXED_SONG_LIST_FIELD_LIST: list[str] = [
+    "artists",
+    "albumArtists"]
+
+
+def slim_song_data(data: dict[str, any]) -> dict[str, any]:
+    result: dict[str, any] = {}
+    k: str
+    for k in INDEXED_SONG_FIELD_LIST:
+        if k in data and data[k] is not None:
+            result[k] = data[k]
+    for k in INDEXED_SONG_LIST_FIELD_LIST:
+        v: any = data[k] if k in data else None
+        if isinstance(v, list):
+            result[k] = list(map(
+                lambda x: {"name": x["name"]},
+                filter(lambda x: isinstance(x, dict) and "name" in x, v)))
+    return result
+
+
+def get_song_artist_keys(data: dict[str, any]) -> set[str]:
+    """Normalized artists of a slim song: artist, display artists, artists and album artists."""
+    result: set[str] = set()
+    k: str
+    for k in ["artist", "displayArtist", "displayAlbumArtist"]:
+        if isinstance(data.get(k), str) and data[k]:
+            result.add(joined_words_lower(data[k]))
+    for k in INDEXED_SONG_LIST_FIELD_LIST:
+        entry: dict[str, str]
+        for entry in data.get(k, []):
+            if isinstance(entry["name"], str) and entry["name"]:
+                result.add(joined_words_lower(entry["name"]))
+    return result
+
+
+def get_artist_keys(artist: str) -> set[str]:
+    """Normalized artist, plus its parts when it lists more artists separated by "/" or ","."""
+    result: set[str] = {joined_words_lower(artist)}
+    splitter: str
+    for splitter in ["/", ","]:
+        result.update(map(lambda x: joined_words_lower(x.strip()), artist.split(splitter)))
+    return result
+
+
+class SubsonicLibraryIndex:
+    """Local copy of the songs of a subsonic server, indexed by normalized title and artist.
+
+    Each song is indexed once per artist (artist, display artists, artists and album artists),
+    so a lookup only returns songs with a chance to match, however common the title.
+    A full sync pages through search3 with an empty query, a delta sync
+    walks the newest albums until it finds an album which is already known.
+    """
+
+    def __init__(self, subsonic_key: str, file_name: str, page_size: int):
+        self.__subsonic_key: str = subsonic_key
+        self.__file_name: str = file_name
+        self.__page_size: int = page_size
+        self.__lock: threading.Lock = threading.Lock()
+        self.__songs: dict[str, dict[str, any]] = {}
+        self.__by_title_artist: dict[tuple[str, str], list[str]] = {}
+        self.__album_ids: set[str] = set()
+        self.__last_full_sync: float = None
+        self.__last_sync: float = None
+
+    @property
+    def subsonic_key(self) -> str:
+        return self.__subsonic_key
+
+    @property
+    def ready(self) -> bool:
+        return self.__last_full_sync is not None
+
+    @property
+    def last_full_sync(self) -> float:
+        return self.__last_full_sync
+
+    @property
+    def song_count(self) -> int:
+        return len(self.__songs)
+
+    def get_candidates(self, song_title: str, song_artist: str) -> list[SubsonicSong]:
+        """Songs with the same normalized title and one of the artists of song_artist."""
+        if not song_title or not song_artist:
+            return []
+        title_key: str = joined_words_lower(song_title)
+        id_list: list[str] = []
+        with self.__lock:
+            artist_key: str
+            for artist_key in get_artist_keys(song_artist):
+                song_id: str
+                for song_id in self.__by_title_artist.get((title_key, artist_key), []):
+                    if song_id not in id_list:
+                        id_list.append(song_id)
+            return list(map(lambda x: SubsonicSong(self.__songs[x]), id_list))
+
+    def sync(self, cn: SubsonicConnector, full_sync_interval_sec: float):
+        now: float = time.time()
+        if not self.ready or (now - self.__last_full_sync) >= full_sync_interval_sec:
+            self.full_sync(cn)
+        else:
+            self.delta_sync(cn)
+        self.save()
+
+    def full_sync(self, cn: SubsonicConnector):
+        print(f"SubsonicLibraryIndex [{self.__subsonic_key}] full sync ...")
+        start: float = time.time()
+        songs: dict[str, dict[str, any]] = {}
+        offset: int = 0
+        while True:
+            sr: SubsonicSearchResult = cn.search(
+                query="",
+                artistCount=0,
+                albumCount=0,
+                songCount=self.__page_size,
+                songOffset=offset)
+            page: list[SubsonicSong] = sr.getSongs()
+            if len(page) == 0:
+                break
+            current: SubsonicSong
+            for current in page:
+                songs[current.getId()] = slim_song_data(current.getItem().getData())
+            offset += len(page)
+        with self.__lock:
+            self.__songs = songs
+            self.__rebuild()
+            self.__last_full_sync = start
+            self.__last_sync = start
+        print(f"SubsonicLibraryIndex [{self.__subsonic_key}] full sync completed, "
+              f"[{len(songs)}] songs in [{time.time() - start:.2f}] sec")
+
+    def delta_sync(self, cn: SubsonicConnector):
+        added: int = 0
+        offset: int = 0
+        while True:
+            res: SubsonicResponse[SubsonicAlbumList] = cn.getNewestAlbumList(
+                size=min(self.__page_size, 500),
+                offset=offset)
+            album_list: list[SubsonicAlbum] = res.getObj().getAlbums() if res and res.getObj() else []
+            if len(album_list) == 0:
+                break
+            new_album_list: list[SubsonicAlbum] = list(filter(
+                lambda x: x.getId() not in self.__album_ids,
+                album_list))
+            album: SubsonicAlbum
+            for album in new_album_list:
+                album_res: SubsonicResponse[SubsonicAlbum] = cn.getAlbum(album.getId())
+                if not album_res or not album_res.getObj():
+                    continue
+                song_list: list[SubsonicSong] = album_res.getObj().getSongs()
+                with self.__lock:
+                    current: SubsonicSong
+                    for current in song_list:
+                        self.__add(slim_song_data(current.getItem().getData()))
+                        added += 1
+                    self.__album_ids.add(album.getId())
+            if len(new_album_list) < len(album_list):
+                # we reached albums we already know
+                break
+            offset += len(album_list)
+        self.__last_sync = time.time()
+        if added > 0:
+            print(f"SubsonicLibraryIndex [{self.__subsonic_key}] delta sync added [{added}] songs")
+
+    def load(self):
+        if not self.__file_name or not os.path.exists(self.__file_name):
+            return
+        try:
+            with open(self.__file_name, "r") as f:
+                data: dict[str, any] = json.load(f)
+        except Exception as ex:
+            print(f"SubsonicLibraryIndex [{self.__subsonic_key}] cannot load [{self.__file_name}] "
+                  f"due to [{type(ex)}] [{ex}]")
+            return
+        with self.__lock:
+            self.__songs = dict(map(lambda x: (x["id"], x), data["songs"]))
+            self.__rebuild()
+            self.__last_full_sync = data["last_full_sync"]
+            self.__last_sync = data["last_sync"]
+        print(f"SubsonicLibraryIndex [{self.__subsonic_key}] loaded [{len(self.__songs)}] songs")
+
+    def save(self):
+        if not self.__file_name or not self.ready:
+            return
+        with self.__lock:
+            data: dict[str, any] = {
+                "subsonic_key": self.__subsonic_key,
+                "last_full_sync": self.__last_full_sync,
+                "last_sync": self.__last_sync,
+                "songs": list(self.__songs.values())}
+        tmp_file_name: str = f"{self.__file_name}.tmp"
+        with open(tmp_file_name, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_file_name, self.__file_name)
+
+    def __rebuild(self):
+        self.__by_title_artist = {}
+        self.__album_ids = set()
+        song: dict[str, any]
+        for song in self.__songs.values():
+            self.__index(song)
+
+    def __add(self, song: dict[str, any]):
+        if song["id"] in self.__songs:
+            return
+        self.__songs[song["id"]] = song
+        self.__index(song)
+
+    def __index(self, song: dict[str, any]):
+        title_key: str = joined_words_lower(song["title"]) if "title" in song else ""
+        artist_key: str
+        for artist_key in get_song_artist_keys(song):
+            id_list: list[str] = self.__by_title_artist.get((title_key, artist_key))
+            if id_list is None:
+                id_list = []
+                self.__by_title_artist[(title_key, artist_key)] = id_list
+            id_list.append(song["id"])
+        if "albumId" in song:
+            self.__album_ids.add(song["albumId"])
+
+
+g_library_index_dict: dict[str, SubsonicLibraryIndex] = {}
+g_library_index_lock: threading.Lock = threading.Lock()
+
+
+def get_library_index(subsonic_key: str) -> SubsonicLibraryIndex:
+    with g_library_index_lock:
+        index: SubsonicLibraryIndex = g_library_index_dict.get(subsonic_key)
+        if index is None:
+            index = SubsonicLibraryIndex(
+                subsonic_key=subsonic_key,
+                file_name=os.path.join(config.get_cache_dir(), f"subsonic_library_{subsonic_key}.json"),
+                page_size=config.get_subsonic_library_page_size())
+            index.load()
+            g_library_index_dict[subsonic_key] = index
+        return index
@@ -0,0 +1,47 @@
+import aiohttp
+
+from async_upnp_client.aiohttp import AiohttpSessionRequester
+from async_upnp_client.client import UpnpRequester
+from util import print
+
+
+class UpnpSession:
+    """One keep-alive aiohttp session for all the UPnP traffic of the process.
+
+    AiohttpRequester opens (and closes) a new session for each request,
+    requesters handed out here share the session, one requester per timeout.
+    Used from the event loop only.
+    """
+
+    def __init__(self):
+        self.__session: aiohttp.ClientSession = None
+        self.__requesters: dict[float, UpnpRequester] = {}
+
+    def get_requester(self, timeout: float) -> UpnpRequester:
+        if self.__session is None or self.__session.closed:
+            self.__session = aiohttp.ClientSession()
+            self.__requesters = {}
+        requester: UpnpRequester = self.__requesters.get(timeout)
+        if requester is None:
+            requester = AiohttpSessionRequester(self.__session, timeout=timeout)
+            self.__requesters[timeout] = requester
+        return requester
+
+    async def close(self):
+        if self.__session and not self.__session.closed:
+            print("UpnpSession closing http session")
+            await self.__session.close()
+        self.__session = None
+        self.__requesters = {}
+
+
+g_upnp_session: UpnpSession = UpnpSession()
+
+
+def get_requester(timeout: float) -> UpnpRequester:
+    """A requester on the shared session, must be called from the event loop."""
+    return g_upnp_session.get_requester(float(timeout))
+
+
+async def close_upnp_session():
+    await g_upnp_session.close()
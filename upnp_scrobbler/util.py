@@ -1,13 +1,51 @@
 import datetime
+import logging
 import socket
 import re
-
-
-_print = print
-
-
-def print(*args, **kw):
-    _print("[%s]" % (datetime.datetime.now()), *args, **kw)
+import sys
+
+LOGGER_NAME: str = "upnp-scrobbler"
+
+
+class TimestampFormatter(logging.Formatter):
+    """[timestamp] message, as print used to write, the level is shown when it is not INFO."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message: str = record.getMessage()
+        if record.exc_info:
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        timestamp: datetime.datetime = datetime.datetime.fromtimestamp(record.created)
+        if record.levelno == logging.INFO:
+            return f"[{timestamp}] {message}"
+        return f"[{timestamp}] {record.levelname} {message}"
+
+
+def get_logger() -> logging.Logger:
+    """The application logger, writing to stdout until log.setup_logging configures it."""
+    logger: logging.Logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler: logging.Handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(TimestampFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def print(*args, sep: str = " ", end: str = "\n", file=None, flush: bool = False):
+    """Logs at INFO, kept for the existing call sites, use get_logger() for other levels.
+
+    file=sys.stderr logs at ERROR. Records always end with a newline and are flushed by the handler,
+    so another end or file is rejected, as is any other argument.
+    """
+    if end != "\n":
+        raise ValueError(f"print cannot log with end [{end!r}]")
+    if file is not None and file is not sys.stdout and file is not sys.stderr:
+        raise ValueError(f"print cannot log to file [{file}]")
+    level: int = logging.ERROR if file is sys.stderr else logging.INFO
+    logger: logging.Logger = get_logger()
+    if logger.isEnabledFor(level):
+        logger.log(level, (sep if sep is not None else " ").join(map(str, args)))
 
 
 def duration_str_to_sec(duration: str) -> float: